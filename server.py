@@ -1,11 +1,14 @@
 # coding=utf-8
 import logging
-from quart import Quart
+import asyncio
+from quart import Quart, g
 
 from soundcube.api.web_utilities import with_status
 from soundcube.api._bp_types import StatusType
 
-from soundcube.config import API_ROUTE_PREFIX
+from soundcube.core.zones import ZoneRegistry
+from soundcube.core.exceptions import CommandQueueFull, UnknownZone
+from soundcube.config import API_ROUTE_PREFIX, LIBRARY_SCAN_ON_START
 
 log = logging.getLogger(__name__)
 app = Quart(__name__)
@@ -20,14 +23,68 @@ from soundcube.api.bp_ping import app as bp_ping
 from soundcube.api.bp_player import app as bp_player
 from soundcube.api.bp_queue import app as bp_queue
 from soundcube.api.bp_auth import app as bp_auth
-from soundcube.api.bp_serve import app as bp_serve
+from soundcube.api.bp_serve import app as bp_serve, preload_static
+from soundcube.api.bp_events import app as bp_events
+from soundcube.api.bp_batch import app as bp_batch
+from soundcube.api.bp_library import app as bp_library
+from soundcube.api.bp_stream import app as bp_stream
 
-app.register_blueprint(bp_ping, url_prefix=API_ROUTE_PREFIX)
-app.register_blueprint(bp_queue, url_prefix=API_ROUTE_PREFIX + "/music/queue")
-app.register_blueprint(bp_player, url_prefix=API_ROUTE_PREFIX + "/music/player")
+# Every API blueprint is available for the default zone (e.g. /music/queue/get)
+# and for any zone by its name (e.g. /zones/kitchen/music/queue/get)
+ZONE_PREFIX = "/zones/<zone>"
+for prefix in (API_ROUTE_PREFIX, API_ROUTE_PREFIX + ZONE_PREFIX):
+    app.register_blueprint(bp_ping, url_prefix=prefix)
+    app.register_blueprint(bp_queue, url_prefix=prefix + "/music/queue")
+    app.register_blueprint(bp_player, url_prefix=prefix + "/music/player")
+    app.register_blueprint(bp_events, url_prefix=prefix + "/music")
+    app.register_blueprint(bp_batch, url_prefix=prefix + "/music")
+    app.register_blueprint(bp_library, url_prefix=prefix + "/music/library")
+    app.register_blueprint(bp_stream, url_prefix=prefix + "/music")
 app.register_blueprint(bp_auth, url_prefix=API_ROUTE_PREFIX + "/auth")
 app.register_blueprint(bp_serve)
 
+zones = ZoneRegistry()
+
+
+@app.url_value_preprocessor
+def select_zone(_, values):
+    # Routes get the zone's Player through current_player() (and all zones through current_zones())
+    zone = values.pop("zone", None) if values else None
+    g.zones = zones
+    g.player = zones.default if zone is None else zones.get(zone)
+
+
+@app.before_serving
+async def bind_event_loop():
+    # The server might not run on the loop that existed at import time (e.g. uvloop),
+    # VLC events have to be delivered to the one that is actually serving
+    loop = asyncio.get_event_loop()
+    for player in zones:
+        player.loop = loop
+        player.refresher.start()
+        player.start_persistence()
+        if player.stream_output is not None:
+            player.stream_output.start(loop)
+        if player.sync is not None:
+            await player.sync.start()
+
+    asyncio.ensure_future(preload_static())
+
+    # Shared by all zones
+    if zones.library is not None and LIBRARY_SCAN_ON_START:
+        zones.library.scan()
+
+
+@app.after_serving
+async def save_state():
+    for player in zones:
+        if player.journal is not None:
+            player.journal.close()
+        if player.stream_output is not None:
+            player.stream_output.stop()
+        if player.sync is not None:
+            player.sync.stop()
+
 
 # Global error handlers
 @app.errorhandler(500)
@@ -40,6 +97,19 @@ async def error_500(_):
     return with_status(data, 500, StatusType.INTERNAL_ERROR)
 
 
+@app.errorhandler(UnknownZone)
+async def error_unknown_zone(e):
+    return with_status({"message": str(e)}, 404, StatusType.ERROR)
+
+
+@app.errorhandler(CommandQueueFull)
+async def error_busy(_):
+    # Raised by any route that submits player commands while too many are waiting
+    response = with_status({"message": "Too many requests are waiting, please try again."}, 429, StatusType.BUSY)
+    response.headers["Retry-After"] = "1"
+    return response
+
+
 # Register a handler to append Access-Control-Allow-Origin headers
 @app.after_request
 async def handle_headers(response):
@@ -10,6 +10,8 @@ class StatusType:
     # Error, but non-planned
     INTERNAL_ERROR = "internal_error"
     BAD_REQUEST = "bad_request"
+    # Too many requests are waiting to be processed
+    BUSY = "busy"
 
 
 class PlayType:
@@ -0,0 +1,213 @@
+# coding=utf-8
+########################
+# Batch Blueprint
+#
+# Full route of this blueprint: /music
+########################
+import logging
+from typing import Callable, Awaitable, List, Tuple, Any
+from quart import Blueprint, request
+
+from .web_utilities import with_status, get_json_from_request, current_player
+from ._bp_types import StatusType, PlayType
+from .bp_queue import with_new_queue
+
+from ..core.player import Player
+from ..core.exceptions import SoundcubeException, PlayerException, MediaNotLoaded, OutsideTimeBounds
+
+log = logging.getLogger(__name__)
+app = Blueprint("batch", __name__)
+
+# Maximum amount of operations in a single batch
+MAX_OPERATIONS = 100
+
+
+class InvalidOperation(Exception):
+    """
+    Raised while parsing a batch, nothing is applied.
+    """
+    pass
+
+
+def _get_int(operation: dict, field: str, required: bool = True):
+    value = operation.get(field)
+    if value is None and not required:
+        return None
+    if type(value) is not int:
+        raise InvalidOperation(f"'{field}' field should be an integer")
+
+    return value
+
+
+def _parse_add(player: Player, operation: dict):
+    song = operation.get("song")
+    if not isinstance(song, str):
+        raise InvalidOperation("'song' field should be a string")
+
+    position = _get_int(operation, "position", required=False)
+    set_playing = bool(operation.get("set_playing", False))
+
+    if position is None:
+        return lambda: player.player_queue(song, set_playing=set_playing)
+    return lambda: player.player_queue(song, PlayType.AT_POSITION, position=position, set_playing=set_playing)
+
+
+def _parse_remove(player: Player, operation: dict):
+    if "unique_id" in operation:
+        unique_id = _get_int(operation, "unique_id")
+        return lambda: player.queue_remove_by_id(unique_id)
+
+    position = _get_int(operation, "position")
+    return lambda: player.queue_remove(position)
+
+
+def _parse_move(player: Player, operation: dict):
+    new_index = _get_int(operation, "new_index")
+
+    if "unique_id" in operation:
+        unique_id = _get_int(operation, "unique_id")
+        return lambda: player.queue_move_by_id(unique_id, new_index)
+
+    current_index = _get_int(operation, "current_index")
+    return lambda: player.queue_move(current_index, new_index)
+
+
+def _parse_play(player: Player, operation: dict):
+    unique_id = _get_int(operation, "unique_id", required=False)
+
+    if unique_id is None:
+        return player.player_play
+    return lambda: player.queue_set_current(unique_id)
+
+
+def _parse_seek(player: Player, operation: dict):
+    time_ = operation.get("time")
+    if type(time_) not in (int, float):
+        raise InvalidOperation("'time' field should be a number")
+
+    return lambda: player.player_set_time(time_)
+
+
+def _parse_volume(player: Player, operation: dict):
+    volume = _get_int(operation, "volume")
+    if not (0 <= volume <= 100):
+        raise InvalidOperation("'volume' not in range 0-100")
+
+    async def set_volume():
+        player.set_volume(volume)
+
+    return set_volume
+
+
+# op: function that validates the operation and returns the coroutine function that applies it (to the zone)
+OPERATIONS = {
+    "add": _parse_add,
+    "remove": _parse_remove,
+    "move": _parse_move,
+    "play": _parse_play,
+    "pause": lambda player, _: player.player_pause,
+    "resume": lambda player, _: player.player_resume,
+    "stop": lambda player, _: player.player_stop,
+    "next": lambda player, _: player.player_next,
+    "previous": lambda player, _: player.player_previous,
+    "seek": _parse_seek,
+    "volume": _parse_volume,
+}
+
+
+def parse_batch(player: Player, operations: Any) -> List[Tuple[str, Callable[[], Awaitable]]]:
+    """
+    Validates all operations of a batch before any of them is applied.
+    :param player: zone the batch is applied to
+    :param operations: list of operations, e.g. {"op": "move", "unique_id": 123, "new_index": 0}
+    :return: list of (op, coroutine function)
+
+    :raise: InvalidOperation: an operation is malformed
+    """
+    if not isinstance(operations, list) or not operations:
+        raise InvalidOperation("'operations' should be a non-empty list")
+    if len(operations) > MAX_OPERATIONS:
+        raise InvalidOperation(f"at most {MAX_OPERATIONS} operations per batch")
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise InvalidOperation(f"operation {index}: unknown 'op'")
+
+        try:
+            parsed.append((operation["op"], OPERATIONS[operation["op"]](player, operation)))
+        except InvalidOperation as e:
+            raise InvalidOperation(f"operation {index}: {e}")
+
+    return parsed
+
+
+@app.route("/batch", methods=["POST"])
+async def batch():
+    """
+    Full route: /music/batch
+
+    Request (JSON):
+        operations: list of {op: string, ...fields}
+            add: song, position (optional), set_playing (optional)
+            remove: unique_id or position
+            move: unique_id or current_index, new_index
+            play: unique_id (optional)
+            pause, resume, stop, next, previous
+            seek: time
+            volume: volume
+
+    Applies the operations in order as a single player command, so no other request is interleaved.
+    The batch is atomic: if an operation fails, the ones before it are undone (queue, current song,
+    playback and volume are restored to how they were before the batch).
+    :return: the result of every attempted operation and the new queue (once)
+    """
+    player = current_player()
+
+    json = await get_json_from_request(request)
+
+    try:
+        operations = parse_batch(player, json.get("operations"))
+    except InvalidOperation as e:
+        return with_status({"message": str(e)}, 400, StatusType.BAD_REQUEST)
+
+    async def apply_batch():
+        checkpoint = await player.checkpoint()
+        results = []
+        for op, apply in operations:
+            try:
+                result = await apply()
+            except PlayerException as e:
+                # Not loaded media and invalid times are the client's fault, everything else isn't
+                internal = not isinstance(e, (MediaNotLoaded, OutsideTimeBounds))
+                status = StatusType.INTERNAL_ERROR if internal else StatusType.ERROR
+                results.append({"op": op, "status": status, "message": str(e)})
+                break
+            except SoundcubeException as e:
+                results.append({"op": op, "status": StatusType.ERROR, "message": str(e)})
+                break
+
+            # Operations that return False didn't change anything (e.g. pausing when already paused)
+            results.append({"op": op, "status": StatusType.NOOP if result is False else StatusType.OK})
+
+        # Built inside the command, so the queue matches the results
+        status = results[-1]["status"]
+        if status in (StatusType.ERROR, StatusType.INTERNAL_ERROR):
+            log.debug(f"Operation {len(results)}/{len(operations)} of a batch failed, rolling back")
+            try:
+                await player.rollback(checkpoint)
+            except PlayerException as e:
+                # The queue is restored by then, only the song could not be loaded again
+                log.warning(f"Could not restore playback after a failed batch: {e}")
+        else:
+            log.debug(f"Applied batch of {len(operations)} operations")
+
+        if status == StatusType.ERROR:
+            return with_new_queue(player, {"results": results, "failed": len(results) - 1}, 441, status)
+        if status == StatusType.INTERNAL_ERROR:
+            return with_new_queue(player, {"results": results, "failed": len(results) - 1}, 444, status)
+
+        return with_new_queue(player, {"results": results})
+
+    # The whole batch is a single command, nothing else runs in between
+    return await player.commands.run(apply_batch)
@@ -0,0 +1,62 @@
+# coding=utf-8
+########################
+# Events Blueprint
+#
+# Full route of this blueprint: /music
+########################
+import logging
+from quart import Blueprint
+
+from .web_utilities import dumps_event, current_player
+
+from ..core.events import EventHub
+from ..core.zones import ZoneRegistry
+from ..config import EVENTS_KEEPALIVE
+
+log = logging.getLogger(__name__)
+app = Blueprint("events", __name__)
+
+# zone name: EventHub
+hubs = {}
+for zone in ZoneRegistry():
+    hubs[zone.name] = EventHub(dumps_event)
+    zone.add_listener(hubs[zone.name].publish)
+
+
+@app.route("/events")
+async def events():
+    """
+    Full route: /music/events
+
+    Server-sent events (text/event-stream) with every player and queue change:
+    queue_add, queue_remove, queue_move, track_changed, playing, paused, stopped, ended, error, seek, volume
+    and resync (the client fell behind and should re-fetch the queue).
+    Every event carries the event version (also sent as the SSE id).
+    """
+    player = current_player()
+    hub = hubs[player.name]
+
+    subscription = hub.subscribe()
+
+    async def stream():
+        try:
+            yield hub.encode("hello", {"current_song": player._queue.current_index})
+
+            while True:
+                payloads = await subscription.get(EVENTS_KEEPALIVE)
+                if not payloads:
+                    # Keeps proxies from closing the idle connection
+                    yield b": keep-alive\n\n"
+                    continue
+
+                yield b"".join(payloads)
+        finally:
+            hub.unsubscribe(subscription)
+
+    headers = {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+
+    return stream(), 200, headers
@@ -0,0 +1,123 @@
+# coding=utf-8
+########################
+# Library Blueprint
+#
+# Full route of this blueprint: /music/library
+########################
+import logging
+from functools import partial
+from quart import Blueprint, request
+
+from .web_utilities import with_status, get_json_from_request, current_player
+from ._bp_types import StatusType, PlayType
+from .bp_queue import with_new_queue
+
+from ..core.exceptions import LibraryException
+
+log = logging.getLogger(__name__)
+app = Blueprint("library", __name__)
+
+MAX_PER_PAGE = 200
+
+
+def library_disabled():
+    return with_status({"message": "The local library is disabled"}, 441, StatusType.ERROR)
+
+
+@app.route("/search")
+async def library_search():
+    """
+    Full route: /music/library/search
+
+    Query parameters:
+        q: str - search words (matched against titles, artists, albums and file names)
+        page: int (optional, default 0)
+        per_page: int (optional, default 50, max 200)
+
+    :return: the total amount of matching tracks and the requested page of them
+    """
+    player = current_player()
+
+    if player.library is None:
+        return library_disabled()
+
+    query = request.args.get("q", "")
+    try:
+        page = int(request.args.get("page", 0))
+        per_page = int(request.args.get("per_page", 50))
+    except ValueError:
+        return with_status({"message": "'page' and 'per_page' should be integers"}, 400, StatusType.BAD_REQUEST)
+
+    if page < 0 or not 0 < per_page <= MAX_PER_PAGE:
+        return with_status({"message": "Invalid 'page' or 'per_page'"}, 400, StatusType.BAD_REQUEST)
+
+    total, tracks = player.library.search(query, page * per_page, per_page)
+
+    data = {
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "tracks": tracks
+    }
+
+    return with_status(data, 200, StatusType.OK)
+
+
+@app.route("/queue", methods=["POST"])
+async def library_queue():
+    """
+    Full route: /music/library/queue
+
+    Request (JSON):
+        track_id: int
+        position: int (optional, defaults to the end of the queue)
+        set_playing: bool (optional)
+
+    Adds a local track to the queue.
+    :return: the new queue
+    """
+    player = current_player()
+
+    if player.library is None:
+        return library_disabled()
+
+    json = await get_json_from_request(request)
+
+    track_id, position = json.get("track_id"), json.get("position")
+    set_playing = bool(json.get("set_playing", False))
+    if track_id is None:
+        return with_status({"message": "Missing 'track_id' field"}, 400, StatusType.BAD_REQUEST)
+    if type(track_id) is not int:
+        return with_status({"message": "'track_id' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+    if position is not None and type(position) is not int:
+        return with_status({"message": "'position' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+
+    play_type = PlayType.QUEUE if position is None else PlayType.AT_POSITION
+
+    try:
+        await player.commands.run(partial(player.queue_local, track_id, play_type,
+                                          position=position, set_playing=set_playing))
+    except LibraryException as e:
+        return with_status({"message": str(e)}, 441, StatusType.ERROR)
+    else:
+        return with_new_queue(player)
+
+
+@app.route("/scan", methods=["POST"])
+async def library_scan():
+    """
+    Full route: /music/library/scan
+
+    Looks for new, changed and removed files in the library directories (in the background).
+    Only new and changed files are read.
+    :return: 200 if a scan was started, 440 if one is already running
+    """
+    player = current_player()
+
+    if player.library is None:
+        return library_disabled()
+
+    if not player.library.scan():
+        return with_status(None, 440, StatusType.NOOP)
+
+    return with_status(None, 200, StatusType.OK)
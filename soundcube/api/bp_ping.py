@@ -7,7 +7,10 @@
 import logging
 from quart import Blueprint, request
 
-from .web_utilities import jsonify_response
+from .web_utilities import jsonify_response, with_status, current_player, current_zones
+from ._bp_types import StatusType
+
+from .bp_events import hubs as events_hubs
 
 log = logging.getLogger(__name__)
 app = Blueprint("ping", __name__)
@@ -17,3 +20,54 @@ app = Blueprint("ping", __name__)
 async def ping():
     log.debug(f"Got ping from {request.remote_addr}")
     return jsonify_response({"pong": "ok"})
+
+
+@app.route("/stats")
+async def stats():
+    """
+    Full route: /stats
+
+    :return: internal statistics (cache hits/misses, ...), the caches are shared by all zones
+    """
+    player = current_player()
+
+    data = {
+        "zone": player.name,
+        "metadata_cache": player.resolver.cache.stats,
+        "resolver": player.resolver.stats,
+        "transitions": player.prefetcher.stats,
+        "stream_refresh": player.refresher.stats,
+        "audio_cache": player.audio_cache.stats if player.audio_cache is not None else None,
+        "search": player._queue.search.stats,
+        "library": player.library.stats if player.library is not None else None,
+        "journal": player.journal.stats if player.journal is not None else None,
+        "stream": player.stream_output.stats if player.stream_output is not None else None,
+        "sync": player.sync.stats if player.sync is not None else None,
+        "events": events_hubs[player.name].stats,
+        "commands": player.commands.stats,
+        "debounce": {
+            "volume": player.volume_debouncer.stats,
+            "seek": player.seek_debouncer.stats
+        }
+    }
+
+    return with_status(data, 200, StatusType.OK)
+
+
+@app.route("/zones")
+async def zones():
+    """
+    Full route: /zones
+
+    :return: all zones (the first one is the default zone) with their current song and queue length
+    """
+    data = {
+        "zones": [{
+            "name": zone.name,
+            "current_song": zone._queue.current_index,
+            "queue_length": len(zone._queue.queue),
+            "version": zone._queue.tag
+        } for zone in current_zones()]
+    }
+
+    return with_status(data, 200, StatusType.OK)
@@ -8,15 +8,14 @@ import re
 import logging
 from quart import Blueprint, request
 
-from .web_utilities import with_status, get_json_from_request, process_time, dictify_YoutubeAudio
+from .web_utilities import with_status, with_status_raw, get_json_from_request, process_time, encode_YoutubeAudio, \
+    current_player
 from ._bp_types import StatusType
 
-from ..core.player import Player
 from ..core.exceptions import MediaNotLoaded, QueueException, PlayerException, \
                               YoutubeException, OutsideTimeBounds
 
 app = Blueprint("player", __name__)
-player = Player()
 
 # OTHER
 
@@ -36,6 +35,8 @@ async def player_quick_queue():
 
     Queue a song to play (at the end of the queue or next).
     """
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     url = json.get("song")
@@ -43,7 +44,7 @@ async def player_quick_queue():
         return with_status({"message": "Missing 'song' field"}, 400, StatusType.BAD_REQUEST)
 
     try:
-        await player.player_queue(url)
+        await player.commands.run(player.player_queue, url)
     except YoutubeException:
         return with_status(None, 400, StatusType.ERROR)
     else:
@@ -59,6 +60,8 @@ async def player_get_current():
 
     :return: info about the current song.
     """
+    player = current_player()
+
     current_song = player._queue.current_audio
 
     if current_song is None:
@@ -67,12 +70,11 @@ async def player_get_current():
         is_playing = player.player_is_playing()
 
         data = {
-            "current_song": dictify_YoutubeAudio(current_song),
             "is_playing": is_playing,
             "time": await player.player_get_time() if is_playing else None
         }
 
-        return with_status(data, 200, StatusType.OK)
+        return with_status_raw(data, {"current_song": encode_YoutubeAudio(current_song)}, 200, StatusType.OK)
 
 
 @app.route("/play", methods=["POST"])
@@ -84,10 +86,12 @@ async def player_play():
 
     Play the current song.
     """
+    player = current_player()
+
     # no json expected
 
     try:
-        await player.player_play()
+        await player.commands.run(player.player_play)
     except QueueException:
         return with_status(None, 441, StatusType.ERROR)
     except PlayerException:
@@ -105,8 +109,10 @@ async def player_pause():
 
     Pause the current song.
     """
+    player = current_player()
+
     # no json expected
-    did_pause = await player.player_pause()
+    did_pause = await player.commands.run(player.player_pause)
 
     if did_pause:
         return with_status(None, 200, StatusType.OK)
@@ -123,9 +129,11 @@ async def player_resume():
 
     Resume the current song.
     """
+    player = current_player()
+
     # no json expected
     try:
-        did_resume = await player.player_resume()
+        did_resume = await player.commands.run(player.player_resume)
     except MediaNotLoaded:
         return with_status(None, 441, StatusType.ERROR)
     else:
@@ -144,9 +152,11 @@ async def player_stop():
 
     Stop (unload) the current song.
     """
+    player = current_player()
+
     # no json expected
 
-    was_playing = await player.player_stop()
+    was_playing = await player.commands.run(player.player_stop)
 
     if was_playing:
         return with_status(None, 200, StatusType.OK)
@@ -163,10 +173,12 @@ async def player_next():
 
     Play the next song in queue.
     """
+    player = current_player()
+
     # no json expected
 
     try:
-        await player.player_next()
+        await player.commands.run(player.player_next)
     except QueueException:
         return with_status(None, 441, StatusType.ERROR)
     except PlayerException:
@@ -184,10 +196,12 @@ async def player_previous():
 
     Play the previous song in queue.
     """
+    player = current_player()
+
     # no json expected
 
     try:
-        await player.player_previous()
+        await player.commands.run(player.player_previous)
     except QueueException:
         return with_status(None, 441, StatusType.ERROR)
     except PlayerException:
@@ -197,6 +211,8 @@ async def player_previous():
 
 
 async def player_get_time():
+    player = current_player()
+
     # Return a 441 if no song is loaded
     if not player.player_is_song_loaded():
         return with_status(None, 441, StatusType.ERROR)
@@ -212,6 +228,8 @@ async def player_get_time():
 
 
 async def player_set_time():
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     audio_time = json.get("time")
@@ -225,9 +243,7 @@ async def player_set_time():
 
     try:
         log.debug(f"Parsed time: {time_in_float}")
-        did_change = await player.player_set_time(time_in_float)
-    except RuntimeError:
-        return with_status(None, 444, StatusType.INTERNAL_ERROR)
+        did_change = player.request_seek(time_in_float)
     except OutsideTimeBounds:
         return with_status(None, 441, StatusType.ERROR)
     else:
@@ -247,6 +263,9 @@ async def player_audio_time():
     PATCH: Move to the specified time in the song.
     Request (JSON):
         time: integer
+
+    Seeks are debounced: the request is acknowledged right away, but within a short window
+    only the latest one is applied.
     """
     if request.method == "GET":
         return await player_get_time()
@@ -257,6 +276,8 @@ async def player_audio_time():
 
 
 async def player_volume_get():
+    player = current_player()
+
     # no json
     data = {
         "volume": player.get_volume()
@@ -266,6 +287,8 @@ async def player_volume_get():
 
 
 async def player_volume_set():
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     volume = json.get("volume")
@@ -281,7 +304,7 @@ async def player_volume_set():
     if not (0 <= volume <= 100):
         return with_status({"message": "'volume' not in range 0-100"}, 400, StatusType.BAD_REQUEST)
 
-    player.set_volume(volume)
+    player.request_volume(volume)
 
     return with_status(None, 200, StatusType.OK)
 
@@ -296,6 +319,8 @@ async def player_audio_volume():
     POST: Set the volume (0-100)
     Request (JSON):
         volume: integer
+
+    Volume changes are debounced like seeks.
     """
     if request.method == "GET":
         return await player_volume_get()
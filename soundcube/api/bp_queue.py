@@ -5,29 +5,81 @@
 # Full route of this blueprint: /music/queue
 ########################
 import logging
-from typing import List
-from quart import Blueprint, request
+import asyncio
+from functools import partial
+from typing import Dict, Optional, Tuple
+from quart import Blueprint, request, Response
 
-from .web_utilities import with_status, get_json_from_request, dictify_YoutubeAudio
+from .web_utilities import with_status, with_status_raw, get_json_from_request, encode_queue, dumps, dumps_event, \
+    current_player
 from ._bp_types import StatusType, PlayType
 
 from ..core.player import Player
-from ..core.youtube import YoutubeAudio
-from ..core.exceptions import YoutubeException, QueueException
+from ..core.youtube_api import get_playlist_id
+from ..core.exceptions import YoutubeException, QueueException, PlayerException
 
 log = logging.getLogger(__name__)
 app = Blueprint("queue", __name__)
-player = Player()
 
+SEARCH_MAX_PER_PAGE = 200
+# scope: in_queue filter of SearchIndex.search
+SEARCH_SCOPES = {"all": None, "queue": True, "history": False}
 
-def get_json_queue() -> list:
+
+# zone name: (queue version tag, serialized queue)
+_queue_cache: Dict[str, Tuple[str, str]] = {}
+
+
+def get_serialized_queue(player: Player) -> str:
+    """
+    Returns the serialized queue, only re-assembled when the queue version changes.
+    :return: JSON string
+    """
+    version = player._queue.tag
+    cached = _queue_cache.get(player.name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    serialized = encode_queue(player._queue.queue)
+    _queue_cache[player.name] = (version, serialized)
+
+    return serialized
+
+
+def queue_etag(player: Player) -> str:
+    return f'"{player._queue.tag}"'
+
+
+def with_new_queue(player: Player, json: Optional[dict] = None, resp_code: int = 200,
+                   status: StatusType = StatusType.OK):
     """
-    Returns a JSON-friendly representation of the queue
-    :return: list
+    Response for routes that modify the queue.
+    :param player: zone whose queue changed
+    :param json: additional data to respond with
+    :param resp_code: HTTP status code
+    :param status: StatusType
     """
-    queue: List[YoutubeAudio] = player._queue.queue
+    data = {
+        **(json or {}),
+        "version": player._queue.tag,
+        "current_song": player._queue.current_index
+    }
 
-    return [dictify_YoutubeAudio(a) for a in queue]
+    return with_status_raw(data, {"new_queue": get_serialized_queue(player)}, resp_code, status,
+                           {"ETag": queue_etag(player)})
+
+
+def unknown_song(player: Player):
+    """
+    Response for id-based routes when the song isn't in the queue (anymore),
+    the client can catch up with /queue/get?since=<its version>.
+    """
+    data = {
+        "message": "song is not in the queue",
+        "version": player._queue.tag
+    }
+
+    return with_status(data, 441, StatusType.ERROR)
 
 
 @app.route("/get")
@@ -35,16 +87,82 @@ async def queue_get():
     """
     Full route: /music/queue/get
 
-    :return: the current queue
+    Query parameters:
+        since: str (optional) - queue version the client already has
+
+    Supports If-None-Match with the returned ETag (304 if the queue hasn't changed).
+    :return: the current queue, or only the operations applied since the `since` version if available
     """
+    player = current_player()
+
     # no json expected
+    etag = queue_etag(player)
+    if request.headers.get("If-None-Match") == etag:
+        return Response("", 304, headers={"ETag": etag})
 
-    payload = {
-        "queue": get_json_queue(),
+    data = {
+        "version": player._queue.tag,
         "current_song": player._queue.current_index
     }
 
-    return with_status(payload, 200, StatusType.OK)
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            operations = player._queue.operations_since(since)
+        except ValueError:
+            return with_status({"message": "Invalid 'since'"}, 400, StatusType.BAD_REQUEST)
+
+        # None if the operations aren't available anymore or the version is from before a restart
+        if operations is not None:
+            return with_status_raw(data, {"operations": dumps_event(operations)}, 200, StatusType.OK, {"ETag": etag})
+
+    return with_status_raw(data, {"queue": get_serialized_queue(player)}, 200, StatusType.OK, {"ETag": etag})
+
+
+@app.route("/search")
+async def queue_search():
+    """
+    Full route: /music/queue/search
+
+    Query parameters:
+        q: str - search words (every word has to be the start of a word in the title or uploader)
+        scope: str (optional) - all (default), queue or history
+        page: int (optional, default 0)
+        per_page: int (optional, default 50, max 200)
+
+    Searches the queue and previously played songs, most recently queued first.
+    :return: the total amount of results and the requested page of them
+    """
+    player = current_player()
+
+    query = request.args.get("q", "")
+    scope = request.args.get("scope", "all")
+    try:
+        page = int(request.args.get("page", 0))
+        per_page = int(request.args.get("per_page", 50))
+    except ValueError:
+        return with_status({"message": "'page' and 'per_page' should be integers"}, 400, StatusType.BAD_REQUEST)
+
+    if page < 0 or not 0 < per_page <= SEARCH_MAX_PER_PAGE:
+        return with_status({"message": "Invalid 'page' or 'per_page'"}, 400, StatusType.BAD_REQUEST)
+    if scope not in SEARCH_SCOPES:
+        return with_status({"message": "'scope' should be one of: all, queue, history"}, 400, StatusType.BAD_REQUEST)
+
+    total, songs = player._queue.search.search(query, page * per_page, per_page, SEARCH_SCOPES[scope])
+    results = [{
+        "song": audio,
+        "in_queue": in_queue,
+        "position": player._queue.position_of(audio.unique_id) if in_queue else None
+    } for audio, in_queue in songs]
+
+    data = {
+        "total": total,
+        "page": page,
+        "per_page": per_page,
+        "version": player._queue.tag
+    }
+
+    return with_status_raw(data, {"results": dumps_event(results)}, 200, StatusType.OK)
 
 
 @app.route("/add", methods=["POST"])
@@ -60,6 +178,8 @@ async def queue_add():
     Adds a song to the queue.
     :return: The new queue
     """
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     song, position = json.get("song"), json.get("position")
@@ -72,15 +192,12 @@ async def queue_add():
         return with_status({"message": "Invalid 'position'"}, 400, StatusType.BAD_REQUEST)
 
     try:
-        await player.player_queue(song, PlayType.AT_POSITION, position=position, set_playing=set_playing)
+        await player.commands.run(partial(player.player_queue, song, PlayType.AT_POSITION,
+                                          position=position, set_playing=set_playing))
     except YoutubeException:
         return with_status(None, 441, StatusType.ERROR)
     else:
-        data = {
-            "new_queue": get_json_queue()
-        }
-
-        return with_status(data, 200, StatusType.OK)
+        return with_new_queue(player)
 
 
 @app.route("/remove", methods=["POST"])
@@ -94,6 +211,8 @@ async def queue_remove():
     Remove a song from the queue
     :return: the new queue
     """
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     position = json.get("position")
@@ -103,15 +222,11 @@ async def queue_remove():
         return with_status({"message": "'position' field should be an integer"}, 400, StatusType.BAD_REQUEST)
 
     try:
-        await player.queue_remove(position)
+        await player.commands.run(player.queue_remove, position)
     except QueueException:
         return with_status(None, 441, StatusType.ERROR)
     else:
-        data = {
-            "new_queue": get_json_queue()
-        }
-
-        return with_status(data, 200, StatusType.OK)
+        return with_new_queue(player)
 
 
 @app.route("/move", methods=["POST"])
@@ -126,6 +241,8 @@ async def queue_move():
     Move a song to a position in the queue
     :return: the new queue
     """
+    player = current_player()
+
     json = await get_json_from_request(request)
 
     current, new = json.get("current_index"), json.get("new_index")
@@ -144,15 +261,170 @@ async def queue_move():
         # if current < new:
         #     new += 1
 
-        await player.queue_move(current, new)
+        await player.commands.run(player.queue_move, current, new)
     except QueueException:
         return with_status(None, 441, StatusType.ERROR)
     else:
-        new_queue = get_json_queue()
-        log.debug(f"New queue: {','.join([repr(a) for a in new_queue])}")
+        return with_new_queue(player)
+
+
+@app.route("/removeById", methods=["POST"])
+async def queue_remove_by_id():
+    """
+    Full route: /music/queue/removeById
+
+    Request (JSON):
+        unique_id: int
+
+    Remove a song from the queue by its unique_id
+    :return: the new queue (441 with the current version if the song isn't in the queue)
+    """
+    player = current_player()
+
+    json = await get_json_from_request(request)
+
+    unique_id = json.get("unique_id")
+    if unique_id is None:
+        return with_status({"message": "Missing 'unique_id' field"}, 400, StatusType.BAD_REQUEST)
+    if type(unique_id) is not int:
+        return with_status({"message": "'unique_id' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+
+    try:
+        await player.commands.run(player.queue_remove_by_id, unique_id)
+    except QueueException:
+        return unknown_song(player)
+    else:
+        return with_new_queue(player)
+
+
+@app.route("/moveById", methods=["POST"])
+async def queue_move_by_id():
+    """
+    Full route: /music/queue/moveById
+
+    Request (JSON):
+        unique_id: int
+        new_index: int
+
+    Move a song (by its unique_id) to a position in the queue
+    :return: the new queue (441 with the current version if the song isn't in the queue)
+    """
+    player = current_player()
+
+    json = await get_json_from_request(request)
+
+    unique_id, new = json.get("unique_id"), json.get("new_index")
+    if unique_id is None or new is None:
+        return with_status({"message": "One or more fields missing: 'unique_id', 'new_index'"},
+                           400, StatusType.BAD_REQUEST)
+
+    if type(unique_id) is not int:
+        return with_status({"message": "'unique_id' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+    if type(new) is not int:
+        return with_status({"message": "'new_index' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+
+    async def move() -> bool:
+        # Checked in the same command, so the song can't disappear in between
+        if not player._queue.contains(unique_id):
+            return False
+
+        await player.queue_move_by_id(unique_id, new)
+        return True
+
+    try:
+        moved = await player.commands.run(move)
+    except QueueException:
+        return with_status({"message": "Invalid 'new_index'"}, 441, StatusType.ERROR)
+
+    if not moved:
+        return unknown_song(player)
+    return with_new_queue(player)
+
+
+@app.route("/setCurrent", methods=["POST"])
+async def queue_set_current():
+    """
+    Full route: /music/queue/setCurrent
+
+    Request (JSON):
+        unique_id: int
+        play: bool (optional, defaults to true)
+
+    Make a song (by its unique_id) the current one and play (or only load) it
+    :return: the new queue (441 with the current version if the song isn't in the queue)
+    """
+    player = current_player()
+
+    json = await get_json_from_request(request)
+
+    unique_id = json.get("unique_id")
+    play = bool(json.get("play", True))
+    if unique_id is None:
+        return with_status({"message": "Missing 'unique_id' field"}, 400, StatusType.BAD_REQUEST)
+    if type(unique_id) is not int:
+        return with_status({"message": "'unique_id' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+
+    try:
+        await player.commands.run(player.queue_set_current, unique_id, play)
+    except QueueException:
+        return unknown_song(player)
+    except PlayerException:
+        return with_status(None, 444, StatusType.INTERNAL_ERROR)
+    else:
+        return with_new_queue(player)
+
+
+@app.route("/importPlaylist", methods=["POST"])
+async def queue_import_playlist():
+    """
+    Full route: /music/queue/importPlaylist
+
+    Request (JSON):
+        playlist: playlist url or id
+        position: int (optional, 0 to the length of the queue, defaults to the end of the queue)
+
+    Queues a whole YouTube playlist.
+    :return: progress as newline-delimited JSON, one object per step (stage: queued, resolved, done or error)
+    """
+    player = current_player()
+
+    json = await get_json_from_request(request)
+
+    playlist, position = json.get("playlist"), json.get("position")
+    if playlist is None:
+        return with_status({"message": "Missing 'playlist' field"}, 400, StatusType.BAD_REQUEST)
+    if position is not None and type(position) is not int:
+        return with_status({"message": "'position' field should be an integer"}, 400, StatusType.BAD_REQUEST)
+    if position is not None and not 0 <= position <= len(player._queue.queue):
+        return with_status({"message": "'position' is outside of the queue"}, 400, StatusType.BAD_REQUEST)
+
+    try:
+        playlist_id = get_playlist_id(playlist)
+    except ValueError:
+        return with_status({"message": "Invalid 'playlist'"}, 441, StatusType.ERROR)
+
+    # The import runs on its own, even if the client disconnects
+    progress = asyncio.Queue()
+    task = asyncio.ensure_future(player.queue_playlist(playlist_id, position, progress.put_nowait))
+    task.add_done_callback(lambda _: progress.put_nowait(None))
+
+    async def stream():
+        while True:
+            step = await progress.get()
+            if step is None:
+                break
+
+            yield dumps(step).encode("utf-8") + b"\n"
+
+        if task.cancelled():
+            log.warning(f"Importing playlist {playlist_id} was cancelled")
+            step = {"stage": "error", "message": "the import was cancelled", "status": StatusType.ERROR}
+        elif task.exception() is not None:
+            log.warning(f"Importing playlist {playlist_id} failed: {task.exception()}")
+            step = {"stage": "error", "message": str(task.exception()), "status": StatusType.ERROR}
+        else:
+            step = {"stage": "done", "version": player._queue.tag, "status": StatusType.OK}
 
-        data = {
-            "new_queue": new_queue
-        }
+        yield dumps(step).encode("utf-8") + b"\n"
 
-        return with_status(data, 200, StatusType.OK)
+    return stream(), 200, {"Content-Type": "application/x-ndjson"}
@@ -5,8 +5,14 @@
 # Full route of this blueprint: /
 ########################
 import os
+import re
+import asyncio
+import gzip
 import logging
-from quart import Blueprint, send_from_directory
+import hashlib
+import mimetypes
+from typing import Dict, Optional
+from quart import Blueprint, Response, request, abort, safe_join, send_file
 
 from ..config import PUBLIC_URL, PORT, FRONTEND_BUILD_LOCATION
 
@@ -20,6 +26,182 @@ CSS_FOLDER = os.path.join(STATIC_FOLDER, "css")
 log = logging.getLogger(__name__)
 app = Blueprint("serve", __name__)
 
+try:
+    import brotli
+except ImportError:
+    log.info("'brotli' is not available, static files are only compressed with gzip.")
+    brotli = None
+
+# Files with a content hash in their name (e.g. main.1a2b3c4d.chunk.js) never change
+hashed_name_regex = re.compile(r"\.[0-9a-f]{8,}\.")
+# Content types worth compressing
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Larger files are served from disk as they are
+MAX_CACHED_SIZE = 8 * 2 ** 20
+
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+# Always revalidated (cheap with the ETag)
+CACHE_REVALIDATE = "no-cache"
+
+
+class StaticFile:
+    """
+    A file held in memory, with its compressed variants and ETags computed once.
+    """
+    __slots__ = ("mimetype", "cache_control", "mtime", "variants")
+
+    def __init__(self, data: bytes, mimetype: str, cache_control: str, mtime: Optional[float] = None):
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.mtime = mtime
+
+        digest = hashlib.sha1(data).hexdigest()[:20]
+        # content encoding: (body, strong ETag)
+        self.variants: Dict[str, tuple] = {"identity": (data, f'"{digest}"')}
+
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(data, compresslevel=9)
+            if len(compressed) < len(data):
+                self.variants["gzip"] = (compressed, f'"{digest}-gz"')
+
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    self.variants["br"] = (compressed, f'"{digest}-br"')
+
+    def respond(self) -> Response:
+        """
+        :return: the best variant the client accepts (304 if it already has it)
+        """
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = next((encoding for encoding in ("br", "gzip") if encoding in accepted
+                         and encoding in self.variants), "identity")
+        body, etag = self.variants[encoding]
+
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding"
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+
+        if etag in request.headers.get("If-None-Match", ""):
+            return Response(b"", 304, headers=headers)
+
+        return Response(body, 200, headers=headers, mimetype=self.mimetype)
+
+
+def accepted_encodings(header: str) -> set:
+    """
+    :param header: value of the Accept-Encoding header
+    :return: set of the accepted content encodings (without the ones with q=0)
+    """
+    accepted = set()
+    for part in header.split(","):
+        encoding, _, parameters = part.strip().partition(";")
+        quality = parameters.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+
+        accepted.add(encoding.strip().lower())
+
+    return accepted
+
+
+def render_index() -> Optional[StaticFile]:
+    """
+    Fills in the index.html template once.
+    """
+    try:
+        with open(INDEX_HTML, encoding="utf-8") as f:
+            page = f.read()
+    except OSError as e:
+        log.warning(f"Could not read {INDEX_HTML}: {e}")
+        return None
+
+    # So we don't have to deal with templating stuff
+    page = page.replace("{{soundcube_host}}", str(PUBLIC_URL))
+    page = page.replace("{{soundcube_port}}", str(PORT))
+
+    return StaticFile(page.encode("utf-8"), "text/html", CACHE_REVALIDATE)
+
+
+_index: Optional[StaticFile] = render_index()
+# absolute path: StaticFile
+_files: Dict[str, StaticFile] = {}
+
+
+def load_file(full_path: str, mtime: float) -> StaticFile:
+    """
+    Reads and compresses a file (blocking, runs in an executor).
+    """
+    with open(full_path, "rb") as f:
+        data = f.read()
+
+    mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    immutable = hashed_name_regex.search(os.path.basename(full_path)) is not None
+
+    return StaticFile(data, mimetype, CACHE_IMMUTABLE if immutable else CACHE_REVALIDATE, mtime)
+
+
+async def serve_file(directory: str, path: str) -> Response:
+    """
+    Serves a file from the directory, from memory after the first request (or preload_static).
+    Files without a hash in their name are checked for changes on every request.
+    """
+    full_path = str(safe_join(directory, path))
+
+    cached = _files.get(full_path)
+    if cached is not None and cached.cache_control == CACHE_IMMUTABLE:
+        return cached.respond()
+
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        stat = None
+    if stat is None or not os.path.isfile(full_path):
+        _files.pop(full_path, None)
+        abort(404)
+
+    if cached is not None and cached.mtime == stat.st_mtime:
+        return cached.respond()
+
+    if stat.st_size > MAX_CACHED_SIZE:
+        return await send_file(full_path)
+
+    # Compression (especially brotli) is too slow for the event loop
+    static_file = await asyncio.get_event_loop().run_in_executor(None, load_file, full_path, stat.st_mtime)
+    _files[full_path] = static_file
+
+    return static_file.respond()
+
+
+async def preload_static():
+    """
+    Loads and compresses all files in the static folder, so even the first requests are served from memory.
+    """
+    loop = asyncio.get_event_loop()
+
+    for root, _, names in os.walk(STATIC_FOLDER):
+        for name in names:
+            # Same form as the paths from safe_join
+            full_path = os.path.realpath(os.path.join(root, name))
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            if stat.st_size > MAX_CACHED_SIZE or full_path in _files:
+                continue
+
+            _files[full_path] = await loop.run_in_executor(None, load_file, full_path, stat.st_mtime)
+
+    log.info(f"Preloaded {len(_files)} static files")
+
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -28,14 +210,12 @@ async def index(path):
     Serves files from the react/build/static directory.
     """
     if path == "":
-        # So we don't have to deal with templating stuff
-        with open(INDEX_HTML) as f:
-            page = f.read().replace("{{soundcube_host}}", str(PUBLIC_URL))
-            page = page.replace("{{soundcube_port}}", str(PORT))
+        if _index is None:
+            abort(404)
 
-            return page
+        return _index.respond()
     else:
-        return await send_from_directory(TEMPLATE_FOLDER, path)
+        return await serve_file(TEMPLATE_FOLDER, path)
 
 
 @app.route("/static/js/<path:path>")
@@ -43,7 +223,7 @@ async def serve_static(path):
     """
     Specifically serves files from the react/build/static/js directory.
     """
-    return await send_from_directory(JS_FOLDER, path)
+    return await serve_file(JS_FOLDER, path)
 
 
 @app.route("/static/css/<path:path>")
@@ -51,4 +231,4 @@ async def serve_static_css(path):
     """
     Specifically serves files from the react/build/static/css directory.
     """
-    return await send_from_directory(CSS_FOLDER, path)
+    return await serve_file(CSS_FOLDER, path)
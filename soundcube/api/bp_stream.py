@@ -0,0 +1,43 @@
+# coding=utf-8
+########################
+# Stream Blueprint
+#
+# Full route of this blueprint: /music
+########################
+import logging
+from quart import Blueprint
+
+from .web_utilities import with_status, current_player
+from ._bp_types import StatusType
+
+from ..core.streaming import CONTENT_TYPE
+from ..config import STREAMING_NAME, STREAMING_BITRATE
+
+log = logging.getLogger(__name__)
+app = Blueprint("stream", __name__)
+
+
+@app.route("/stream")
+async def stream():
+    """
+    Full route: /music/stream
+
+    Icecast-style MP3 stream of whatever is playing, usable by any audio player or <audio> element.
+    All listeners share a single encoding, listeners that can't keep up are skipped ahead (or dropped,
+    see the Streaming config).
+    """
+    player = current_player()
+
+    if player.stream_output is None:
+        return with_status({"message": "Streaming is disabled"}, 440, StatusType.NOOP)
+
+    headers = {
+        "Content-Type": CONTENT_TYPE,
+        "Cache-Control": "no-cache",
+        # Don't let proxies (e.g. nginx) hold back the audio
+        "X-Accel-Buffering": "no",
+        "icy-name": STREAMING_NAME,
+        "icy-br": str(STREAMING_BITRATE)
+    }
+
+    return player.stream_output.listen(), 200, headers
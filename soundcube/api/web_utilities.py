@@ -1,12 +1,15 @@
 # coding=utf-8
+from quart import g
 from quart.wrappers.response import Response
 from quart.wrappers.request import Request
 import logging
-from typing import Optional, Union
+from typing import Optional, Union, Iterable
 
 from ._bp_types import StatusType
 
 from ..core.youtube import YoutubeAudio
+from ..core.player import Player
+from ..core.zones import ZoneRegistry
 
 log = logging.getLogger(__name__)
 
@@ -17,6 +20,20 @@ except ImportError:
     from json import dumps, loads
 
 
+def current_player() -> Player:
+    """
+    :return: the Player of the zone the request is for (set by the url value preprocessor in server.py)
+    """
+    return g.player
+
+
+def current_zones() -> ZoneRegistry:
+    """
+    :return: all zones of the server (set by the url value preprocessor in server.py)
+    """
+    return g.zones
+
+
 def jsonify_response(json, resp_code=200):
     return Response(dumps(json), resp_code, mimetype="application/json")
 
@@ -37,6 +54,32 @@ def with_status(json: Optional[dict] = None, resp_code: int = 200, status: Statu
     return jsonify_response(full_json, resp_code)
 
 
+def with_status_raw(json: Optional[dict] = None, raw: Optional[dict] = None, resp_code: int = 200,
+                    status: StatusType = StatusType.OK, headers: Optional[dict] = None):
+    """
+    Like with_status, but the values in `raw` are already serialized JSON and are inserted as-is
+    :param json: json to respond with
+    :param raw: dict of key: serialized JSON value
+    :param resp_code: HTTP status code
+    :param status: StatusType
+    :param headers: additional response headers
+    :return: Response to return in the route
+    """
+    if json is None:
+        json = {}
+
+    body = dumps({**json, **{"status": status}})
+    if raw:
+        fields = ",".join(f"{dumps(key)}:{value}" for key, value in raw.items())
+        body = f"{body[:-1]},{fields}}}"
+
+    response = Response(body, resp_code, mimetype="application/json")
+    for key, value in (headers or {}).items():
+        response.headers[key] = value
+
+    return response
+
+
 async def get_json_from_request(request: Request):
     return loads(await request.get_data())
 
@@ -68,9 +111,47 @@ def dictify_YoutubeAudio(obj: YoutubeAudio) -> dict:
         "video_id": obj.videoid,
         "title": obj.title,
         "length": obj.length,
-        "username": obj.pafy.username,
-        "published": obj.pafy.published,
-        "viewcount": obj.pafy.viewcount,
+        "username": obj.username,
+        "published": obj.published,
+        "viewcount": obj.viewcount,
         "unique_id": obj.unique_id,
-        "thumbnail": obj.thumbnail
+        "thumbnail": obj.thumbnail,
+        "state": obj.state,
+        "source": "local" if obj.is_local else "youtube"
     }
+
+
+# noinspection PyPep8Naming
+def encode_YoutubeAudio(obj: YoutubeAudio) -> str:
+    """
+    Returns the serialized form of dictify_YoutubeAudio, computed once per song (once it is resolved).
+    """
+    if obj.encoded is not None:
+        return obj.encoded
+
+    encoded = dumps(dictify_YoutubeAudio(obj))
+    if obj.is_ready:
+        obj.encoded = encoded
+
+    return encoded
+
+
+def encode_queue(queue: Iterable[YoutubeAudio]) -> str:
+    """
+    Serializes a list of songs by joining their pre-serialized forms.
+    """
+    return f"[{','.join([encode_YoutubeAudio(audio) for audio in queue])}]"
+
+
+def _encode_default(obj):
+    if isinstance(obj, YoutubeAudio):
+        return dictify_YoutubeAudio(obj)
+
+    raise TypeError(f"{type(obj)} is not JSON serializable")
+
+
+def dumps_event(data: dict) -> str:
+    """
+    Serializes player event data, YoutubeAudio objects are converted with dictify_YoutubeAudio.
+    """
+    return dumps(data, default=_encode_default)
@@ -1,12 +1,14 @@
 # coding=utf-8
 import logging
 import os
+import re
 import configparser
 
 log = logging.getLogger(__name__)
 
 config = configparser.ConfigParser()
-config.read("data/settings.ini")
+# Another settings file can be used, e.g. to run several servers from the same directory
+config.read(os.environ.get("SOUNDCUBE_SETTINGS", "data/settings.ini"))
 
 player_c = configparser.ConfigParser()
 player_c.read("data/player.ini")
@@ -21,6 +23,7 @@ if not BACKEND_API_KEY:
     raise RuntimeError("'googleApiKey' is missing in the config file!")
 if not FRONTEND_API_KEY:
     raise RuntimeError("'frontend_googleApiKey' is missing in the config file!")
+YOUTUBE_API_URL = config.get("APIs", "youtube_api_url", fallback="https://www.googleapis.com/youtube/v3")
 
 # Frontend build location
 FRONTEND_BUILD_LOCATION = config.get("Routes", "build_location", fallback=None)
@@ -37,6 +40,95 @@ if PUBLIC_URL in ("0.0.0.0", "localhost", "127.0.0.1"):
 DEFAULT_VOLUME = player_c.getint("Player", "default_volume", fallback=50)
 VOLUME_STEP = player_c.get("Player", "volume_change_step", fallback=5)
 
+# Resolver-related
+RESOLVER_EXECUTOR = config.get("Resolver", "executor", fallback="thread")
+if RESOLVER_EXECUTOR not in ("thread", "process"):
+    raise RuntimeError(f"'executor' should be either 'thread' or 'process', got '{RESOLVER_EXECUTOR}'")
+RESOLVER_MAX_WORKERS = config.getint("Resolver", "max_workers", fallback=4)
+RESOLVER_TIMEOUT = config.getfloat("Resolver", "timeout", fallback=20)
+
+# Metadata cache
+CACHE_LOCATION = config.get("Cache", "location", fallback="data/cache.sqlite")
+CACHE_METADATA_TTL = config.getfloat("Cache", "metadata_ttl", fallback=60 * 60 * 24 * 7)
+CACHE_MAX_ENTRIES = config.getint("Cache", "max_entries", fallback=5000)
+CACHE_STREAM_TTL = config.getfloat("Cache", "stream_ttl", fallback=60 * 60 * 3)
+
+# Prefetching
+PREFETCH_AHEAD = config.getint("Prefetch", "ahead", fallback=2)
+PREFETCH_PREBUFFER = config.getboolean("Prefetch", "prebuffer", fallback=True)
+PREFETCH_REFRESH_HORIZON = config.getfloat("Prefetch", "refresh_horizon", fallback=60 * 60)
+PREFETCH_REFRESH_PER_MINUTE = config.getfloat("Prefetch", "refresh_per_minute", fallback=6)
+
+# Downloaded songs
+AUDIO_CACHE_ENABLED = config.getboolean("AudioCache", "enabled", fallback=False)
+AUDIO_CACHE_LOCATION = config.get("AudioCache", "location", fallback="data/audio")
+AUDIO_CACHE_MAX_SIZE = config.getint("AudioCache", "max_size_mb", fallback=2048) * 2 ** 20
+AUDIO_CACHE_WORKERS = config.getint("AudioCache", "workers", fallback=2)
+
+# Local music library
+LIBRARY_DIRECTORIES = [os.path.expanduser(directory.strip()) for directory
+                       in re.split(r"[,;]", config.get("Library", "directories", fallback=""))
+                       if directory.strip()]
+LIBRARY_LOCATION = config.get("Library", "location", fallback="data/library.sqlite")
+LIBRARY_EXTENSIONS = [extension.strip().lower().lstrip(".") for extension
+                      in config.get("Library", "extensions", fallback="mp3,flac,ogg,opus,m4a,wav,aac").split(",")
+                      if extension.strip()]
+LIBRARY_SCAN_ON_START = config.getboolean("Library", "scan_on_start", fallback=True)
+
+# Queue
+QUEUE_OPERATION_HISTORY = config.getint("Queue", "operation_history", fallback=256)
+QUEUE_SEARCH_HISTORY = config.getint("Queue", "search_history", fallback=1000)
+
+# Queue persistence
+PERSISTENCE_ENABLED = config.getboolean("Persistence", "enabled", fallback=True)
+PERSISTENCE_LOCATION = config.get("Persistence", "location", fallback="data/state")
+PERSISTENCE_SNAPSHOT_INTERVAL = config.getint("Persistence", "snapshot_interval", fallback=1000)
+PERSISTENCE_FSYNC = config.getboolean("Persistence", "fsync", fallback=True)
+PERSISTENCE_POSITION_INTERVAL = config.getfloat("Persistence", "position_interval", fallback=5)
+
+# HTTP audio stream
+STREAMING_ENABLED = config.getboolean("Streaming", "enabled", fallback=False)
+STREAMING_FIFO = config.get("Streaming", "fifo", fallback="data/stream.fifo")
+STREAMING_BITRATE = config.getint("Streaming", "bitrate", fallback=128)
+STREAMING_BUFFER_SIZE = config.getint("Streaming", "buffer_size_kb", fallback=1024) * 2 ** 10
+STREAMING_BURST_SIZE = config.getint("Streaming", "burst_kb", fallback=64) * 2 ** 10
+STREAMING_SLOW_LISTENERS = config.get("Streaming", "slow_listeners", fallback="skip")
+if STREAMING_SLOW_LISTENERS not in ("skip", "drop"):
+    raise RuntimeError(f"'slow_listeners' should be either 'skip' or 'drop', got '{STREAMING_SLOW_LISTENERS}'")
+STREAMING_NAME = config.get("Streaming", "name", fallback="Soundcube")
+
+# Zones (independent players), the first one is the default zone
+ZONE_NAMES = [name.strip() for name in config.get("Zones", "names", fallback="default").split(",") if name.strip()]
+if not ZONE_NAMES:
+    raise RuntimeError("'names' in [Zones] should contain at least one zone")
+for _zone in ZONE_NAMES:
+    if not re.fullmatch(r"[\w-]+", _zone):
+        raise RuntimeError(f"Invalid zone name '{_zone}' (only letters, digits, '_' and '-' are allowed)")
+if len(set(ZONE_NAMES)) != len(ZONE_NAMES):
+    raise RuntimeError("Zone names should be unique")
+
+# Synchronized playback between servers
+SYNC_MODE = config.get("Sync", "mode", fallback="off")
+if SYNC_MODE not in ("off", "leader", "follower"):
+    raise RuntimeError(f"'mode' in [Sync] should be one of: off, leader, follower, got '{SYNC_MODE}'")
+SYNC_ZONE = config.get("Sync", "zone", fallback="") or None
+SYNC_PORT = config.getint("Sync", "port", fallback=5100)
+SYNC_LEADER = config.get("Sync", "leader", fallback="127.0.0.1:5100")
+SYNC_API_URL = config.get("Sync", "api_url", fallback="") or None
+SYNC_INTERVAL = config.getfloat("Sync", "interval", fallback=0.5)
+SYNC_TOLERANCE = config.getfloat("Sync", "tolerance_ms", fallback=50) / 1000
+SYNC_SEEK_THRESHOLD = config.getfloat("Sync", "seek_threshold_ms", fallback=750) / 1000
+SYNC_MAX_RATE_CHANGE = config.getfloat("Sync", "max_rate_change", fallback=0.05)
+SYNC_OUTPUT_DELAY = config.getfloat("Sync", "output_delay_ms", fallback=0) / 1000
+
+# Pushed events
+EVENTS_BUFFER_SIZE = config.getint("Events", "buffer_size", fallback=64)
+EVENTS_KEEPALIVE = config.getfloat("Events", "keepalive", fallback=15)
+
+# Player commands
+COMMANDS_MAX_PENDING = config.getint("Commands", "max_pending", fallback=64)
+COMMANDS_DEBOUNCE_WINDOW = config.getfloat("Commands", "debounce_window", fallback=0.15)
+
 API_ROUTE_PREFIX = config.get("Routes", "api_prefix", fallback="/api/v1")
 
 
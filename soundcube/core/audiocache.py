@@ -0,0 +1,279 @@
+# coding=utf-8
+import logging
+import asyncio
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from http.client import HTTPException, IncompleteRead
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from ..config import AUDIO_CACHE_LOCATION, AUDIO_CACHE_MAX_SIZE, AUDIO_CACHE_WORKERS
+
+log = logging.getLogger(__name__)
+
+COMPLETE_SUFFIX = ".audio"
+PARTIAL_SUFFIX = ".part"
+# Next to partial files, the size of the whole file
+SIZE_SUFFIX = ".size"
+CHUNK_SIZE = 64 * 1024
+REQUEST_TIMEOUT = 20
+
+content_range_regex = re.compile(r"^bytes (\d+)-\d+/(\d+|\*)$")
+
+
+def _read_size(partial_path: str) -> Optional[int]:
+    """
+    :return: total size of the file a partial download belongs to (None if it wasn't recorded)
+    """
+    try:
+        with open(partial_path + SIZE_SUFFIX, "r") as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_size(partial_path: str, size: int):
+    with open(partial_path + SIZE_SUFFIX, "w") as file:
+        file.write(str(size))
+
+
+def _remove_partial(partial_path: str):
+    for path in (partial_path, partial_path + SIZE_SUFFIX):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def download(url: str, partial_path: str, complete_path: str) -> int:
+    """
+    Downloads the url into partial_path (continuing where a previous download stopped, using a Range request)
+    and renames it to complete_path once done. Blocking, runs in the cache's executor.
+
+    The size of the file (Content-Range total or Content-Length) is recorded next to the partial file:
+    a download is only completed if all of it arrived and is only resumed from the same file.
+    :return: how many bytes were already there (0 if it wasn't resumed)
+
+    :raise: OSError: the download failed or is incomplete (HTTPError/URLError are OSErrors)
+    :raise: HTTPException: the server's response was malformed (e.g. BadStatusLine)
+    """
+    offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+
+    request = Request(url)
+    if offset:
+        request.add_header("Range", f"bytes={offset}-")
+
+    try:
+        response = urlopen(request, timeout=REQUEST_TIMEOUT)
+    except HTTPError as e:
+        # 416: the partial file is not a prefix of this file (or already complete), start over
+        if e.code != 416 or not offset:
+            raise
+
+        _remove_partial(partial_path)
+        return download(url, partial_path, complete_path)
+
+    with response:
+        content_range = content_range_regex.match(response.headers.get("Content-Range", ""))
+        if offset and (response.status != 206 or content_range is None or int(content_range.group(1)) != offset):
+            # The server ignored the Range header and is sending the whole file
+            offset = 0
+
+        if offset and content_range.group(2) != "*":
+            total = int(content_range.group(2))
+        elif response.headers.get("Content-Length", "").isdigit():
+            total = offset + int(response.headers["Content-Length"])
+        else:
+            # Unknown, can't be verified
+            total = None
+
+        if offset:
+            expected = _read_size(partial_path)
+            if expected is not None and total is not None and total != expected:
+                # A different file (e.g. another format after the stream url was refreshed), start over
+                log.debug(f"{partial_path} belongs to a different file ({expected} != {total} bytes), restarting")
+                _remove_partial(partial_path)
+                return download(url, partial_path, complete_path)
+        elif total is not None:
+            _write_size(partial_path, total)
+
+        size = offset
+        with open(partial_path, "ab" if offset else "wb") as file:
+            while True:
+                try:
+                    chunk = response.read(CHUNK_SIZE)
+                except IncompleteRead:
+                    # Checked below
+                    break
+                if not chunk:
+                    break
+                file.write(chunk)
+                size += len(chunk)
+
+    # The connection can end early without an error, the partial file is resumed next time
+    if total is not None and size != total:
+        raise OSError(f"incomplete download, got {size} of {total} bytes")
+
+    os.replace(partial_path, complete_path)
+    _remove_partial(partial_path)
+    return offset
+
+
+class AudioCache:
+    """
+    Keeps downloaded songs on disk, so repeated songs don't have to be streamed again
+    (and play fine on flaky connections).
+
+    Songs are downloaded in the background (in a small thread pool), interrupted downloads
+    are resumed with HTTP range requests. The least recently played songs are deleted
+    once the cache is larger than `max_size` bytes.
+    """
+    def __init__(self, location: str = AUDIO_CACHE_LOCATION, max_size: int = AUDIO_CACHE_MAX_SIZE,
+                 workers: int = AUDIO_CACHE_WORKERS):
+        self.location = location
+        self.max_size = max_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audio-cache")
+
+        # videoid: file size, least recently used first
+        self._files: OrderedDict = OrderedDict()
+        self.size = 0
+        # videoid: download in progress
+        self._downloads: Dict[str, asyncio.Future] = {}
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.downloaded = 0
+        self.resumed = 0
+        self.failed = 0
+        self.evicted = 0
+
+        os.makedirs(location, exist_ok=True)
+
+        # Files are touched when they are played, so their modification time is the LRU order
+        entries = []
+        for name in os.listdir(location):
+            if name.endswith(COMPLETE_SUFFIX):
+                stat = os.stat(os.path.join(location, name))
+                entries.append((stat.st_mtime, name[:-len(COMPLETE_SUFFIX)], stat.st_size))
+
+        for _, videoid, size in sorted(entries):
+            self._files[videoid] = size
+            self.size += size
+
+        log.info(f"Audio cache loaded from {location} ({len(self._files)} songs, {self.size // 2 ** 20} MiB)")
+
+    def _path(self, videoid: str, suffix: str = COMPLETE_SUFFIX) -> str:
+        return os.path.join(self.location, videoid + suffix)
+
+    def path_for(self, videoid: str) -> Optional[str]:
+        """
+        Call when the song is about to be played (marks it as recently used).
+        :param videoid: YouTube video id
+        :return: path of the downloaded song or None if it isn't (completely) downloaded
+        """
+        if videoid not in self._files:
+            self.misses += 1
+            return None
+
+        path = self._path(videoid)
+        try:
+            os.utime(path)
+        except OSError:
+            # Removed from outside
+            self.size -= self._files.pop(videoid)
+            self.misses += 1
+            return None
+
+        self._files.move_to_end(videoid)
+        self.hits += 1
+        return path
+
+    def contains(self, videoid: str) -> bool:
+        return videoid in self._files
+
+    def request(self, videoid: str, url: str):
+        """
+        Start downloading the song in the background (if it isn't downloaded or downloading already).
+        :param videoid: YouTube video id
+        :param url: stream url
+        """
+        if videoid in self._files or videoid in self._downloads:
+            return
+
+        future = asyncio.ensure_future(self._download(videoid, url))
+        self._downloads[videoid] = future
+        future.add_done_callback(lambda _: self._downloads.pop(videoid, None))
+
+    async def _download(self, videoid: str, url: str):
+        loop = asyncio.get_event_loop()
+        complete_path = self._path(videoid)
+
+        try:
+            resumed_from = await loop.run_in_executor(self._executor, download, url,
+                                                      self._path(videoid, PARTIAL_SUFFIX), complete_path)
+            size = os.path.getsize(complete_path)
+        except (OSError, HTTPException) as e:
+            # The partial file is kept and resumed next time (e.g. with a refreshed stream url)
+            self.failed += 1
+            log.warning(f"Downloading {videoid} failed: {e}")
+            return
+
+        self.downloaded += 1
+        if resumed_from:
+            self.resumed += 1
+
+        self._files[videoid] = size
+        self.size += size
+        log.debug(f"Downloaded {videoid} ({size // 1024} KiB, resumed at byte {resumed_from})")
+
+        self._evict(keep=videoid)
+
+    def _evict(self, keep: str):
+        """
+        Deletes the least recently used songs until the cache fits into max_size.
+        """
+        for videoid in list(self._files.keys()):
+            if self.size <= self.max_size:
+                break
+            if videoid == keep:
+                continue
+
+            try:
+                os.remove(self._path(videoid))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # e.g. still opened by VLC on Windows
+                log.debug(f"Could not evict {videoid}: {e}")
+                continue
+
+            self.size -= self._files.pop(videoid)
+            self.evicted += 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly cache statistics
+        """
+        return {
+            "songs": len(self._files),
+            "size": self.size,
+            "max_size": self.max_size,
+            "downloading": len(self._downloads),
+            "hits": self.hits,
+            "misses": self.misses,
+            "downloaded": self.downloaded,
+            "resumed": self.resumed,
+            "failed": self.failed,
+            "evicted": self.evicted
+        }
+
+    def shutdown(self):
+        """
+        Stops the executor, interrupted downloads are resumed on the next start.
+        """
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,188 @@
+# coding=utf-8
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from .youtube import YoutubeAudio, VideoInfo
+
+from ..config import CACHE_LOCATION, CACHE_METADATA_TTL, CACHE_MAX_ENTRIES
+
+log = logging.getLogger(__name__)
+
+METADATA_FIELDS = ("title", "length", "thumbnail", "username", "published", "viewcount")
+
+
+class MetadataCache:
+    """
+    Persistent (SQLite) cache of YouTube video metadata, keyed by video id.
+
+    Metadata expires after `metadata_ttl` seconds and the least recently used entries are evicted
+    once there are more than `max_entries` of them.
+    Stream urls are kept in a separate table, since they expire much sooner.
+    """
+    def __init__(self, location: str = CACHE_LOCATION, metadata_ttl: float = CACHE_METADATA_TTL,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.location = location
+        self.metadata_ttl = metadata_ttl
+        self.max_entries = max_entries
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.stream_hits = 0
+        self.stream_misses = 0
+
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(location)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (
+                videoid TEXT PRIMARY KEY,
+                title TEXT,
+                length INTEGER,
+                thumbnail TEXT,
+                username TEXT,
+                published TEXT,
+                viewcount INTEGER,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS metadata_accessed_at ON metadata (accessed_at);
+
+            CREATE TABLE IF NOT EXISTS streams (
+                videoid TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+
+        self._size = self._db.execute("SELECT COUNT(*) FROM metadata").fetchone()[0]
+        log.info(f"Metadata cache loaded from {location} ({self._size} entries)")
+
+    def get_metadata(self, videoid: str) -> Optional[VideoInfo]:
+        """
+        :param videoid: YouTube video id
+        :return: VideoInfo or None if not cached (or expired)
+        """
+        now = time.time()
+        row = self._db.execute(
+            f"SELECT {', '.join(METADATA_FIELDS)}, fetched_at FROM metadata WHERE videoid = ?", (videoid,)
+        ).fetchone()
+
+        if row is None or row[-1] + self.metadata_ttl < now:
+            self.misses += 1
+            return None
+
+        self._db.execute("UPDATE metadata SET accessed_at = ? WHERE videoid = ?", (now, videoid))
+        self._db.commit()
+
+        self.hits += 1
+        return VideoInfo(videoid, *row[:-1])
+
+    def get_stream(self, videoid: str) -> Optional[Tuple[str, float]]:
+        """
+        :param videoid: YouTube video id
+        :return: tuple of the cached stream url and its expiry time or None if not cached (or expired)
+        """
+        row = self._db.execute("SELECT url, expires_at FROM streams WHERE videoid = ?", (videoid,)).fetchone()
+
+        if row is None or row[1] < time.time():
+            self.stream_misses += 1
+            return None
+
+        self.stream_hits += 1
+        return row
+
+    def get_audio(self, videoid: str) -> Optional[YoutubeAudio]:
+        """
+        Builds a new YoutubeAudio if the metadata is cached.
+        The stream url is only included if it is cached and still valid, otherwise it is fetched lazily.
+        :param videoid: YouTube video id
+        :return: YoutubeAudio or None
+        """
+        info = self.get_metadata(videoid)
+        if info is None:
+            return None
+
+        stream = self.get_stream(videoid)
+        if stream is None:
+            return YoutubeAudio(info, None, 0)
+
+        return YoutubeAudio(info, *stream)
+
+    def put(self, info: VideoInfo, stream_url: str, stream_expires: float):
+        """
+        Store (or refresh) the metadata and stream url of a resolved video.
+        :param info: VideoInfo
+        :param stream_url: audio stream url
+        :param stream_expires: unix time at which the stream url expires
+        """
+        self._put_metadata(info)
+
+        self._db.execute("INSERT OR REPLACE INTO streams VALUES (?, ?, ?)",
+                         (info.videoid, stream_url, stream_expires))
+        self._db.commit()
+
+    def put_metadata(self, info: VideoInfo):
+        """
+        Store (or refresh) only the metadata of a video (e.g. from the YouTube Data API).
+        :param info: VideoInfo
+        """
+        self._put_metadata(info)
+        self._db.commit()
+
+    def _put_metadata(self, info: VideoInfo):
+        now = time.time()
+        values = tuple(getattr(info, field) for field in METADATA_FIELDS)
+
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (info.videoid, *values, now, now)
+        )
+        if cursor.rowcount:
+            self._size += 1
+        else:
+            self._db.execute(
+                f"UPDATE metadata SET {', '.join(f'{field} = ?' for field in METADATA_FIELDS)}, "
+                f"fetched_at = ?, accessed_at = ? WHERE videoid = ?",
+                (*values, now, now, info.videoid)
+            )
+
+        if self._size > self.max_entries:
+            self._evict(self._size - self.max_entries)
+
+    def _evict(self, amount: int):
+        """
+        Removes the least recently used entries (and their stream urls).
+        :param amount: how many entries to remove
+        """
+        self._db.execute(
+            "DELETE FROM metadata WHERE videoid IN (SELECT videoid FROM metadata ORDER BY accessed_at LIMIT ?)",
+            (amount,)
+        )
+        self._db.execute("DELETE FROM streams WHERE videoid NOT IN (SELECT videoid FROM metadata) OR expires_at < ?",
+                         (time.time(),))
+        self._size -= amount
+
+        log.debug(f"Evicted {amount} entries from the metadata cache")
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly cache statistics
+        """
+        return {
+            "entries": self._size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stream_hits": self.stream_hits,
+            "stream_misses": self.stream_misses
+        }
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,211 @@
+# coding=utf-8
+#################
+# Command executor
+# Runs state-changing Player operations one at a time, in the order they were submitted
+#################
+import logging
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Hashable, List, Optional
+
+from .exceptions import CommandQueueFull
+
+from ..config import COMMANDS_MAX_PENDING, COMMANDS_DEBOUNCE_WINDOW
+
+log = logging.getLogger(__name__)
+
+
+class Command:
+    __slots__ = ("func", "args", "key", "futures")
+
+    def __init__(self, func: Callable, args: tuple, key: Optional[Hashable]):
+        self.func = func
+        self.args = args
+        self.key = key
+        # Futures of every submission this command stands for (more than one if coalesced)
+        self.futures: List[asyncio.Future] = []
+
+
+class CommandExecutor:
+    """
+    Single consumer in front of the Player: commands are executed strictly one after another,
+    so a command that awaits (resolving, loading a stream, ...) can't be interleaved with another one.
+
+    The amount of waiting commands is bounded (CommandQueueFull is raised instead of queueing more)
+    and consecutive commands with the same key are coalesced: only the newest one is executed
+    and all of their submitters get its result.
+
+    Commands must not submit (and wait for) other commands, that would dead-lock.
+    """
+    def __init__(self, max_pending: int = COMMANDS_MAX_PENDING):
+        self.max_pending = max_pending
+
+        self._pending: Deque[Command] = deque()
+        # Created on the first submission, so they belong to the loop that is actually running
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.executed = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def submit(self, func: Callable, *args, key: Optional[Hashable] = None, force: bool = False) -> asyncio.Future:
+        """
+        Queue a command.
+        :param func: function or coroutine function to execute
+        :param args: arguments to call it with
+        :param key: commands with the same key replace each other while waiting (e.g. "volume")
+        :param force: queue even if the limit is reached (for internal commands that can't be refused)
+        :return: Future with the command's result
+
+        :raise: CommandQueueFull: too many commands are waiting
+        """
+        future = asyncio.get_event_loop().create_future()
+
+        tail = self._pending[-1] if self._pending else None
+        if key is not None and tail is not None and tail.key == key:
+            # The waiting command is outdated, run the newer one in its place
+            tail.func, tail.args = func, args
+            tail.futures.append(future)
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.max_pending and not force:
+                self.rejected += 1
+                raise CommandQueueFull(f"{len(self._pending)} commands are already waiting")
+
+            command = Command(func, args, key)
+            command.futures.append(future)
+            self._pending.append(command)
+
+        self._ensure_running()
+        self._wakeup.set()
+
+        return future
+
+    async def run(self, func: Callable, *args, key: Optional[Hashable] = None) -> Any:
+        """
+        Queue a command and wait for its result.
+
+        :raise: CommandQueueFull: too many commands are waiting
+        """
+        return await self.submit(func, *args, key=key)
+
+    def schedule(self, func: Callable, *args):
+        """
+        Queue an internal command without waiting for it (always accepted), failures are only logged.
+        """
+        self.submit(func, *args, force=True).add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.error("Scheduled command failed", exc_info=future.exception())
+
+    def _ensure_running(self):
+        if self._task is not None and not self._task.done():
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._consume())
+
+    async def _consume(self):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            command = self._pending.popleft()
+
+            try:
+                result = command.func(*command.args)
+                if asyncio.iscoroutine(result):
+                    result = await result
+            except asyncio.CancelledError:
+                for future in command.futures:
+                    future.cancel()
+                raise
+            except Exception as e:
+                for future in command.futures:
+                    # The submitter might have given up waiting (e.g. the client disconnected)
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for future in command.futures:
+                    if not future.done():
+                        future.set_result(result)
+
+            self.executed += 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly command statistics
+        """
+        return {
+            "pending": len(self._pending),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected
+        }
+
+
+class Debouncer:
+    """
+    Limits how often a high-frequency update (dragging the volume or seek slider) is applied:
+    the first update is applied right away, later ones within `window` seconds only replace the pending value
+    and the latest one is applied when the window ends. Intermediate values are dropped.
+    """
+    def __init__(self, executor: CommandExecutor, func: Callable, key: Hashable,
+                 window: float = COMMANDS_DEBOUNCE_WINDOW):
+        self._executor = executor
+        self._func = func
+        self.key = key
+        self.window = window
+
+        self._pending: Optional[tuple] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        self.received = 0
+        self.applied = 0
+
+    def push(self, *args):
+        """
+        Submit a new value (arguments for the function), returns immediately.
+        """
+        self.received += 1
+
+        if self._timer is None:
+            self._apply(args)
+        else:
+            # Replaces (drops) the previous pending value
+            self._pending = args
+
+    def _apply(self, args: tuple):
+        self.applied += 1
+        self._executor.submit(self._func, *args, key=self.key, force=True).add_done_callback(self._log_failure)
+
+        if self.window > 0:
+            self._timer = asyncio.get_event_loop().call_later(self.window, self._window_ended)
+
+    def _window_ended(self):
+        self._timer = None
+
+        if self._pending is not None:
+            args, self._pending = self._pending, None
+            self._apply(args)
+
+    def _log_failure(self, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            log.warning(f"Debounced '{self.key}' update failed: {future.exception()}")
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly debouncing statistics
+        """
+        return {
+            "received": self.received,
+            "applied": self.applied,
+            "dropped": self.received - self.applied - (1 if self._pending is not None else 0)
+        }
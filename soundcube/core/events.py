@@ -0,0 +1,128 @@
+# coding=utf-8
+import logging
+import asyncio
+from collections import OrderedDict
+from typing import Callable, List, Set, Optional
+
+from ..config import EVENTS_BUFFER_SIZE
+
+log = logging.getLogger(__name__)
+
+# Events that only matter in their latest state: a subscriber that hasn't
+# received them yet only gets the newest one of each group
+COALESCED_EVENTS = {
+    "volume": "volume",
+    "seek": "seek",
+    "playing": "state",
+    "paused": "state",
+    "stopped": "state",
+}
+
+
+def format_sse(version: int, event: str, data: str) -> bytes:
+    """
+    Formats an event for a text/event-stream response.
+    """
+    return f"id: {version}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class Subscription:
+    """
+    A single client's buffer of pending events.
+    It is bounded: if the client can't keep up, its pending events are replaced by a single 'resync' event.
+    """
+    __slots__ = ("_hub", "_pending", "_wakeup", "max_size", "overflows")
+
+    def __init__(self, hub: "EventHub", max_size: int):
+        self._hub = hub
+        # key: encoded event
+        self._pending: OrderedDict = OrderedDict()
+        self._wakeup = asyncio.Event()
+
+        self.max_size = max_size
+        self.overflows = 0
+
+    def push(self, key, payload: bytes):
+        # Replaces an older pending event with the same key (and moves it to the end)
+        self._pending.pop(key, None)
+        self._pending[key] = payload
+
+        if len(self._pending) > self.max_size:
+            self.overflows += 1
+            self._pending.clear()
+            self._pending["resync"] = self._hub.encode("resync", {"version": self._hub.version})
+
+        self._wakeup.set()
+
+    async def get(self, timeout: Optional[float] = None) -> List[bytes]:
+        """
+        Waits for events.
+        :param timeout: seconds to wait for
+        :return: list of encoded events (empty if the timeout ran out)
+        """
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        payloads = list(self._pending.values())
+        self._pending.clear()
+        self._wakeup.clear()
+
+        return payloads
+
+
+class EventHub:
+    """
+    Fans out versioned player events to any number of subscribers.
+    Every event is serialized once, subscribers only receive the encoded bytes.
+    """
+    def __init__(self, serializer: Callable[[dict], str], buffer_size: int = EVENTS_BUFFER_SIZE):
+        self._serializer = serializer
+        self.buffer_size = buffer_size
+
+        # Incremented with every event
+        self.version = 0
+        self._subscribers: Set[Subscription] = set()
+
+    def encode(self, event: str, data: dict) -> bytes:
+        return format_sse(self.version, event, self._serializer({**data, "version": self.version}))
+
+    def publish(self, event: str, data: dict):
+        """
+        Send an event to all subscribers, can be registered directly with Player.add_listener.
+        :param event: event name
+        :param data: JSON-friendly data
+        """
+        self.version += 1
+        if not self._subscribers:
+            return
+
+        payload = self.encode(event, data)
+        key = COALESCED_EVENTS.get(event, self.version)
+
+        for subscription in self._subscribers:
+            subscription.push(key, payload)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self, self.buffer_size)
+        self._subscribers.add(subscription)
+
+        log.debug(f"New event subscriber ({len(self._subscribers)} total)")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+        log.debug(f"Event subscriber left ({len(self._subscribers)} total)")
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly event statistics
+        """
+        return {
+            "version": self.version,
+            "subscribers": len(self._subscribers),
+            "overflows": sum(subscription.overflows for subscription in self._subscribers)
+        }
@@ -53,9 +53,40 @@ class QueueException(SoundcubeException):
     pass
 
 
+# LIBRARY EXCEPTIONS
+class LibraryException(SoundcubeException):
+    """
+    Raised for local library-related problems (such as an unknown track)
+    """
+    pass
+
+
 # USER EXCEPTIONS
 class YoutubeException(SoundcubeException):
     """
     Raised for YouTube-related problems (such as an invalid link)
     """
     pass
+
+
+class ResolveTimeout(YoutubeException):
+    """
+    Raised when resolving a YouTube url takes longer than allowed
+    """
+    pass
+
+
+# COMMAND EXCEPTIONS
+class CommandQueueFull(SoundcubeException):
+    """
+    Raised when too many player commands are waiting to be executed
+    """
+    pass
+
+
+# ZONE EXCEPTIONS
+class UnknownZone(SoundcubeException):
+    """
+    Raised when a request addresses a zone that doesn't exist
+    """
+    pass
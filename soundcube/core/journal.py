@@ -0,0 +1,332 @@
+# coding=utf-8
+#################
+# Queue journal
+# Keeps the queue, current song, play position and volume on disk, so they survive restarts
+#################
+import logging
+import asyncio
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from .youtube import YoutubeAudio, VideoInfo, AudioState
+from .library import LocalAudio
+
+from ..config import PERSISTENCE_LOCATION, PERSISTENCE_SNAPSHOT_INTERVAL, PERSISTENCE_FSYNC
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = "snapshot.json"
+JOURNAL_NAME = "journal.log"
+# Bumped when the format changes, older files are ignored
+FORMAT_VERSION = 1
+
+
+def encode_song(audio: YoutubeAudio) -> dict:
+    """
+    :return: JSON-friendly representation of the song, without its stream url (it expires anyway)
+    """
+    song = {
+        "unique_id": audio.unique_id,
+        "state": audio.state,
+        "info": [getattr(audio.info, attr) for attr in VideoInfo.__slots__]
+    }
+    if audio.is_local:
+        song["track_id"] = audio.track_id
+        song["path"] = audio.path
+
+    return song
+
+
+def decode_song(song: dict) -> YoutubeAudio:
+    """
+    Recreates a song with its original unique_id. Stream urls are fetched lazily (before the song is played),
+    songs that were still being resolved come back as placeholders.
+    """
+    info = VideoInfo(*song["info"])
+
+    if "track_id" in song:
+        audio = LocalAudio(song["track_id"], song["path"], info)
+    elif song["state"] == AudioState.READY:
+        # Expired right away, refreshed when needed
+        audio = YoutubeAudio(info, None, 0)
+    else:
+        audio = YoutubeAudio.placeholder(info.videoid)
+
+    audio.unique_id = song["unique_id"]
+    return audio
+
+
+def _fsync_directory(path: str):
+    """
+    Makes a rename in the directory durable (not possible on every platform, e.g. Windows).
+    """
+    try:
+        descriptor = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+class QueueState:
+    """
+    What is restored on startup.
+    """
+    __slots__ = ("songs", "current_index", "volume", "position")
+
+    def __init__(self, songs: List[dict] = None, current_index: Optional[int] = None,
+                 volume: Optional[int] = None, position: Optional[list] = None):
+        self.songs = songs or []
+        self.current_index = current_index
+        self.volume = volume
+        # [unique_id, seconds] of the last known play position
+        self.position = position
+
+
+class QueueJournal:
+    """
+    Append-only journal of queue operations (and volume/position changes) plus a compacted snapshot.
+
+    Every change is appended to the journal as a JSON line. Lines are written (and fsynced) in groups,
+    once per event loop iteration, so bursts (e.g. a playlist page) cost a single write.
+    After `snapshot_interval` lines the whole state is written to a new snapshot (atomically replacing
+    the old one) and the journal is truncated. On startup the snapshot is loaded and the journal replayed on top.
+
+    Every line carries a sequence number ('seq') and the snapshot the last one it contains, so lines that are
+    already in the snapshot are skipped (e.g. after a crash between replacing the snapshot and truncating the journal).
+    """
+    def __init__(self, location: str = PERSISTENCE_LOCATION, snapshot_interval: int = PERSISTENCE_SNAPSHOT_INTERVAL,
+                 fsync: bool = PERSISTENCE_FSYNC):
+        self.location = location
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+
+        os.makedirs(location, exist_ok=True)
+        self._snapshot_path = os.path.join(location, SNAPSHOT_NAME)
+        self._journal_path = os.path.join(location, JOURNAL_NAME)
+
+        self._file = None
+        self._buffer: List[str] = []
+        self._flush_scheduled = False
+        # Lines since the last snapshot
+        self._lines = 0
+        # Sequence number of the last record (continued from the files in load)
+        self._sequence = 0
+        # Returns the current state, set by the Player
+        self.state_source: Optional[Callable[[], QueueState]] = None
+
+        self.snapshots = 0
+
+    def load(self) -> Optional[QueueState]:
+        """
+        Reads the snapshot and replays the journal lines that came after it on top.
+        An incomplete last line (the server was killed while writing it) is cut off the journal.
+        :return: the last persisted state or None if there is none
+        """
+        state = None
+        # Lines up to this sequence number are in the snapshot
+        snapshot_sequence = 0
+
+        try:
+            with open(self._snapshot_path, "r", encoding="utf-8") as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log.warning(f"Could not read the queue snapshot: {e}")
+        else:
+            if snapshot.get("format") == FORMAT_VERSION:
+                state = QueueState(snapshot["songs"], snapshot["current_index"],
+                                   snapshot["volume"], snapshot["position"])
+                snapshot_sequence = snapshot.get("seq", 0)
+
+        self._sequence = snapshot_sequence
+
+        try:
+            with open(self._journal_path, "rb") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return state
+
+        if not lines:
+            return state
+        if state is None:
+            state = QueueState()
+
+        # unique_id: song, for updates
+        songs_by_id = {song["unique_id"]: song for song in state.songs}
+
+        replayed, skipped, offset = 0, 0, 0
+        for line in lines:
+            try:
+                record = json.loads(line.decode("utf-8"))
+                sequence = record.get("seq")
+                # Journals of older versions have no sequence numbers, all of their lines come after the snapshot
+                if sequence is not None and sequence <= snapshot_sequence:
+                    skipped += 1
+                else:
+                    self._apply(state, songs_by_id, record)
+                    replayed += 1
+                    self._sequence = max(self._sequence, sequence or 0)
+            except (ValueError, KeyError, IndexError) as e:
+                # The last line might be incomplete if the server was killed while writing it,
+                # it is cut off so new lines don't end up behind it
+                log.warning(f"Stopped replaying the queue journal at line {replayed + skipped + 1}: {e}")
+                self._truncate(offset)
+                break
+            offset += len(line)
+
+        log.info(f"Replayed {replayed} queue journal entries ({skipped} were already in the snapshot)")
+        return state
+
+    def _truncate(self, size: int):
+        try:
+            with open(self._journal_path, "r+b") as file:
+                file.truncate(size)
+                file.flush()
+                os.fsync(file.fileno())
+        except OSError as e:
+            log.warning(f"Could not truncate the queue journal: {e}")
+
+    @staticmethod
+    def _apply(state: QueueState, songs_by_id: Dict[int, dict], record: dict):
+        op = record["op"]
+        songs = state.songs
+
+        if op == "add":
+            songs.insert(record["position"], record["song"])
+            songs_by_id[record["song"]["unique_id"]] = record["song"]
+        elif op == "remove":
+            del songs[record["position"]]
+        elif op == "move":
+            songs.insert(record["new_position"], songs.pop(record["position"]))
+        elif op == "current":
+            state.current_index = record["index"]
+        elif op == "update":
+            # Updated in place, the same dict is in the list
+            song = songs_by_id.get(record["song"]["unique_id"])
+            if song is not None:
+                song.update(record["song"])
+        elif op == "volume":
+            state.volume = record["volume"]
+        elif op == "position":
+            state.position = [record["unique_id"], record["time"]]
+        else:
+            raise ValueError(f"unknown operation '{op}'")
+
+    def record_queue_operation(self, operation: dict):
+        """
+        Journal a PlayerQueue operation (see PlayerQueue.on_operation).
+        """
+        if "song" in operation:
+            operation = {**operation, "song": encode_song(operation["song"])}
+
+        self.write(operation)
+
+    def write(self, record: dict):
+        """
+        Append a record to the journal (written at the end of the current event loop iteration).
+        """
+        self._sequence += 1
+        self._buffer.append(json.dumps({**record, "seq": self._sequence}, separators=(",", ":")) + "\n")
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside of the event loop (e.g. during startup)
+            self._flush()
+            return
+
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if not self._buffer:
+            return
+
+        self._lines += len(self._buffer)
+        # The snapshot contains everything that is buffered
+        if self._lines >= self.snapshot_interval and self.state_source is not None and self.snapshot():
+            return
+
+        try:
+            if self._file is None:
+                self._file = open(self._journal_path, "a", encoding="utf-8")
+
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except OSError as e:
+            log.warning(f"Could not write to the queue journal: {e}")
+        finally:
+            self._buffer.clear()
+
+    def snapshot(self) -> bool:
+        """
+        Writes the whole current state to the snapshot and truncates the journal.
+        :return: bool indicating if the snapshot was written
+        """
+        state = self.state_source()
+        snapshot = {
+            "format": FORMAT_VERSION,
+            # Everything written so far (including the buffer) is in the state
+            "seq": self._sequence,
+            "time": time.time(),
+            "songs": state.songs,
+            "current_index": state.current_index,
+            "volume": state.volume,
+            "position": state.position
+        }
+
+        temporary_path = self._snapshot_path + ".tmp"
+        try:
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(snapshot, file, separators=(",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporary_path, self._snapshot_path)
+            _fsync_directory(self.location)
+
+            # Everything in the journal is in the snapshot now (lines left behind by a crash are skipped by 'seq')
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self._journal_path, "w", encoding="utf-8")
+        except OSError as e:
+            log.warning(f"Could not write the queue snapshot: {e}")
+            return False
+
+        self._buffer.clear()
+        self._lines = 0
+        self.snapshots += 1
+        log.debug(f"Wrote a queue snapshot ({len(state.songs)} songs)")
+        return True
+
+    def close(self):
+        """
+        Writes a final snapshot, so the next start doesn't have to replay anything.
+        """
+        if self.state_source is not None:
+            self.snapshot()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly journal statistics
+        """
+        return {
+            "lines": self._lines,
+            "snapshots": self.snapshots
+        }
@@ -0,0 +1,306 @@
+# coding=utf-8
+#################
+# Local music library
+# Files from the configured directories, indexed in SQLite
+#################
+import logging
+import asyncio
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+import vlc
+
+from .youtube import YoutubeAudio, VideoInfo
+from .exceptions import LibraryException
+from .utilities import resolve_time
+
+from ..config import LIBRARY_LOCATION, LIBRARY_DIRECTORIES, LIBRARY_EXTENSIONS
+
+log = logging.getLogger(__name__)
+
+try:
+    import mutagen
+except ImportError:
+    log.info("'mutagen' is not available, falling back to VLC for reading tags.")
+    mutagen = None
+
+# Rows are committed in batches while scanning
+SCAN_BATCH = 500
+
+TRACK_FIELDS = ("id", "path", "title", "artist", "album", "length")
+
+# LIKE wildcards (and the escape character itself)
+like_escape_regex = re.compile(r"[\\%_]")
+
+
+def _read_tags_mutagen(path: str) -> Tuple[Optional[str], Optional[str], Optional[str], int]:
+    file = mutagen.File(path, easy=True)
+    if file is None:
+        raise ValueError("unsupported format")
+
+    tags = file.tags or {}
+
+    def first(key: str) -> Optional[str]:
+        values = tags.get(key)
+        return values[0] if values else None
+
+    length = int(file.info.length) if getattr(file, "info", None) is not None else 0
+    return first("title"), first("artist"), first("album"), length
+
+
+def _read_tags_vlc(instance: vlc.Instance, path: str) -> Tuple[Optional[str], Optional[str], Optional[str], int]:
+    media: vlc.Media = instance.media_new_path(path)
+    try:
+        # Synchronous parsing of a local file
+        media.parse()
+
+        duration = media.get_duration()
+        return (media.get_meta(vlc.Meta.Title), media.get_meta(vlc.Meta.Artist), media.get_meta(vlc.Meta.Album),
+                duration // 1000 if duration > 0 else 0)
+    finally:
+        media.release()
+
+
+def scan_directories(location: str, directories: Iterable[str], extensions: Iterable[str]) -> dict:
+    """
+    Incrementally (re)indexes the directories: only new files and files whose modification time or size
+    changed are read, files that no longer exist are removed. Blocking, runs in the library's executor.
+    :param location: location of the SQLite index
+    :param directories: directories to scan (recursively)
+    :param extensions: lowercase file extensions to include (without the dot)
+    :return: JSON-friendly scan statistics
+    """
+    t_start = time.time()
+    extensions = {f".{extension}" for extension in extensions}
+    # VLC is only needed if mutagen isn't installed
+    instance = vlc.Instance("--quiet") if mutagen is None else None
+
+    # Separate connection, sqlite3 connections can't be shared between threads
+    db = sqlite3.connect(location)
+    known = {path: (track_id, mtime, size) for track_id, path, mtime, size
+             in db.execute("SELECT id, path, mtime, size FROM tracks")}
+
+    seen = set()
+    added, updated, unchanged, failed = 0, 0, 0, 0
+    pending = 0
+
+    def walk(directory: str):
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            log.warning(f"Could not scan {directory}: {e}")
+            return
+
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk(entry.path)
+            elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+                yield entry
+
+    for directory in directories:
+        for entry in walk(os.path.abspath(directory)):
+            seen.add(entry.path)
+            stat = entry.stat()
+
+            existing = known.get(entry.path)
+            if existing is not None and existing[1] == stat.st_mtime and existing[2] == stat.st_size:
+                unchanged += 1
+                continue
+
+            try:
+                if mutagen is not None:
+                    title, artist, album, length = _read_tags_mutagen(entry.path)
+                else:
+                    title, artist, album, length = _read_tags_vlc(instance, entry.path)
+            except Exception as e:
+                log.debug(f"Could not read tags of {entry.path}: {e}")
+                failed += 1
+                title, artist, album, length = None, None, None, 0
+
+            title = title or os.path.splitext(entry.name)[0]
+            search = " ".join(part for part in (title, artist, album, entry.name) if part).lower()
+            values = (title, artist, album, length, search, stat.st_mtime, stat.st_size)
+
+            if existing is None:
+                db.execute("INSERT INTO tracks (title, artist, album, length, search, mtime, size, path) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (*values, entry.path))
+                added += 1
+            else:
+                db.execute("UPDATE tracks SET title = ?, artist = ?, album = ?, length = ?, search = ?, "
+                           "mtime = ?, size = ? WHERE id = ?", (*values, existing[0]))
+                updated += 1
+
+            pending += 1
+            if pending >= SCAN_BATCH:
+                db.commit()
+                pending = 0
+
+    removed = [(track_id,) for path, (track_id, _, _) in known.items() if path not in seen]
+    db.executemany("DELETE FROM tracks WHERE id = ?", removed)
+    db.commit()
+    db.close()
+
+    if instance is not None:
+        instance.release()
+
+    return {
+        "added": added,
+        "updated": updated,
+        "unchanged": unchanged,
+        "removed": len(removed),
+        "unreadable": failed,
+        "seconds": round(time.time() - t_start, 2)
+    }
+
+
+class LocalAudio(YoutubeAudio):
+    """
+    A queued local file. Behaves like a YoutubeAudio whose stream url is the file path and never expires.
+    """
+    __slots__ = ("track_id",)
+    is_local = True
+
+    def __init__(self, track_id: int, path: str, info: VideoInfo):
+        """
+        :param track_id: id of the track in the library
+        :param path: path of the file
+        :param info: VideoInfo built from the file's tags (the username is the artist)
+        """
+        super().__init__(info, path, float("inf"))
+        self.track_id = track_id
+
+    @property
+    def path(self) -> str:
+        return self.stream_url
+
+    def __repr__(self):
+        return f"<LocalAudio '{self.path}',{resolve_time(self.length)}>"
+
+
+class Library:
+    """
+    Index of local music files in the configured directories (tags, durations) in SQLite.
+    Scanning happens in the background and is incremental, see scan_directories.
+    """
+    def __init__(self, directories: List[str] = LIBRARY_DIRECTORIES, location: str = LIBRARY_LOCATION,
+                 extensions: List[str] = LIBRARY_EXTENSIONS):
+        self.directories = directories
+        self.location = location
+        self.extensions = extensions
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="library")
+        self._scan: Optional[asyncio.Future] = None
+        self.last_scan: Optional[dict] = None
+
+        directory = os.path.dirname(location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(location)
+        # Lets searches read while a scan is writing
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL UNIQUE,
+                title TEXT,
+                artist TEXT,
+                album TEXT,
+                length INTEGER NOT NULL,
+                -- lowercase title, artist, album and file name
+                search TEXT NOT NULL,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    @property
+    def scanning(self) -> bool:
+        return self._scan is not None and not self._scan.done()
+
+    def scan(self) -> bool:
+        """
+        Start a background scan of the library directories.
+        :return: False if a scan is already running
+        """
+        if self.scanning:
+            return False
+
+        self._scan = asyncio.ensure_future(self._run_scan())
+        return True
+
+    async def _run_scan(self):
+        log.info(f"Scanning library: {', '.join(self.directories)}")
+        loop = asyncio.get_event_loop()
+
+        try:
+            self.last_scan = await loop.run_in_executor(self._executor, scan_directories,
+                                                        self.location, self.directories, self.extensions)
+        except (OSError, sqlite3.Error):
+            log.exception("Library scan failed")
+            return
+
+        log.info(f"Library scan done: {self.last_scan}")
+
+    def search(self, query: str, offset: int = 0, limit: int = 50) -> Tuple[int, List[dict]]:
+        """
+        Case-insensitive search in titles, artists, albums and file names (every word has to match).
+        :param query: search words
+        :param offset: how many results to skip
+        :param limit: maximum amount of results
+        :return: tuple of the total amount of results and the requested page of tracks
+        """
+        patterns = ["%" + like_escape_regex.sub(r"\\\g<0>", word) + "%" for word in query.lower().split()]
+        where = " AND ".join(["search LIKE ? ESCAPE '\\'"] * len(patterns)) or "1"
+
+        total = self._db.execute(f"SELECT COUNT(*) FROM tracks WHERE {where}", patterns).fetchone()[0]
+        rows = self._db.execute(
+            f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks WHERE {where} ORDER BY artist, album, title LIMIT ? OFFSET ?",
+            (*patterns, limit, offset)
+        ).fetchall()
+
+        return total, [self._track(row) for row in rows]
+
+    @staticmethod
+    def _track(row: tuple) -> dict:
+        track = dict(zip(TRACK_FIELDS, row))
+        track["filename"] = os.path.basename(track.pop("path"))
+        return track
+
+    def get_audio(self, track_id: int) -> LocalAudio:
+        """
+        :param track_id: id of the track
+        :return: new LocalAudio for queueing
+
+        :raise: LibraryException: no such track (or the file no longer exists)
+        """
+        row = self._db.execute(f"SELECT {', '.join(TRACK_FIELDS)} FROM tracks WHERE id = ?", (track_id,)).fetchone()
+        if row is None:
+            raise LibraryException("no such track")
+
+        track_id, path, title, artist, album, length = row
+        if not os.path.isfile(path):
+            raise LibraryException("the file no longer exists")
+
+        info = VideoInfo(f"local-{track_id}", title, length, None, artist, None, None)
+        return LocalAudio(track_id, path, info)
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly library statistics
+        """
+        return {
+            "tracks": self._db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0],
+            "scanning": self.scanning,
+            "last_scan": self.last_scan
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self._db.close()
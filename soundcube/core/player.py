@@ -2,33 +2,133 @@
 import vlc
 import logging
 import asyncio
+import os
 import time
 
-from typing import Union
+from typing import Union, Callable, List, Optional
 
-from .youtube import YoutubeAudio
-from .exceptions import PlayerException, SoundcubeException, QueueException, YoutubeException, OutsideTimeBounds
-from .utilities import resolve_time, clamp, Singleton
+from .youtube import YoutubeAudio, AudioState, get_video_id
+from .youtube_api import fetch_playlist_page, fetch_videos_info
+from .exceptions import PlayerException, SoundcubeException, QueueException, OutsideTimeBounds, YoutubeException, \
+    LibraryException
+from .utilities import resolve_time, clamp
 from .queue import PlayerQueue
-
-from ..config import DEFAULT_VOLUME
+from .resolver import Resolver
+from .prefetch import Prefetcher
+from .audiocache import AudioCache
+from .library import Library
+from .refresher import StreamRefresher
+from .commands import CommandExecutor, Debouncer
+from .journal import QueueJournal, QueueState, encode_song, decode_song
+from .streaming import StreamOutput
+
+from ..config import DEFAULT_VOLUME, AUDIO_CACHE_ENABLED, LIBRARY_DIRECTORIES, PERSISTENCE_ENABLED, \
+    PERSISTENCE_POSITION_INTERVAL, PERSISTENCE_LOCATION, PREFETCH_PREBUFFER, STREAMING_ENABLED, STREAMING_FIFO
 from ..api._bp_types import PlayType
 
 log = logging.getLogger(__name__)
 
-
-class Player(metaclass=Singleton):
-    def __init__(self, loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()):
-        self.vlc: vlc.Instance = vlc.Instance()
+# VLC events that are forwarded to the event loop
+VLC_EVENTS = (
+    vlc.EventType.MediaPlayerPlaying,
+    vlc.EventType.MediaPlayerPaused,
+    vlc.EventType.MediaPlayerStopped,
+    vlc.EventType.MediaPlayerEndReached,
+    vlc.EventType.MediaPlayerEncounteredError,
+)
+
+
+class Checkpoint:
+    """
+    The queue and playback of a Player at some point, see Player.checkpoint and Player.rollback.
+    """
+    __slots__ = ("songs", "current_index", "volume", "media_player", "media", "playing", "time")
+
+    def __init__(self, songs: List[YoutubeAudio], current_index: Optional[int], volume: int,
+                 media_player: vlc.MediaPlayer, media: Optional[vlc.Media], playing: bool, time_: Optional[float]):
+        self.songs = songs
+        self.current_index = current_index
+        self.volume = volume
+        self.media_player = media_player
+        self.media = media
+        self.playing = playing
+        # Play position in seconds (None if nothing was loaded)
+        self.time = time_
+
+
+class Player:
+    """
+    A zone: its own queue, media players and commands.
+    The VLC instance, resolver (with the metadata cache), audio cache and library can be shared between zones
+    (see ZoneRegistry), they are created when not passed.
+    """
+    def __init__(self, name: str = "default", vlc_instance: Optional[vlc.Instance] = None,
+                 resolver: Optional[Resolver] = None, audio_cache: Optional[AudioCache] = None,
+                 library: Optional[Library] = None, state_location: str = PERSISTENCE_LOCATION,
+                 stream_fifo: str = STREAMING_FIFO, loop: asyncio.AbstractEventLoop = asyncio.get_event_loop()):
+        self.name = name
+        self.vlc: vlc.Instance = vlc_instance or vlc.Instance()
         self.player: vlc.MediaPlayer = self.vlc.media_player_new()
 
         self._queue: PlayerQueue = PlayerQueue()
+        # Resolves YouTube urls off the event loop
+        self.resolver: Resolver = resolver or Resolver()
 
         self.loop: asyncio.AbstractEventLoop = loop
 
+        # Downloaded songs (optional)
+        if audio_cache is None and AUDIO_CACHE_ENABLED:
+            audio_cache = AudioCache()
+        self.audio_cache: Optional[AudioCache] = audio_cache
+        # Local music files (optional, scanned once the server runs)
+        if library is None and LIBRARY_DIRECTORIES:
+            library = Library()
+        self.library: Optional[Library] = library
+        # HTTP audio stream (optional, started once the server runs)
+        self.stream_output: Optional[StreamOutput] = None
+        if STREAMING_ENABLED:
+            if hasattr(os, "mkfifo"):
+                self.stream_output = StreamOutput(stream_fifo)
+            else:
+                log.warning("Streaming is not supported on this platform, disabling it")
+        # Prepares the upcoming songs, owns the standby player
+        # (no pre-buffering while streaming, the standby player would write to the stream too)
+        self.prefetcher: Prefetcher = Prefetcher(self, prebuffer=PREFETCH_PREBUFFER and self.stream_output is None)
+        # Keeps stream urls of songs further down the queue valid (started once the server runs)
+        self.refresher: StreamRefresher = StreamRefresher(self)
+        # Synchronized playback with other servers (SyncLeader or SyncFollower, set by ZoneRegistry)
+        self.sync = None
+
+        # Bridge VLC events (which arrive on VLC threads) into the event loop
+        for media_player in (self.player, self.prefetcher.standby):
+            if media_player is not None:
+                self._attach_vlc_events(media_player)
+
+        # Callables that get notified about state changes: listener(event, data)
+        self._listeners: List[Callable[[str, dict], None]] = []
+        # unique_id of the last song whose stream was refreshed after a playback error
+        self._recovered_id = None
+        # Every change of the queue or playback (from routes, batches, background resolution
+        # and automatic advancing) runs through this, one at a time
+        self.commands: CommandExecutor = CommandExecutor()
+        # Slider drags send bursts of these, only the latest value per window is applied
+        self.volume_debouncer: Debouncer = Debouncer(self.commands, self.set_volume, "volume")
+        self.seek_debouncer: Debouncer = Debouncer(self.commands, self._seek_song, "seek")
+
         self._current_volume = DEFAULT_VOLUME
+        # [unique_id, seconds] to seek to when the restored current song starts playing
+        self._resume_position: Optional[list] = None
+        # Survives restarts (optional)
+        self.journal: Optional[QueueJournal] = QueueJournal(state_location) if PERSISTENCE_ENABLED else None
+        if self.journal is not None:
+            self._restore()
+
         self.set_volume(self._current_volume)
 
+        if self.journal is not None:
+            self._queue.on_operation = self.journal.record_queue_operation
+            self.journal.state_source = self._persisted_state
+
     ###################
     # PLAYER FUNCTIONS
     # Note: player_queue is both a Player and Queue function
@@ -42,17 +142,45 @@ class Player(metaclass=Singleton):
         :param set_playing: bool indicating if the new song should be loaded (but not yet played)
 
         :raise: SoundcubeException: play_type is invalid
+        :raise: YoutubeException: invalid link
         """
-        t_init = time.time()
-
         try:
-            audio = YoutubeAudio(url)
-        except OSError:
+            videoid = get_video_id(url)
+        except ValueError:
             raise YoutubeException("invalid link")
 
-        queue_was_empty = self._queue.current_audio is None
+        # Previously queued songs are ready immediately, others are queued as placeholders
+        # and resolved in the background (the blocking network calls run in the resolver's executor)
+        audio = self.resolver.cache.get_audio(videoid)
+        if audio is None:
+            audio = YoutubeAudio.placeholder(videoid)
+            asyncio.ensure_future(self._resolve_placeholder(audio, url))
 
-        log.debug(f"Got audio from '{audio.title}':{audio.best_audio}, parsing took {round(time.time() - t_init, 3)}")
+        await self._insert_audio(audio, play_type, position, set_playing)
+
+    async def queue_local(self, track_id: int, play_type: PlayType = PlayType.QUEUE, position: int = None,
+                          set_playing: bool = False) -> YoutubeAudio:
+        """
+        Put a file from the local library in the player queue.
+        :param track_id: id of the track in the library
+        :param play_type: when to play this audio
+        :param position: when using PlayType.AT_POSITION, this is the position to place the song
+        :param set_playing: bool indicating if the new song should be loaded (but not yet played)
+        :return: the queued LocalAudio
+
+        :raise: LibraryException: the library is disabled or there is no such track
+        :raise: SoundcubeException: play_type is invalid
+        """
+        if self.library is None:
+            raise LibraryException("the local library is disabled")
+
+        audio = self.library.get_audio(track_id)
+        await self._insert_audio(audio, play_type, position, set_playing)
+        return audio
+
+    async def _insert_audio(self, audio: YoutubeAudio, play_type: PlayType, position: Optional[int],
+                            set_playing: bool):
+        queue_was_empty = self._queue.current_audio is None
 
         # All if clauses keep track of song_index for use later
         # Puts the song at the end of queue
@@ -71,10 +199,171 @@ class Player(metaclass=Singleton):
         else:
             raise SoundcubeException(f"invalid PlayType: '{play_type}'")
 
+        self._notify("queue_add", position=song_index, song=audio, current_song=self._queue.current_index)
+
         # Load the song if specified or if it is the first song
+        # (placeholders are loaded once they are resolved)
         if set_playing is True or queue_was_empty:
             self._queue.set_current_song(song_index)
-            await self.player_load()
+            if audio.is_ready:
+                await self.player_load()
+
+        self.prefetcher.update()
+
+    async def queue_playlist(self, playlist_id: str, position: Optional[int] = None,
+                             progress: Callable[[dict], None] = None):
+        """
+        Queue a whole YouTube playlist.
+        The playlist is expanded page by page (50 videos), every page is inserted as placeholders right away
+        and its metadata is fetched with a single YouTube Data API request. Stream urls are fetched lazily.
+        If the queue was empty, the first song is fully resolved first, so it can play as soon as possible.
+        :param playlist_id: YouTube playlist id
+        :param position: where to insert the playlist (None for the end of the queue)
+        :param progress: called with a JSON-friendly dict after every step
+
+        :raise: YoutubeException: the playlist could not be fetched
+        """
+        page_token = None
+        queued, failed = 0, 0
+
+        while True:
+            video_ids, page_token, total = await self.resolver.run_blocking(fetch_playlist_page, playlist_id, page_token)
+
+            start = None if position is None else position + queued - failed
+            songs, placeholders = await self.commands.submit(self._queue_page, video_ids, start, force=True)
+
+            queued += len(songs)
+            if progress:
+                progress({"stage": "queued", "queued": queued, "total": total})
+
+            if placeholders:
+                failed += await self._fill_placeholders(placeholders)
+            if progress:
+                progress({"stage": "resolved", "resolved": queued - failed, "failed": failed, "total": total})
+
+            if not page_token:
+                break
+
+        log.info(f"Queued playlist {playlist_id} ({queued - failed} songs)")
+
+    async def _queue_page(self, video_ids: List[str], start: Optional[int]):
+        """
+        Inserts a page of playlist songs (placeholders or cached songs), runs as a command.
+        :param video_ids: video ids to insert
+        :param start: where to insert them (None for the end of the queue)
+        :return: tuple of the inserted songs and the placeholders among them that still need metadata
+        """
+        queue_was_empty = self._queue.current_audio is None
+        if start is None:
+            start = len(self._queue.queue)
+
+        songs = []
+        for index, videoid in enumerate(video_ids):
+            audio = self.resolver.cache.get_audio(videoid) or YoutubeAudio.placeholder(videoid)
+            self._queue.insert_into_queue(audio, start + index)
+            songs.append(audio)
+
+        self._notify("queue_add_many", position=start, songs=songs, current_song=self._queue.current_index)
+
+        placeholders = [audio for audio in songs if audio.state == AudioState.RESOLVING]
+
+        # Make the first song playable first
+        if queue_was_empty and songs:
+            self._queue.set_current_song(start)
+            if songs[0].is_ready:
+                await self.player_load()
+            else:
+                placeholders.remove(songs[0])
+                asyncio.ensure_future(self._resolve_placeholder(songs[0], songs[0].videoid))
+
+        self.prefetcher.update()
+        return songs, placeholders
+
+    async def _fill_placeholders(self, placeholders: List[YoutubeAudio]) -> int:
+        """
+        Fills placeholders with metadata from a single YouTube Data API request (without stream urls).
+        Falls back to resolving them one by one if the request fails.
+
+        The songs are filled right away, outside of the command executor: commands that are about
+        to play a placeholder wait for it to be resolved, they must not wait for a command queued behind them.
+        Only the queue bookkeeping runs as a command.
+        :param placeholders: up to 50 placeholders
+        :return: how many songs were unavailable (and removed)
+        """
+        try:
+            infos = await self.resolver.run_blocking(fetch_videos_info, [audio.videoid for audio in placeholders])
+        except YoutubeException as e:
+            log.warning(f"Batched metadata request failed, resolving separately: {e}")
+            for audio in placeholders:
+                asyncio.ensure_future(self._resolve_placeholder(audio, audio.videoid))
+            return 0
+
+        infos = {info.videoid: info for info in infos}
+
+        filled, failed = [], []
+        for audio in placeholders:
+            # Already resolved (or failed) on its own, e.g. because it was played in the meantime
+            if audio.state != AudioState.RESOLVING:
+                continue
+
+            info = infos.get(audio.videoid)
+            if info is None:
+                # Private, deleted, ...
+                audio.fail()
+                failed.append(audio)
+            else:
+                audio.fill(info, None, 0)
+                self.resolver.cache.put_metadata(info)
+                filled.append(audio)
+
+        self.commands.schedule(self._placeholders_filled, filled, failed)
+        return len(failed)
+
+    def _placeholders_filled(self, filled: List[YoutubeAudio], failed: List[YoutubeAudio]):
+        """
+        Updates the queue after placeholders were filled, removes the unavailable ones, runs as a command.
+        """
+        for audio in failed:
+            self._remove_failed(audio)
+
+        filled = [audio for audio in filled if self._queue.contains(audio.unique_id)]
+        for audio in filled:
+            self._queue.song_updated(audio)
+
+        if filled:
+            self._notify("songs_resolved", songs=filled)
+        self.prefetcher.update()
+
+    async def _resolve_placeholder(self, audio: YoutubeAudio, url: str):
+        """
+        Background resolution of a queued placeholder.
+        Songs that can't be resolved are removed from the queue.
+        """
+        try:
+            await self.resolver.resolve_into(audio, url)
+        except SoundcubeException as e:
+            log.warning(f"Could not resolve '{url}': {e}")
+            self.commands.schedule(self._remove_failed, audio)
+            return
+
+        log.debug(f"Resolved queued song '{audio.title}'")
+        self.commands.schedule(self._placeholder_resolved, audio)
+
+    def _remove_failed(self, audio: YoutubeAudio):
+        self.queue_discard(audio, failed=True)
+
+    async def _placeholder_resolved(self, audio: YoutubeAudio):
+        try:
+            self._queue.song_updated(audio)
+            self._notify("song_resolved", song=audio)
+
+            # Load it if it was waiting to be loaded
+            if self._queue.current_audio == audio and not self.player_is_song_loaded():
+                await self.player_load()
+        except QueueException:
+            pass
+
+        self.prefetcher.update()
 
     async def player_load(self) -> YoutubeAudio:
         """
@@ -88,7 +377,9 @@ class Player(metaclass=Singleton):
         # Get current song:
         audio: YoutubeAudio = self._queue.current_audio
 
+        await self._ensure_stream(audio)
         self._update_media(audio)
+        self._notify("track_changed", current_song=self._queue.current_index, song=audio)
         return audio
 
     async def player_play(self) -> YoutubeAudio:
@@ -109,11 +400,15 @@ class Player(metaclass=Singleton):
         if audio is None:
             raise QueueException("no song to play")
 
+        self.prefetcher.start_transition()
+        await self._ensure_stream(audio)
         self._update_media(audio)
         self.player.play()
 
         # Show info and return
         self._show_play_info()
+        self._notify("track_changed", current_song=self._queue.current_index, song=audio)
+        self.prefetcher.update()
 
         return audio
 
@@ -179,6 +474,9 @@ class Player(metaclass=Singleton):
         if not audio:
             raise QueueException("no next song")
 
+        self.prefetcher.start_transition()
+        await self._ensure_stream(audio)
+
         if self.player_is_playing():
             await self.player_stop()
 
@@ -187,6 +485,8 @@ class Player(metaclass=Singleton):
 
         # Show info and return
         self._show_play_info()
+        self._notify("track_changed", current_song=self._queue.current_index, song=audio)
+        self.prefetcher.update()
 
         return audio
 
@@ -202,6 +502,9 @@ class Player(metaclass=Singleton):
         if not audio:
             raise QueueException("no previous song")
 
+        self.prefetcher.start_transition()
+        await self._ensure_stream(audio)
+
         if self.player_is_playing():
             await self.player_stop()
 
@@ -210,6 +513,8 @@ class Player(metaclass=Singleton):
 
         # Show info and return
         self._show_play_info()
+        self._notify("track_changed", current_song=self._queue.current_index, song=audio)
+        self.prefetcher.update()
 
         return audio
 
@@ -235,8 +540,41 @@ class Player(metaclass=Singleton):
             raise OutsideTimeBounds("invalid time")
 
         self.player.set_time(int(time_ * 1000))
+        self._notify("seek", time=time_)
         return True
 
+    def request_seek(self, time_: float) -> bool:
+        """
+        Sets the time for the current song, debounced (for bursts of requests).
+        The request is validated right away, but applied later.
+
+        :param time_: time to set in seconds
+        :return: bool indicating if the time will be changed
+
+        :raise: OutsideTimeBounds: requested time is outside the audio bounds
+        """
+        if not self.player.get_media():
+            return False
+
+        audio = self._queue.current_audio
+        if time_ > audio.length:
+            raise OutsideTimeBounds("invalid time")
+
+        self.seek_debouncer.push(audio.unique_id, time_)
+        return True
+
+    async def _seek_song(self, unique_id: int, time_: float) -> bool:
+        # The song might have changed since the seek was requested
+        try:
+            audio = self._queue.current_audio
+        except QueueException:
+            return False
+
+        if audio is None or audio.unique_id != unique_id:
+            return False
+
+        return await self.player_set_time(time_)
+
     def player_is_playing(self) -> bool:
         """
         :return: a boolean indicating if a song is currently being played
@@ -275,23 +613,7 @@ class Player(metaclass=Singleton):
 
         :raise: QueueException: no song at this position
         """
-        # Move to a different song if playing the one that is being removed
-        if self._queue.current_index == position:
-            log.info("Trying to remove song, but it is playing; loading next/previous")
-            try:
-                # The entire queue moved up, adjust for this
-                self._queue.set_current_song(self._queue.current_index - 1)
-
-                await self.player_next()
-            except QueueException:
-                try:
-                    await self.player_previous()
-                except QueueException:
-                    log.info("No song remaining, stopping")
-            finally:
-                await self.player_stop()
-
-        self._queue.remove_from_queue(position)
+        await self.queue_remove_by_id(self._queue.get_song_at(position).unique_id)
 
     async def queue_move(self, current_position: int, new_index: int):
         """
@@ -301,30 +623,183 @@ class Player(metaclass=Singleton):
 
         :raise: QueueException: no song at this position
         """
-        # This will raise a QueueException if the index doesn't exist,
-        # so there is no need for backtracking if something goes haywire later
         audio = self._queue.get_song_at(current_position)
-        audio2 = self._queue.get_song_at(new_index)
+        self._queue.move_in_queue(current_position, new_index)
 
-        # makes sure that (if a moved song is currently playing) the index of playing is updated as well
-        if self._queue.current_audio == audio:
-            update_playing_index = new_index
-        elif self._queue.current_audio == audio2:
-            update_playing_index = current_position
-        else:
-            update_playing_index = False
+        self._notify("queue_move", current_index=current_position, new_index=new_index,
+                     unique_id=audio.unique_id, current_song=self._queue.current_index)
+        self.prefetcher.update()
 
-        # The order is reversed depending on the position of indexes
-        if current_position < new_index:
-            self._queue.insert_into_queue(audio, new_index + 1)
-            self._queue.remove_from_queue(current_position)
-        else:
-            self._queue.remove_from_queue(current_position)
-            self._queue.insert_into_queue(audio, new_index)
+    async def queue_remove_by_id(self, unique_id: int):
+        """
+        Remove a song from the queue by its unique_id (unaffected by other clients shifting positions).
+        If it is the current song, the one that takes its place (or the previous one, if it was the last)
+        becomes the current one and is played if the removed song was playing.
+        :param unique_id: song's unique_id
+
+        :raise: QueueException: no song with this unique_id
+        """
+        audio = self._queue.get_song_by_id(unique_id)
+        was_current = self._queue.current_audio is audio
+        was_playing = was_current and self.player_is_playing()
+
+        if was_current:
+            log.info("Removing the current song, loading the next one")
+            await self.player_stop()
+
+        self.queue_discard(audio)
 
-        if update_playing_index is not False:
-            log.debug(f"Updating index after moving: {update_playing_index}")
-            self._queue.set_current_song(update_playing_index)
+        if was_current and self._queue.current_audio is not None:
+            # The song is removed either way
+            try:
+                if was_playing:
+                    await self.player_play()
+                else:
+                    await self.player_load()
+            except PlayerException as e:
+                log.warning(f"Could not load the song after the removed one: {e}")
+
+        self.prefetcher.update()
+
+    async def queue_move_by_id(self, unique_id: int, new_index: int):
+        """
+        Move a song in the queue by its unique_id
+        :param unique_id: song's unique_id
+        :param new_index: which index to move the song to
+
+        :raise: QueueException: no song with this unique_id or invalid index
+        """
+        await self.queue_move(self._queue.position_of(unique_id), new_index)
+
+    async def queue_set_current(self, unique_id: int, play: bool = True) -> YoutubeAudio:
+        """
+        Make a song the current one by its unique_id
+        :param unique_id: song's unique_id
+        :param play: start playing the song (otherwise it is only loaded)
+        :return: YoutubeAudio object
+
+        :raise: QueueException: no song with this unique_id
+        :raise: PlayerException: problem while trying to create a new Media instance
+        """
+        self._queue.set_current_song(self._queue.position_of(unique_id))
+
+        if not play:
+            audio = await self.player_load()
+            self.prefetcher.update()
+            return audio
+
+        if self.player_is_playing():
+            await self.player_stop()
+
+        return await self.player_play()
+
+    async def play_at(self, unique_id: int, position: float, play: bool = True) -> YoutubeAudio:
+        """
+        Make a song the current one by its unique_id and start it at a position (e.g. to follow another server)
+        :param unique_id: song's unique_id
+        :param position: where to start the song (in seconds)
+        :param play: start playing the song (otherwise it starts at the position once resumed)
+        :return: YoutubeAudio object
+
+        :raise: QueueException: no song with this unique_id
+        :raise: PlayerException: problem while trying to create a new Media instance
+        """
+        # Applied once VLC starts playing (see _handle_vlc_event)
+        self._resume_position = [unique_id, position]
+
+        try:
+            return await self.queue_set_current(unique_id, play)
+        except SoundcubeException:
+            self._resume_position = None
+            raise
+
+    def queue_insert(self, audio: YoutubeAudio, position: int):
+        """
+        Insert an already created song (e.g. mirrored from another server), without loading anything
+        :param audio: song to insert
+        :param position: position to place the song at
+
+        :raise: QueueException: invalid position
+        """
+        self._queue.insert_into_queue(audio, position)
+        self._notify("queue_add", position=position, song=audio, current_song=self._queue.current_index)
+
+    def queue_discard(self, audio: YoutubeAudio, failed: bool = False) -> bool:
+        """
+        Remove a song without touching the playback (the current index is kept on the same song)
+        :param audio: song to remove
+        :param failed: the song is removed because it couldn't be resolved
+        :return: bool indicating if the song was still in the queue
+        """
+        try:
+            position = self._queue.remove_audio(audio)
+        except QueueException:
+            return False
+
+        extra = {"failed": True} if failed else {}
+        self._notify("queue_remove", position=position, unique_id=audio.unique_id,
+                     current_song=self._queue.current_index, **extra)
+        return True
+
+    def queue_song_updated(self, audio: YoutubeAudio):
+        """
+        Call after changing the metadata of a queued song (e.g. mirrored from another server)
+        """
+        self._queue.song_updated(audio)
+        self._notify("song_resolved", song=audio)
+
+    def queue_replace(self, songs: List[YoutubeAudio]):
+        """
+        Replace the whole queue (e.g. with another server's), without loading anything.
+        Connected clients are told to fetch the queue again.
+        :param songs: the new queue
+        """
+        self._queue.current_index = None
+        for position in reversed(range(len(self._queue.queue))):
+            self._queue.remove_from_queue(position)
+        for audio in songs:
+            self._queue.append_to_queue(audio)
+
+        self._notify("resync", version=self._queue.tag)
+
+    async def checkpoint(self) -> Checkpoint:
+        """
+        :return: the current queue and playback, to return to with rollback (call both inside the same command)
+        """
+        return Checkpoint(list(self._queue.queue), self._queue.current_index, self._current_volume,
+                          self.player, self.player.get_media(), self.player_is_playing(),
+                          await self.player_get_time())
+
+    async def rollback(self, checkpoint: Checkpoint):
+        """
+        Undo all changes since the checkpoint (e.g. of a failed batch): the queue, current song, volume
+        and the loaded song with its play position. Connected clients are told to fetch the queue again
+        if it changed.
+        :param checkpoint: returned by checkpoint()
+
+        :raise: PlayerException: the song that was loaded could not be loaded again
+        """
+        if [audio.unique_id for audio in self._queue.queue] != [audio.unique_id for audio in checkpoint.songs]:
+            self.queue_replace(checkpoint.songs)
+        self._queue.current_index = checkpoint.current_index
+
+        if self._current_volume != checkpoint.volume:
+            self.set_volume(checkpoint.volume)
+
+        if checkpoint.media is None:
+            await self.player_stop()
+        elif self.player is checkpoint.media_player and self.player.get_media() is checkpoint.media:
+            # Still the same song, only the position and play state changed
+            self.player.set_time(int(checkpoint.time * 1000))
+            if checkpoint.playing != self.player_is_playing():
+                if checkpoint.playing:
+                    self.player.play()
+                else:
+                    self.player.pause()
+        else:
+            await self.player_stop()
+            await self.play_at(checkpoint.songs[checkpoint.current_index].unique_id, checkpoint.time,
+                               play=checkpoint.playing)
 
     ###################
     # VOLUME FUNCTIONS
@@ -343,19 +818,279 @@ class Player(metaclass=Singleton):
         """
         amount = clamp(amount, 0, 100)
 
+        if self.journal is not None and amount != self._current_volume:
+            self.journal.write({"op": "volume", "volume": amount})
+
+        self._current_volume = amount
         self.player.audio_set_volume(amount)
+        self._notify("volume", volume=amount)
+
+    def request_volume(self, amount: int):
+        """
+        Sets the player volume, debounced (for bursts of requests).
+        :param amount: int between 0 and 100
+        """
+        self.volume_debouncer.push(amount)
 
     ###################
     # INTERNAL FUNCTIONS
     ###################
+    async def _ensure_stream(self, audio: YoutubeAudio):
+        """
+        Waits for the song to be resolved, if it's still a placeholder.
+        Stream urls are re-fetched lazily, right before they are needed.
+        :raise: PlayerException: the song or its stream could not be fetched
+        """
+        try:
+            if audio.state == AudioState.RESOLVING:
+                # Resolved here instead of waiting for the background resolution (which might be a batch
+                # that is still queued), joins it if it is already running
+                try:
+                    await self.resolver.resolve_into(audio, audio.videoid)
+                except SoundcubeException:
+                    self.commands.schedule(self._remove_failed, audio)
+                    raise
+            await audio.wait_resolved()
+
+            # Local and downloaded songs don't need a stream
+            if audio.is_local:
+                return
+            if self.audio_cache is None or not self.audio_cache.contains(audio.videoid):
+                await self.resolver.ensure_stream(audio)
+        except PlayerException:
+            raise
+        except SoundcubeException as e:
+            raise PlayerException(f"could not fetch the audio stream: {e}")
+
     def _update_media(self, audio: YoutubeAudio):
-        media_obj: vlc.Media = self.vlc.media_new(audio.best_audio.url)
+        # Switch to the standby player if it has already buffered this song
+        prebuffered = self.prefetcher.take_prebuffered(audio, self.player)
+        if prebuffered is not None:
+            self.player = prebuffered
+            self.player.audio_set_volume(self._current_volume)
+            log.info("Switched to the pre-buffered player")
+            return
+
+        if audio.is_local:
+            local_path = audio.stream_url
+        elif self.audio_cache is not None:
+            local_path = self.audio_cache.path_for(audio.videoid)
+            if local_path is not None:
+                log.info("Playing from the audio cache")
+        else:
+            local_path = None
+
+        if local_path is not None:
+            media_obj: vlc.Media = self.prefetcher.take_media(audio) or self.vlc.media_new_path(local_path)
+        else:
+            media_obj: vlc.Media = self.prefetcher.take_media(audio) or self.vlc.media_new(audio.stream_url)
+
         if media_obj is None:
             raise PlayerException("Error while creating vlc Media object")
 
+        if self.stream_output is not None:
+            self.stream_output.prepare(media_obj)
+
         self.player.set_media(media_obj)
         log.info("Updated Media on player")
 
+    ###################
+    # PERSISTENCE
+    ###################
+    def _restore(self):
+        """
+        Rebuilds the queue, current song, play position and volume from the journal.
+        Only the persisted metadata is used, stream urls are fetched lazily.
+        """
+        t_start = time.perf_counter()
+
+        state = self.journal.load()
+        if state is None:
+            return
+
+        songs = [decode_song(song) for song in state.songs]
+        self._queue.restore(songs, state.current_index)
+        if state.volume is not None:
+            self._current_volume = state.volume
+        self._resume_position = state.position
+
+        log.info(f"Restored {len(songs)} songs in {round((time.perf_counter() - t_start) * 1000)} ms")
+
+    def _persisted_state(self) -> QueueState:
+        """
+        :return: the current state for a journal snapshot
+        """
+        position = self._resume_position
+        if self.player_is_playing():
+            position = [self._queue.current_audio.unique_id, self.player.get_time() / 1000]
+
+        return QueueState([encode_song(audio) for audio in self._queue.queue], self._queue.current_index,
+                          self._current_volume, position)
+
+    def start_persistence(self):
+        """
+        Finishes restoring (on the running loop): resolves restored placeholders, loads the current song
+        and starts saving the play position.
+        """
+        if self.journal is None:
+            return
+
+        try:
+            current = self._queue.current_audio
+        except QueueException:
+            current = None
+        if current is not None:
+            self.commands.schedule(self._load_restored, current)
+
+        # The current song is resolved on its own, see _load_restored
+        placeholders = [audio for audio in self._queue.queue
+                        if audio.state == AudioState.RESOLVING and audio is not current]
+        if placeholders:
+            asyncio.ensure_future(self._resolve_restored(placeholders))
+
+        asyncio.ensure_future(self._save_position())
+
+    async def _resolve_restored(self, placeholders: List[YoutubeAudio]):
+        # Batched like playlist pages
+        for start in range(0, len(placeholders), 50):
+            chunk = [audio for audio in placeholders[start:start + 50] if self._queue.contains(audio.unique_id)]
+            if chunk:
+                await self._fill_placeholders(chunk)
+
+    async def _load_restored(self, audio: YoutubeAudio):
+        # Only if nothing else was loaded in the meantime
+        if self._queue.current_audio == audio and not self.player_is_song_loaded():
+            if audio.state == AudioState.RESOLVING:
+                asyncio.ensure_future(self._resolve_placeholder(audio, audio.videoid))
+            else:
+                await self.player_load()
+
+    async def _save_position(self):
+        last = None
+        while True:
+            await asyncio.sleep(PERSISTENCE_POSITION_INTERVAL)
+
+            if not self.player_is_playing():
+                continue
+
+            position = [self._queue.current_audio.unique_id, round(self.player.get_time() / 1000, 1)]
+            if position != last:
+                self.journal.write({"op": "position", "unique_id": position[0], "time": position[1]})
+                last = position
+
+    ###################
+    # EVENTS
+    ###################
+    def add_listener(self, listener: Callable[[str, dict], None]):
+        """
+        Register a callable to be notified about player and queue changes (called on the event loop).
+        :param listener: callable taking the event name and a dict of data (songs are passed as YoutubeAudio)
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, dict], None]):
+        self._listeners.remove(listener)
+
+    def _notify(self, event: str, **data):
+        for listener in self._listeners:
+            try:
+                listener(event, data)
+            except Exception:
+                log.exception(f"Listener failed on event '{event}'")
+
+    def _attach_vlc_events(self, media_player: vlc.MediaPlayer):
+        event_manager = media_player.event_manager()
+
+        for event_type in VLC_EVENTS:
+            event_manager.event_attach(event_type, self._on_vlc_event, media_player)
+
+    def _on_vlc_event(self, event: vlc.Event, media_player: vlc.MediaPlayer):
+        """
+        Called from a VLC thread, must not call back into VLC: everything is handled on the event loop.
+        """
+        self.loop.call_soon_threadsafe(self._handle_vlc_event, event.type, media_player)
+
+    def _handle_vlc_event(self, event_type: vlc.EventType, media_player: vlc.MediaPlayer):
+        # The standby player also plays while pre-buffering
+        if media_player is not self.player:
+            return
+
+        try:
+            audio = self._queue.current_audio
+        except QueueException:
+            audio = None
+        unique_id = audio.unique_id if audio is not None else None
+
+        if event_type == vlc.EventType.MediaPlayerPlaying:
+            self.prefetcher.end_transition()
+
+            # Continue where the restored song stopped before the restart
+            if self._resume_position is not None:
+                if self._resume_position[0] == unique_id:
+                    self.player.set_time(int(self._resume_position[1] * 1000))
+                self._resume_position = None
+            self._notify("playing", unique_id=unique_id)
+        elif event_type == vlc.EventType.MediaPlayerPaused:
+            self._notify("paused", unique_id=unique_id)
+        elif event_type == vlc.EventType.MediaPlayerStopped:
+            self._notify("stopped", unique_id=unique_id)
+        elif event_type == vlc.EventType.MediaPlayerEndReached:
+            self._notify("ended", unique_id=unique_id)
+            self.commands.schedule(self._advance)
+        elif event_type == vlc.EventType.MediaPlayerEncounteredError:
+            log.warning(f"VLC encountered an error while playing {audio}")
+            self._notify("error", unique_id=unique_id)
+            asyncio.ensure_future(self._recover(audio))
+
+    async def _advance(self):
+        """
+        Automatically plays the next song when the current one ends (runs as a command).
+        """
+        try:
+            await self.player_next()
+        except QueueException:
+            log.info("Reached the end of the queue")
+            self.player.set_media(None)
+        except PlayerException as e:
+            log.warning(f"Could not advance to the next song: {e}")
+
+    async def _recover(self, audio: Union[YoutubeAudio, None]):
+        """
+        Handles playback errors: the most common cause is an expired stream url,
+        so the stream is refreshed and the song retried once. If that fails as well, the song is skipped.
+        """
+        if audio is None:
+            return
+
+        # Local files have no stream to refresh
+        if not audio.is_local and self._recovered_id != audio.unique_id:
+            self._recovered_id = audio.unique_id
+
+            try:
+                await self.resolver.refresh_stream(audio)
+            except SoundcubeException as e:
+                log.warning(f"Could not refresh stream of {audio}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception(f"Unexpected error while refreshing the stream of {audio}")
+            else:
+                self.commands.schedule(self._retry, audio)
+                return
+
+        self.commands.schedule(self._skip, audio)
+
+    async def _retry(self, audio: YoutubeAudio):
+        # Only retry if the song wasn't changed in the meantime
+        if self._queue.current_audio == audio:
+            log.info(f"Retrying {audio} with a refreshed stream")
+            await self.player_play()
+
+    async def _skip(self, audio: YoutubeAudio):
+        if self._queue.current_audio == audio:
+            log.warning(f"Skipping {audio}, playback failed")
+            await self._advance()
+
     def _show_play_info(self):
         audio = self._queue.current_audio
         log.info(f"Playing: {audio.title} (length: {resolve_time(audio.length)})")
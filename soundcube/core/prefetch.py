@@ -0,0 +1,256 @@
+# coding=utf-8
+import vlc
+import logging
+import asyncio
+import time
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+from .youtube import YoutubeAudio
+from .exceptions import SoundcubeException
+
+from ..config import PREFETCH_AHEAD, PREFETCH_PREBUFFER
+
+if TYPE_CHECKING:
+    from .player import Player
+
+log = logging.getLogger(__name__)
+
+# Stream urls that expire sooner than this (in seconds) are refreshed before they are needed
+STREAM_REFRESH_MARGIN = 60 * 10
+# How long to wait (in seconds) for the standby player to start buffering
+PREBUFFER_TIMEOUT = 10
+
+
+class Prefetcher:
+    """
+    Prepares the upcoming songs in the queue ahead of time, so switching songs doesn't have to wait
+    for stream urls, HTTP connections and VLC buffering:
+    - refreshes stream urls that are about to expire,
+    - creates and pre-parses the vlc.Media objects,
+    - (optionally) pre-buffers the next song on a second, muted MediaPlayer.
+
+    Also keeps track of how long transitions take.
+    """
+    def __init__(self, player: "Player", ahead: int = PREFETCH_AHEAD, prebuffer: bool = PREFETCH_PREBUFFER):
+        self._player = player
+        self.ahead = ahead
+
+        # unique_id: (stream url, Media)
+        self._media: Dict[int, Tuple[str, vlc.Media]] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Set when the queue changed since the current run started, the run stops early and starts over
+        self._dirty = False
+
+        # Second player for pre-buffering, swapped with the main one on transitions
+        self.standby: Optional[vlc.MediaPlayer] = player.vlc.media_player_new() if prebuffer else None
+        self._standby_id: Optional[int] = None
+
+        # Transition metrics
+        self._transition_start: Optional[float] = None
+        self._transition_prebuffered = False
+        self.transitions = 0
+        self.prebuffered_transitions = 0
+        self.last_latency: Optional[float] = None
+        self._total_latency = 0.0
+
+    def update(self):
+        """
+        Schedule a new prefetching run, call whenever the queue or the current song changes.
+        A run that is still in progress isn't cancelled (that would abort e.g. a stream refresh other
+        requests are waiting for): it stops after its current step and starts over.
+        """
+        self._dirty = True
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run_while_dirty())
+
+    async def _run_while_dirty(self):
+        while self._dirty:
+            self._dirty = False
+            await self._run()
+
+    async def _run(self):
+        queue = self._player._queue
+        if queue.current_index is None:
+            return
+
+        upcoming = [queue.queue[index] for index
+                    in range(queue.current_index + 1, min(queue.current_index + 1 + self.ahead, len(queue.queue)))]
+
+        # Release Media that isn't needed anymore
+        upcoming_ids = {audio.unique_id for audio in upcoming}
+        for unique_id in list(self._media.keys()):
+            if unique_id not in upcoming_ids:
+                self._media.pop(unique_id)[1].release()
+
+        # The current song is downloaded while it plays
+        self._cache_audio(queue.queue[queue.current_index])
+
+        cache = self._player.audio_cache
+        for audio in upcoming:
+            if self._dirty:
+                return
+            # Placeholders trigger a new run once they're resolved
+            if not audio.is_ready:
+                continue
+            # Downloaded songs are played from disk
+            if cache is not None and cache.contains(audio.videoid):
+                continue
+
+            try:
+                await self._prepare(audio)
+            except SoundcubeException as e:
+                log.warning(f"Could not prefetch {audio}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception(f"Unexpected error while prefetching {audio}")
+            else:
+                self._cache_audio(audio)
+
+        if self.standby is not None and upcoming and upcoming[0].unique_id in self._media \
+                and self._standby_id != upcoming[0].unique_id and not self._dirty:
+            await self._prebuffer(upcoming[0])
+
+    def _cache_audio(self, audio: YoutubeAudio):
+        """
+        Starts downloading the song into the audio cache (if enabled), as long as it has a valid stream url.
+        """
+        cache = self._player.audio_cache
+        if cache is None or audio.is_local or not audio.is_ready or audio.stream_url is None:
+            return
+        if audio.stream_expires_within(STREAM_REFRESH_MARGIN):
+            return
+
+        cache.request(audio.videoid, audio.stream_url)
+
+    async def _prepare(self, audio: YoutubeAudio):
+        """
+        Makes sure the song has a valid stream url and a parsed Media.
+        """
+        if not audio.is_local and audio.stream_expires_within(STREAM_REFRESH_MARGIN):
+            await self._player.resolver.refresh_stream(audio)
+
+        cached = self._media.get(audio.unique_id)
+        if cached is not None and cached[0] == audio.stream_url:
+            return
+
+        if audio.is_local:
+            media: vlc.Media = self._player.vlc.media_new_path(audio.stream_url)
+        else:
+            media: vlc.Media = self._player.vlc.media_new(audio.stream_url)
+        # Parsing happens in the background (in VLC)
+        media.parse_with_options(vlc.MediaParseFlag.network, 0)
+
+        self._media[audio.unique_id] = (audio.stream_url, media)
+        log.debug(f"Prefetched {audio}")
+
+    async def _prebuffer(self, audio: YoutubeAudio):
+        """
+        Starts the song on the muted standby player and pauses it as soon as it's buffered.
+        """
+        self.standby.stop()
+        self._standby_id = None
+
+        self.standby.set_media(self._media[audio.unique_id][1])
+        self.standby.audio_set_mute(True)
+        self.standby.play()
+
+        t_init = time.time()
+        try:
+            while self.standby.get_state() != vlc.State.Playing:
+                if time.time() - t_init > PREBUFFER_TIMEOUT:
+                    log.warning(f"Pre-buffering {audio} timed out")
+                    self.standby.stop()
+                    return
+                if self._dirty:
+                    # The queue changed in the meantime, the next run decides what to pre-buffer
+                    self.standby.stop()
+                    return
+
+                await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            # Shutting down
+            self.standby.stop()
+            raise
+
+        self.standby.set_pause(1)
+        self._standby_id = audio.unique_id
+        log.debug(f"Pre-buffered {audio}")
+
+    def take_media(self, audio: YoutubeAudio) -> Optional[vlc.Media]:
+        """
+        :param audio: the song that is about to be played
+        :return: a pre-parsed Media for the song or None if it wasn't prefetched (or the url changed)
+        """
+        cached = self._media.pop(audio.unique_id, None)
+        if cached is None:
+            return None
+
+        if cached[0] != audio.stream_url:
+            cached[1].release()
+            return None
+
+        return cached[1]
+
+    def take_prebuffered(self, audio: YoutubeAudio, active: vlc.MediaPlayer) -> Optional[vlc.MediaPlayer]:
+        """
+        Swaps the standby player with the active one, if it has the song pre-buffered.
+        :param audio: the song that is about to be played
+        :param active: the currently active MediaPlayer, becomes the new standby player
+        :return: the MediaPlayer with the song loaded (paused and unmuted) or None if not pre-buffered
+        """
+        if self.standby is None or self._standby_id != audio.unique_id:
+            return None
+
+        player = self.standby
+        player.set_time(0)
+        player.audio_set_mute(False)
+
+        active.stop()
+        self.standby = active
+        self._standby_id = None
+
+        self._media.pop(audio.unique_id, None)
+        self._transition_prebuffered = True
+        return player
+
+    ###################
+    # METRICS
+    ###################
+    def start_transition(self):
+        """
+        Marks the start of a song transition (next, previous, play, ...).
+        """
+        self._transition_start = time.perf_counter()
+        self._transition_prebuffered = False
+
+    def end_transition(self):
+        """
+        Marks the end of a transition (the new song started playing).
+        """
+        if self._transition_start is None:
+            return
+
+        latency = time.perf_counter() - self._transition_start
+        self._transition_start = None
+
+        self.transitions += 1
+        if self._transition_prebuffered:
+            self.prebuffered_transitions += 1
+        self.last_latency = latency
+        self._total_latency += latency
+
+        log.debug(f"Transition took {round(latency * 1000)} ms")
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly transition statistics (latencies in milliseconds)
+        """
+        return {
+            "count": self.transitions,
+            "prebuffered": self.prebuffered_transitions,
+            "last_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "average_ms": round(self._total_latency / self.transitions * 1000, 1) if self.transitions else None
+        }
@@ -1,18 +1,117 @@
 # coding=utf-8
 import logging
-from typing import List, Union
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Union, Optional
 
 from .youtube import YoutubeAudio
+from .treelist import TreeList, Node
+from .search import SearchIndex
 from .exceptions import QueueException
 
+from ..config import QUEUE_OPERATION_HISTORY
+
 log = logging.getLogger(__name__)
 
 
+def new_epoch() -> str:
+    return uuid.uuid4().hex[:8]
+
+
 class PlayerQueue:
     def __init__(self):
-        self.queue: List[YoutubeAudio] = []
+        # Positional edits are O(log n), see TreeList
+        self.queue: TreeList = TreeList()
+        # unique_id: Node in self.queue, for looking up songs by id
+        self._nodes: Dict[int, Node] = {}
         # Index of the music in queue that is currently playing
-        self.current_index: int = None
+        self._current_index: int = None
+
+        # Incremented on every change of the queue (including the current song)
+        self.version: int = 0
+        # Changes on every start and restore: versions are only comparable within the same epoch
+        # (clients see both, see tag)
+        self.epoch: str = new_epoch()
+        # Last operations as (version, operation), for clients that want only the changes
+        self._operations = deque(maxlen=QUEUE_OPERATION_HISTORY)
+        # Words in the titles and uploaders of queued and played songs
+        self.search: SearchIndex = SearchIndex()
+        # Called with every recorded operation (see journal.QueueJournal)
+        self.on_operation: Optional[Callable[[dict], None]] = None
+
+    def _record(self, operation: dict):
+        self.version += 1
+        self._operations.append((self.version, operation))
+
+        if self.on_operation is not None:
+            self.on_operation(operation)
+
+    def restore(self, songs: List[YoutubeAudio], current_index: Optional[int]):
+        """
+        Fill an empty queue at once (e.g. after a restart), without recording the individual additions.
+        :param songs: songs in queue order
+        :param current_index: index of the current song
+        """
+        if self.queue:
+            raise QueueException("the queue is not empty")
+
+        for audio, node in zip(songs, self.queue.extend(songs)):
+            self._nodes[audio.unique_id] = node
+            self.search.add(audio)
+
+        self._current_index = current_index if current_index is not None and current_index < len(songs) else None
+        if self._current_index is not None:
+            self.search.played(songs[self._current_index])
+        # Clients that were connected before have to fetch the whole queue
+        self.epoch = new_epoch()
+        self.version += 1
+        self._operations.clear()
+
+        log.info(f"Restored {len(songs)} songs into the queue")
+
+    @property
+    def tag(self) -> str:
+        """
+        :return: the queue version as seen by clients ("<epoch>.<version>", ETags and 'since' of the API)
+        """
+        return f"{self.epoch}.{self.version}"
+
+    def operations_since(self, tag: str) -> Optional[List[dict]]:
+        """
+        :param tag: queue version the client has (see tag)
+        :return: list of operations applied since that version (each with its own tag as 'version')
+                 or None if they are no longer available or the tag is from another epoch
+                 (the client needs the full queue)
+
+        :raise: ValueError: malformed tag
+        """
+        epoch, _, version = tag.rpartition(".")
+        version = int(version)
+        if epoch != self.epoch:
+            return None
+
+        if version == self.version:
+            return []
+        if version > self.version or not self._operations or self._operations[0][0] > version + 1:
+            return None
+
+        return [{**operation, "version": f"{self.epoch}.{op_version}"}
+                for op_version, operation in self._operations if op_version > version]
+
+    @property
+    def current_index(self) -> Union[None, int]:
+        return self._current_index
+
+    @current_index.setter
+    def current_index(self, index: Union[None, int]):
+        if index == self._current_index:
+            return
+
+        self._current_index = index
+        self._record({"op": "current", "index": index})
+
+        if index is not None and 0 <= index < len(self.queue):
+            self.search.played(self.queue[index])
 
     def append_to_queue(self, audio: YoutubeAudio) -> int:
         """
@@ -21,10 +120,11 @@ class PlayerQueue:
 
         :return: the queued position
         """
-        self.queue.append(audio)
+        self._nodes[audio.unique_id] = self.queue.append(audio)
+        self.search.add(audio)
+        self._record({"op": "add", "position": len(self.queue) - 1, "song": audio})
 
         log.info(f"Added new song to queue: {audio.title}")
-        log.debug(f"New state of the queue: {self.queue}")
 
         # Return the position
         return len(self.queue) - 1
@@ -35,10 +135,13 @@ class PlayerQueue:
         :param audio: YoutubeAudio to queue
         :param position: index of where to queue it
         """
-        self.queue.insert(position, audio)
+        node = self.queue.insert(position, audio)
+        self._nodes[audio.unique_id] = node
+        self.search.add(audio)
+        # The position is clamped like with list.insert
+        self._record({"op": "add", "position": self.queue.index_of_node(node), "song": audio})
 
         log.info(f"Inserted new track to queue at index {position}: {audio.title}")
-        log.debug(f"New state of the queue: {self.queue}")
 
     def remove_from_queue(self, position: int):
         """
@@ -46,13 +149,107 @@ class PlayerQueue:
         :param position: index of a song in the queue
         """
         try:
-            title = self.queue[position].title
-            del self.queue[position]
+            node = self.queue.node_at(position)
         except IndexError:
             raise QueueException("invalid position")
 
-        log.info(f"Removed a track from the queue at position: {position} ({title})")
-        log.debug(f"New state of the queue: {self.queue}")
+        audio = node.item
+        # Before unlinking the node, so the queue is left untouched if this fails
+        self.search.remove(audio)
+        self.queue.remove_node(node)
+        del self._nodes[audio.unique_id]
+
+        self._record({"op": "remove", "position": position, "unique_id": audio.unique_id})
+
+        log.info(f"Removed a track from the queue at position: {position} ({audio.title})")
+
+    def move_in_queue(self, position: int, new_position: int):
+        """
+        Move a queued song so it ends up at the new position, keeping the current index on the same song.
+        :param position: index of a song in the queue
+        :param new_position: index the song should be at
+
+        :raise: QueueException: invalid position
+        """
+        length = len(self.queue)
+        if not (0 <= position < length and 0 <= new_position < length):
+            raise QueueException("invalid position")
+        if position == new_position:
+            return
+
+        node = self.queue.node_at(position)
+        self.queue.move_node(node, new_position)
+        self._record({"op": "move", "position": position, "new_position": new_position,
+                      "unique_id": node.item.unique_id})
+
+        # Songs between the two positions shift by one
+        current = self.current_index
+        if current is not None:
+            if current == position:
+                self.current_index = new_position
+            elif position < current <= new_position:
+                self.current_index = current - 1
+            elif new_position <= current < position:
+                self.current_index = current + 1
+
+        log.info(f"Moved a track in the queue from {position} to {new_position} ({node.item.title})")
+
+    def position_of(self, unique_id: int) -> int:
+        """
+        :param unique_id: unique_id of a queued song
+        :return: the song's current position
+
+        :raise: QueueException: the song is not in the queue
+        """
+        try:
+            return self.queue.index_of_node(self._nodes[unique_id])
+        except KeyError:
+            raise QueueException("song is not in the queue")
+
+    def contains(self, unique_id: int) -> bool:
+        """
+        :return: whether a song with this unique_id is in the queue
+        """
+        return unique_id in self._nodes
+
+    def get_song_by_id(self, unique_id: int) -> YoutubeAudio:
+        """
+        :param unique_id: unique_id of a queued song
+        :return: YoutubeAudio object
+
+        :raise: QueueException: the song is not in the queue
+        """
+        try:
+            return self._nodes[unique_id].item
+        except KeyError:
+            raise QueueException("song is not in the queue")
+
+    def remove_audio(self, audio: YoutubeAudio) -> int:
+        """
+        Remove a specific song, keeping the current index on the same song
+        (or on the one that took its place, if the current song is removed).
+        :param audio: YoutubeAudio in the queue
+        :return: the position the song was at
+
+        :raise: QueueException: the song is not in the queue
+        """
+        position = self.position_of(audio.unique_id)
+        self.remove_from_queue(position)
+
+        if self.current_index is not None:
+            if not self.queue:
+                self.current_index = None
+            elif position < self.current_index or self.current_index >= len(self.queue):
+                self.current_index -= 1
+
+        return position
+
+    def song_updated(self, audio: YoutubeAudio):
+        """
+        Call when a queued song changed (e.g. a placeholder was resolved), bumps the queue version.
+        """
+        self.search.update(audio)
+        self._record({"op": "update", "song": audio})
 
     @property
     def current_audio(self) -> Union[None, YoutubeAudio]:
@@ -0,0 +1,133 @@
+# coding=utf-8
+import logging
+import asyncio
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from .youtube import YoutubeAudio
+from .exceptions import SoundcubeException, QueueException
+from .prefetch import STREAM_REFRESH_MARGIN
+
+from ..config import PREFETCH_REFRESH_HORIZON, PREFETCH_REFRESH_PER_MINUTE
+
+if TYPE_CHECKING:
+    from .player import Player
+
+log = logging.getLogger(__name__)
+
+# Seconds between checks when nothing needs to be refreshed
+CHECK_INTERVAL = 60
+# A song whose refresh failed (or didn't help) is not retried for this many seconds
+RETRY_AFTER = 60 * 10
+
+
+class StreamRefresher:
+    """
+    Keeps the stream urls of queued songs valid until they are played.
+
+    Estimates when each upcoming song will start playing (from the current position and the song lengths)
+    and re-resolves the ones that will play within `horizon` seconds, but whose url would expire before they end.
+    Refreshes are spaced out to at most `per_minute` per minute, so a long queue doesn't cause a burst of requests.
+    (The Prefetcher additionally refreshes the next few songs right before they are needed.)
+    """
+    def __init__(self, player: "Player", horizon: float = PREFETCH_REFRESH_HORIZON,
+                 per_minute: float = PREFETCH_REFRESH_PER_MINUTE):
+        self._player = player
+        self.horizon = horizon
+        self.spacing = 60 / per_minute
+
+        self._task: Optional[asyncio.Task] = None
+        # unique_id: time of the last refresh attempt
+        self._attempts: Dict[int, float] = {}
+
+        self.refreshed = 0
+        self.failed = 0
+
+    def start(self):
+        """
+        Start refreshing in the background (on the running loop).
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def due(self) -> List[YoutubeAudio]:
+        """
+        :return: upcoming songs whose stream url would expire before they finish playing, in queue order
+        """
+        queue = self._player._queue
+        try:
+            current = queue.current_audio
+        except QueueException:
+            return []
+        if current is None:
+            return []
+
+        # Seconds until the next song starts
+        position = self._player.player.get_time()
+        eta = current.length - (position / 1000 if position > 0 else 0)
+
+        cache = self._player.audio_cache
+        now = time.time()
+        due = []
+
+        for index in range(queue.current_index + 1, len(queue.queue)):
+            if eta > self.horizon:
+                break
+
+            audio = queue.queue[index]
+            refresh = audio.is_ready \
+                and not (cache is not None and cache.contains(audio.videoid)) \
+                and audio.stream_expires_within(eta + audio.length + STREAM_REFRESH_MARGIN) \
+                and now - self._attempts.get(audio.unique_id, 0) > RETRY_AFTER
+
+            if refresh:
+                due.append(audio)
+
+            eta += audio.length
+
+        return due
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            self._attempts = {unique_id: attempted for unique_id, attempted in self._attempts.items()
+                              if now - attempted <= RETRY_AFTER}
+
+            due = self.due()
+            if not due:
+                await asyncio.sleep(CHECK_INTERVAL)
+                continue
+
+            audio = due[0]
+            self._attempts[audio.unique_id] = now
+
+            try:
+                await self._player.resolver.refresh_stream(audio)
+            except SoundcubeException as e:
+                self.failed += 1
+                log.warning(f"Could not refresh the stream of upcoming {audio}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Keep refreshing the other songs
+                self.failed += 1
+                log.exception(f"Unexpected error while refreshing the stream of upcoming {audio}")
+            else:
+                self.refreshed += 1
+                log.debug(f"Refreshed the stream of upcoming {audio} ({len(due) - 1} more due)")
+
+            await asyncio.sleep(self.spacing)
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly refresh statistics
+        """
+        return {
+            "refreshed": self.refreshed,
+            "failed": self.failed
+        }
@@ -0,0 +1,211 @@
+# coding=utf-8
+import logging
+import asyncio
+import time
+from typing import Dict, Tuple, Callable, Any
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from .youtube import YoutubeAudio, VideoInfo, get_video_id, fetch_video
+from .cache import MetadataCache
+from .exceptions import SoundcubeException, YoutubeException, ResolveTimeout, NoAudioStream
+
+from ..config import RESOLVER_EXECUTOR, RESOLVER_MAX_WORKERS, RESOLVER_TIMEOUT
+
+log = logging.getLogger(__name__)
+
+
+def _resolve_video(url: str) -> Tuple[VideoInfo, str, float]:
+    """
+    Does all the blocking pafy work, runs inside the executor.
+    Module-level (and returning only plain data) so it can be used with a process pool.
+    """
+    return fetch_video(url)
+
+
+class _Flight:
+    """
+    A resolution that is currently in progress, shared by everyone requesting the same video.
+    """
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class Resolver:
+    """
+    Resolves YouTube urls into YoutubeAudio objects on a bounded executor,
+    so the event loop (and with it every other request) never waits on the network.
+    Previously resolved songs are served from the MetadataCache without any network calls
+    and concurrent requests for the same video share a single resolution.
+    """
+    def __init__(self, executor_type: str = RESOLVER_EXECUTOR,
+                 max_workers: int = RESOLVER_MAX_WORKERS, timeout: float = RESOLVER_TIMEOUT):
+        self.executor_type = executor_type
+        self.timeout = timeout
+        self.cache: MetadataCache = MetadataCache()
+
+        # videoid: resolution in progress
+        self._in_flight: Dict[str, _Flight] = {}
+        # How many requests joined an already running resolution
+        self.coalesced = 0
+
+        if executor_type == "process":
+            self.executor: Executor = ProcessPoolExecutor(max_workers=max_workers)
+        else:
+            self.executor: Executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolver")
+
+        log.info(f"Resolver is using a {executor_type} pool with {max_workers} workers")
+
+    async def resolve(self, url: str) -> YoutubeAudio:
+        """
+        Resolve the url in the executor.
+        Concurrent calls for the same video wait for the same resolution, but each gets its own YoutubeAudio.
+        Cancelling the calling task (e.g. when the client disconnects) cancels the resolution as well
+        if no one else is waiting for it and it hasn't started yet
+        (a running resolution finishes in the background and is discarded).
+        :param url: YouTube url or video id
+        :return: YoutubeAudio
+
+        :raise: YoutubeException: invalid link or the video could not be resolved
+        :raise: ResolveTimeout: resolution took longer than the configured timeout
+        """
+        try:
+            videoid = get_video_id(url)
+        except ValueError:
+            raise YoutubeException("invalid link")
+
+        audio = self.cache.get_audio(videoid)
+        if audio is not None:
+            log.debug(f"Got '{videoid}' from the metadata cache")
+            return audio
+
+        info, stream_url, stream_expires = await self._join_flight(videoid, url)
+
+        # Every caller gets its own queue entry (sharing the VideoInfo)
+        return YoutubeAudio(info, stream_url, stream_expires)
+
+    async def resolve_into(self, audio: YoutubeAudio, url: str):
+        """
+        Resolve a placeholder YoutubeAudio in place (marks it as failed if that isn't possible).
+        A cancelled resolution leaves it a placeholder, so it can be resolved again.
+        :param audio: placeholder created with YoutubeAudio.placeholder
+        :param url: YouTube url or video id
+
+        :raise: SoundcubeException: the video could not be resolved
+        """
+        try:
+            audio.fill(*await self._join_flight(audio.videoid, url))
+        except SoundcubeException:
+            audio.fail()
+            raise
+
+    async def refresh_stream(self, audio: YoutubeAudio):
+        """
+        Re-resolve the stream url of an already resolved song (bypassing the cache), in place.
+        :param audio: YoutubeAudio to refresh
+
+        :raise: YoutubeException: the video is no longer available
+        :raise: ResolveTimeout: resolution took longer than the configured timeout
+        """
+        _, audio.stream_url, audio.stream_expires = await self._join_flight(audio.videoid, audio.videoid)
+
+        log.debug(f"Refreshed stream url of '{audio.videoid}'")
+
+    async def ensure_stream(self, audio: YoutubeAudio):
+        """
+        Lazily re-fetches the stream url of a song if it would expire before the song ends.
+        :param audio: YoutubeAudio about to be played
+        """
+        if audio.stream_expires_within(audio.length):
+            await self.refresh_stream(audio)
+
+    async def _join_flight(self, videoid: str, url: str) -> Tuple[VideoInfo, str, float]:
+        """
+        Start a new resolution of the video or join the one already in progress.
+        """
+        flight = self._in_flight.get(videoid)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(self._fetch(url)))
+            self._in_flight[videoid] = flight
+            flight.task.add_done_callback(lambda _: self._end_flight(videoid, flight))
+        else:
+            log.debug(f"Joining in-flight resolution of '{videoid}'")
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            # Don't keep resolving for no one
+            if flight.waiters == 1:
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def _fetch(self, url: str) -> Tuple[VideoInfo, str, float]:
+        """
+        Does the actual resolution in the executor and caches the result.
+        """
+        t_init = time.time()
+        loop = asyncio.get_event_loop()
+
+        future = loop.run_in_executor(self.executor, _resolve_video, url)
+        try:
+            resolved = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            log.warning(f"Resolving '{url}' timed out after {self.timeout}s")
+            raise ResolveTimeout("resolution timed out")
+        except (OSError, ValueError):
+            raise YoutubeException("invalid link")
+        except NoAudioStream as e:
+            raise YoutubeException(str(e))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # pafy and youtube-dl raise all kinds of errors (e.g. for unavailable videos),
+            # callers only have to handle YoutubeException
+            log.warning(f"Resolving '{url}' failed: {e!r}")
+            raise YoutubeException(f"could not resolve the video: {e}")
+
+        self.cache.put(*resolved)
+
+        log.debug(f"Resolved '{url}' in {round(time.time() - t_init, 3)}")
+        return resolved
+
+    async def run_blocking(self, func: Callable, *args) -> Any:
+        """
+        Runs any other blocking (network) function in the resolver's executor, with the same timeout.
+        With a process pool, the function and its arguments have to be picklable.
+
+        :raise: ResolveTimeout: the call took longer than the configured timeout
+        """
+        loop = asyncio.get_event_loop()
+
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self.executor, func, *args), self.timeout)
+        except asyncio.TimeoutError:
+            raise ResolveTimeout(f"'{func.__name__}' timed out")
+
+    def _end_flight(self, videoid: str, flight: _Flight):
+        if self._in_flight.get(videoid) is flight:
+            del self._in_flight[videoid]
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly resolver statistics
+        """
+        return {
+            "in_flight": len(self._in_flight),
+            "coalesced": self.coalesced
+        }
+
+    def shutdown(self):
+        """
+        Stops the executor, without waiting for running resolutions.
+        """
+        self.executor.shutdown(wait=False)
+        self.cache.close()
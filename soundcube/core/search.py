@@ -0,0 +1,219 @@
+# coding=utf-8
+#################
+# Search index
+# Token/prefix index over queued and previously played songs, maintained by PlayerQueue
+#################
+import logging
+import re
+import heapq
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .youtube import YoutubeAudio
+
+from ..config import QUEUE_SEARCH_HISTORY
+
+log = logging.getLogger(__name__)
+
+token_regex = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    """
+    :return: set of lowercase words in the text
+    """
+    if not text:
+        return set()
+
+    return set(token_regex.findall(text.lower()))
+
+
+class Entry:
+    __slots__ = ("audio", "tokens", "sequence", "in_queue")
+
+    def __init__(self, audio: YoutubeAudio, tokens: Set[str], sequence: int):
+        self.audio = audio
+        self.tokens = tokens
+        # Newer entries are listed first
+        self.sequence = sequence
+        self.in_queue = True
+
+
+class SearchIndex:
+    """
+    Inverted index of the words in song titles and uploaders (username).
+
+    Every distinct word maps to the unique_ids of the songs containing it, the words themselves are kept
+    sorted so a prefix maps to a contiguous range of them (found with bisect). A query matches the songs that
+    contain, for every query word, a word starting with it.
+
+    Songs are added when they are queued. Songs that were played stay searchable as history after they are
+    removed from the queue (only the latest play of every video, at most `history_size` of them),
+    songs that were never played are dropped.
+    """
+    def __init__(self, history_size: int = QUEUE_SEARCH_HISTORY):
+        self.history_size = history_size
+
+        # unique_id: Entry
+        self._entries: Dict[int, Entry] = {}
+        # word: unique_ids
+        self._postings: Dict[str, Set[int]] = {}
+        # All words in self._postings, sorted
+        self._words: List[str] = []
+        self._sequence = 0
+
+        # unique_ids of the songs that were played
+        self._played: Set[int] = set()
+        # videoid: unique_id of history entries (removed from the queue), oldest first
+        self._history: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _index(self, unique_id: int, tokens: Iterable[str]):
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                insort(self._words, token)
+            posting.add(unique_id)
+
+    def _unindex(self, unique_id: int, tokens: Iterable[str]):
+        for token in tokens:
+            posting = self._postings[token]
+            posting.discard(unique_id)
+            if not posting:
+                del self._postings[token]
+                del self._words[bisect_left(self._words, token)]
+
+    @staticmethod
+    def _tokens_of(audio: YoutubeAudio) -> Set[str]:
+        return tokenize(audio.title) | tokenize(audio.username)
+
+    def add(self, audio: YoutubeAudio):
+        """
+        Index a newly queued song.
+        A song that is already indexed (e.g. the same unique_id mirrored again after a resync) replaces its old entry.
+        """
+        previous = self._entries.get(audio.unique_id)
+        if previous is not None:
+            if self._history.get(previous.audio.videoid) == audio.unique_id:
+                del self._history[previous.audio.videoid]
+            self._drop(audio.unique_id)
+
+        self._sequence += 1
+        entry = Entry(audio, self._tokens_of(audio), self._sequence)
+        self._entries[audio.unique_id] = entry
+        self._index(audio.unique_id, entry.tokens)
+
+    def update(self, audio: YoutubeAudio):
+        """
+        Re-index a song whose metadata changed (e.g. a resolved placeholder).
+        """
+        entry = self._entries.get(audio.unique_id)
+        if entry is None:
+            return
+
+        tokens = self._tokens_of(audio)
+        self._unindex(audio.unique_id, entry.tokens - tokens)
+        self._index(audio.unique_id, tokens - entry.tokens)
+        entry.tokens = tokens
+
+    def played(self, audio: YoutubeAudio):
+        """
+        Mark a song as played, it stays in the history once it's removed from the queue.
+        """
+        self._played.add(audio.unique_id)
+
+    def remove(self, audio: YoutubeAudio):
+        """
+        Call when a song is removed from the queue.
+        """
+        entry = self._entries.get(audio.unique_id)
+        if entry is None:
+            return
+
+        if audio.unique_id not in self._played or not audio.is_ready:
+            self._drop(audio.unique_id)
+            return
+
+        self._played.discard(audio.unique_id)
+        entry.in_queue = False
+
+        # Only the latest play of a video is kept
+        previous = self._history.pop(audio.videoid, None)
+        if previous is not None:
+            self._drop(previous)
+        self._history[audio.videoid] = audio.unique_id
+
+        while len(self._history) > self.history_size:
+            _, unique_id = self._history.popitem(last=False)
+            self._drop(unique_id)
+
+    def _drop(self, unique_id: int):
+        entry = self._entries.pop(unique_id, None)
+        if entry is None:
+            return
+
+        self._unindex(unique_id, entry.tokens)
+        self._played.discard(unique_id)
+
+    def _prefix_matches(self, prefix: str) -> Set[int]:
+        """
+        :return: unique_ids of the songs that contain a word starting with the prefix
+        """
+        start = bisect_left(self._words, prefix)
+        end = start
+        while end < len(self._words) and self._words[end].startswith(prefix):
+            end += 1
+
+        if end - start == 1:
+            return self._postings[self._words[start]]
+
+        matches = set()
+        for word in self._words[start:end]:
+            matches |= self._postings[word]
+        return matches
+
+    def search(self, query: str, offset: int = 0, limit: int = 50,
+               in_queue: Optional[bool] = None) -> Tuple[int, List[Tuple[YoutubeAudio, bool]]]:
+        """
+        :param query: search words (every one has to be a prefix of a word in the title or uploader)
+        :param offset: how many results to skip
+        :param limit: maximum amount of results
+        :param in_queue: True for only queued songs, False for only the history, None for both
+        :return: tuple of the total amount of results and the requested page as (song, in queue),
+                 most recently queued songs first
+        """
+        words = tokenize(query)
+        if not words:
+            return 0, []
+
+        # Intersect starting with the smallest set
+        candidates = sorted((self._prefix_matches(word) for word in words), key=len)
+        matches = candidates[0]
+        for other in candidates[1:]:
+            matches = matches & other
+            if not matches:
+                break
+
+        entries = (self._entries[unique_id] for unique_id in matches)
+        if in_queue is not None:
+            entries = [entry for entry in entries if entry.in_queue == in_queue]
+        else:
+            entries = list(entries)
+
+        page = heapq.nlargest(offset + limit, entries, key=lambda entry: entry.sequence)[offset:]
+        return len(entries), [(entry.audio, entry.in_queue) for entry in page]
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly index statistics
+        """
+        return {
+            "songs": len(self._entries),
+            "history": len(self._history),
+            "words": len(self._words)
+        }
@@ -0,0 +1,219 @@
+# coding=utf-8
+#################
+# Streaming output
+# VLC encodes the playing song once (sout chain) into a FIFO, the audio is fanned out to HTTP listeners
+# from a shared in-memory ring buffer
+#################
+import logging
+import asyncio
+import os
+import threading
+from typing import Optional, Tuple
+
+import vlc
+
+from ..config import STREAMING_FIFO, STREAMING_BITRATE, STREAMING_BUFFER_SIZE, STREAMING_BURST_SIZE, \
+    STREAMING_SLOW_LISTENERS
+
+log = logging.getLogger(__name__)
+
+READ_SIZE = 16 * 1024
+# MP3 is made of independent frames, so listeners can join at any point of the stream
+CONTENT_TYPE = "audio/mpeg"
+
+
+class ListenerBehind(Exception):
+    """
+    Raised when a listener's data was already overwritten in the ring buffer
+    """
+    pass
+
+
+class StreamBuffer:
+    """
+    Fixed-size ring buffer of the encoded stream, shared by all listeners.
+
+    Positions are absolute byte offsets in the stream (`end` only grows), every listener keeps its own.
+    Memory use doesn't depend on the amount or speed of listeners: a listener that falls more than
+    `capacity` bytes behind can't be served from the buffer anymore (see ListenerBehind).
+    """
+    def __init__(self, capacity: int = STREAMING_BUFFER_SIZE):
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self.end = 0
+
+        # Replaced after every write, so all waiting listeners wake up
+        self._written: Optional[asyncio.Event] = None
+
+    @property
+    def start(self) -> int:
+        """
+        :return: the oldest offset that is still in the buffer
+        """
+        return max(0, self.end - self.capacity)
+
+    def write(self, chunk: bytes):
+        """
+        Append encoded audio (called on the event loop).
+        """
+        if len(chunk) > self.capacity:
+            self.end += len(chunk) - self.capacity
+            chunk = chunk[-self.capacity:]
+
+        position = self.end % self.capacity
+        first = min(len(chunk), self.capacity - position)
+        self._data[position:position + first] = chunk[:first]
+        self._data[:len(chunk) - first] = chunk[first:]
+        self.end += len(chunk)
+
+        if self._written is not None:
+            self._written.set()
+            self._written = None
+
+    def read(self, offset: int, size: int = 64 * 1024) -> Tuple[bytes, int]:
+        """
+        :param offset: listener's position
+        :param size: maximum amount of bytes
+        :return: tuple of the data and the listener's new position
+
+        :raise: ListenerBehind: the data at this position was already overwritten
+        """
+        if offset < self.start:
+            raise ListenerBehind()
+
+        size = min(size, self.end - offset)
+        position = offset % self.capacity
+        first = min(size, self.capacity - position)
+
+        data = bytes(self._data[position:position + first]) + bytes(self._data[:size - first])
+        return data, offset + size
+
+    async def wait(self, offset: int):
+        """
+        Waits until there is data after the position.
+        """
+        while offset >= self.end:
+            if self._written is None:
+                self._written = asyncio.Event()
+            await self._written.wait()
+
+
+class StreamOutput:
+    """
+    Duplicates VLC's output: the song still plays locally and is also transcoded to MP3 into a FIFO.
+    A reader thread moves the encoded audio into the StreamBuffer, the encoding is done once no matter
+    how many listeners there are.
+
+    New listeners start `burst_size` bytes behind the live position (fills client buffers quickly).
+    Listeners that fall behind the buffer are either skipped ahead to the live position or dropped.
+    """
+    def __init__(self, fifo: str = STREAMING_FIFO, bitrate: int = STREAMING_BITRATE,
+                 burst_size: int = STREAMING_BURST_SIZE, slow_listeners: str = STREAMING_SLOW_LISTENERS):
+        self.fifo = os.path.abspath(fifo)
+        self.bitrate = bitrate
+        self.burst_size = burst_size
+        self.drop_slow = slow_listeners == "drop"
+
+        self.buffer = StreamBuffer()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+        self.listeners = 0
+        self.skipped = 0
+        self.dropped = 0
+
+        directory = os.path.dirname(self.fifo)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.fifo):
+            os.remove(self.fifo)
+        # Raises AttributeError where FIFOs aren't supported (Windows)
+        os.mkfifo(self.fifo)
+
+    @property
+    def media_options(self) -> Tuple[str, ...]:
+        """
+        :return: options to add to every vlc.Media that is played
+        """
+        transcode = f"transcode{{vcodec=none,acodec=mp3,ab={self.bitrate},channels=2,samplerate=44100}}"
+        output = f"std{{access=file,mux=raw,dst={self.fifo}}}"
+
+        # 'display' keeps the local playback, sout-keep keeps the output open between songs
+        return f":sout=#duplicate{{dst=display,dst=\"{transcode}:{output}\"}}", ":sout-keep"
+
+    def prepare(self, media: vlc.Media):
+        """
+        Makes VLC stream the media as well.
+        """
+        for option in self.media_options:
+            media.add_option(option)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """
+        Start moving encoded audio into the buffer (on the loop).
+        """
+        if self._thread is not None:
+            return
+
+        self._loop = loop
+        self._thread = threading.Thread(target=self._read_fifo, name="stream-reader", daemon=True)
+        self._thread.start()
+
+    def _read_fifo(self):
+        while not self._stopped:
+            # Blocks until VLC opens the FIFO for writing
+            with open(self.fifo, "rb", buffering=0) as fifo:
+                while True:
+                    chunk = fifo.read(READ_SIZE)
+                    if not chunk:
+                        break
+                    self._loop.call_soon_threadsafe(self.buffer.write, chunk)
+
+    def stop(self):
+        self._stopped = True
+
+        # Unblock the reader if it is waiting for a writer
+        try:
+            os.close(os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK))
+        except OSError:
+            pass
+
+    async def listen(self):
+        """
+        Async generator of the encoded stream for a single listener.
+        """
+        self.listeners += 1
+        offset = max(self.buffer.start, self.buffer.end - self.burst_size)
+
+        try:
+            while True:
+                await self.buffer.wait(offset)
+
+                try:
+                    data, offset = self.buffer.read(offset)
+                except ListenerBehind:
+                    if self.drop_slow:
+                        self.dropped += 1
+                        log.info("Dropped a slow stream listener")
+                        return
+
+                    self.skipped += 1
+                    offset = self.buffer.end
+                    continue
+
+                yield data
+        finally:
+            self.listeners -= 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly streaming statistics
+        """
+        return {
+            "listeners": self.listeners,
+            "bytes": self.buffer.end,
+            "skipped": self.skipped,
+            "dropped": self.dropped
+        }
@@ -0,0 +1,493 @@
+# coding=utf-8
+#################
+# Synchronized playback
+# A leader sends its queue version and playback clock to followers over UDP, followers mirror the queue
+# (through the leader's HTTP API) and keep their playback close to the leader's
+#################
+import logging
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Dict, Optional, Tuple
+from urllib.request import urlopen
+
+from .youtube import YoutubeAudio, VideoInfo, AudioState
+from .exceptions import QueueException, PlayerException
+from .utilities import clamp
+
+from ..config import SYNC_PORT, SYNC_LEADER, SYNC_INTERVAL, SYNC_TOLERANCE, SYNC_SEEK_THRESHOLD, \
+    SYNC_MAX_RATE_CHANGE, SYNC_OUTPUT_DELAY
+
+log = logging.getLogger(__name__)
+
+# Followers that weren't heard from for this many intervals are forgotten
+FOLLOWER_TIMEOUT = 10
+# Clock samples kept by followers, the one with the shortest round trip is used
+CLOCK_SAMPLES = 8
+# Drift is corrected over about this many seconds when adjusting the playback rate
+CORRECTION_TIME = 2
+REQUEST_TIMEOUT = 10
+
+
+def clock() -> float:
+    # Only differences matter, followers estimate the offset to the leader's clock
+    return time.monotonic()
+
+
+def encode(message: dict) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+def fetch_json(url: str) -> dict:
+    """
+    Blocking GET of a JSON document, run it in an executor.
+    """
+    with urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def mirror_song(song: dict) -> YoutubeAudio:
+    """
+    Recreates a song of the leader's queue (as serialized by its API) with the same unique_id.
+    Stream urls are fetched by the follower itself, right before they are needed.
+    """
+    info = VideoInfo(song["video_id"], song["title"], song["length"], song["thumbnail"],
+                     song["username"], song["published"], song["viewcount"])
+
+    if song.get("source") == "local":
+        # The leader's files aren't available here
+        audio = YoutubeAudio(info, None, 0, AudioState.FAILED)
+    elif song["state"] == AudioState.READY:
+        # Expired right away, refreshed when needed
+        audio = YoutubeAudio(info, None, 0)
+    else:
+        # Filled in by the leader's 'update' operation
+        audio = YoutubeAudio.placeholder(info.videoid)
+
+    audio.unique_id = song["unique_id"]
+    return audio
+
+
+def update_song(audio: YoutubeAudio, song: dict):
+    """
+    Applies a song update of the leader's queue (a placeholder was resolved or failed).
+    """
+    if song["state"] == AudioState.FAILED:
+        audio.fail()
+    elif song["state"] == AudioState.READY and not audio.is_local:
+        info = VideoInfo(song["video_id"], song["title"], song["length"], song["thumbnail"],
+                         song["username"], song["published"], song["viewcount"])
+        audio.fill(info, audio.stream_url, audio.stream_expires)
+
+
+class SyncProtocol(asyncio.DatagramProtocol):
+    def __init__(self, handler):
+        self._handler = handler
+
+    def datagram_received(self, data: bytes, address: Tuple[str, int]):
+        try:
+            message = json.loads(data.decode("utf-8"))
+        except ValueError:
+            log.debug(f"Ignored an invalid sync message from {address}")
+            return
+
+        self._handler(message, address)
+
+
+class SyncLeader:
+    """
+    Sends the playback state of a zone to all followers, every `interval` seconds and right after changes.
+
+    State messages carry the queue version and length (followers fetch the changes from the API at `api_url`)
+    and the shared playback clock: the current song's unique_id and the leader clock time at which it
+    started playing (or its position, when paused). Followers register (and measure the clock offset)
+    by sending 'hello' messages, which are answered with the leader's clock.
+    """
+    def __init__(self, player, api_url: str, port: int = SYNC_PORT, interval: float = SYNC_INTERVAL):
+        self._player = player
+        self.api_url = api_url
+        self.port = port
+        self.interval = interval
+
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        # address: last time a hello was received
+        self._followers: Dict[Tuple[str, int], float] = {}
+        self._send_scheduled = False
+
+        self.sent = 0
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: SyncProtocol(self._received),
+                                                                 local_addr=("0.0.0.0", self.port))
+        self._player.add_listener(self._on_event)
+        asyncio.ensure_future(self._send_periodically())
+
+        log.info(f"Sync leader listening on UDP port {self.port}")
+
+    def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def _received(self, message: dict, address: Tuple[str, int]):
+        if message.get("type") != "hello":
+            return
+
+        if address not in self._followers:
+            log.info(f"Sync follower {address[0]}:{address[1]} connected")
+        self._followers[address] = clock()
+
+        self._transport.sendto(encode({"type": "clock", "t0": message.get("t0"), "t1": clock()}), address)
+
+    def _on_event(self, *_):
+        # Followers react to changes right away, once per event loop iteration
+        if not self._send_scheduled:
+            self._send_scheduled = True
+            asyncio.get_event_loop().call_soon(self._send_state)
+
+    async def _send_periodically(self):
+        while self._transport is not None:
+            self._send_state()
+            await asyncio.sleep(self.interval)
+
+    def state(self) -> dict:
+        """
+        :return: the state message
+        """
+        player = self._player
+        now = clock()
+
+        try:
+            audio = player._queue.current_audio
+        except QueueException:
+            audio = None
+
+        position = 0
+        if audio is not None and player.player_is_song_loaded():
+            position = max(0, player.player.get_time()) / 1000
+
+        return {
+            "type": "state",
+            "api": self.api_url,
+            "version": player._queue.tag,
+            "length": len(player._queue.queue),
+            "unique_id": audio.unique_id if audio is not None else None,
+            "playing": player.player_is_playing(),
+            "position": position,
+            "started": now - position,
+            "clock": now
+        }
+
+    def _send_state(self):
+        self._send_scheduled = False
+        if self._transport is None:
+            return
+
+        timeout = clock() - FOLLOWER_TIMEOUT * self.interval
+        for address in [address for address, seen in self._followers.items() if seen < timeout]:
+            log.info(f"Sync follower {address[0]}:{address[1]} disconnected")
+            del self._followers[address]
+
+        if not self._followers:
+            return
+
+        message = encode(self.state())
+        for address in self._followers:
+            self._transport.sendto(message, address)
+        self.sent += 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly sync statistics
+        """
+        return {
+            "mode": "leader",
+            "followers": len(self._followers),
+            "sent": self.sent
+        }
+
+
+class SyncFollower:
+    """
+    Mirrors the leader's queue and playback in a zone.
+
+    The queue is mirrored with the leader's `/queue/get?since=<version>` (whole queue if the operations are
+    no longer available or the queues diverged), songs keep the leader's unique_ids and are prefetched
+    like any other queued song. The playback position is compared to the leader's clock (offset estimated
+    from hello/clock round trips): small drifts are corrected by changing the playback rate by a few percent,
+    larger ones (and song changes) by seeking.
+    """
+    def __init__(self, player, leader: str = SYNC_LEADER, interval: float = SYNC_INTERVAL,
+                 tolerance: float = SYNC_TOLERANCE, seek_threshold: float = SYNC_SEEK_THRESHOLD,
+                 max_rate_change: float = SYNC_MAX_RATE_CHANGE, output_delay: float = SYNC_OUTPUT_DELAY):
+        self._player = player
+        host, _, port = leader.rpartition(":")
+        self.leader = (host, int(port))
+        self.interval = interval
+        self.tolerance = tolerance
+        self.seek_threshold = seek_threshold
+        self.max_rate_change = max_rate_change
+        self.output_delay = output_delay
+
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        # (round trip, offset to the leader's clock)
+        self._samples = deque(maxlen=CLOCK_SAMPLES)
+
+        # Leader queue tag ("<epoch>.<version>") the mirror is at (None: the whole queue has to be fetched)
+        self._version: Optional[str] = None
+        self._mirroring = False
+        # Only one playback command (switching songs, pausing, ...) is waiting at a time
+        self._command_pending = False
+        # unique_id of a song that couldn't be played, not retried
+        self._failed_id: Optional[int] = None
+
+        self.drift: Optional[float] = None
+        self.seeks = 0
+        self.nudges = 0
+        self.full_resyncs = 0
+
+    async def start(self):
+        loop = asyncio.get_event_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(lambda: SyncProtocol(self._received),
+                                                                 remote_addr=self.leader)
+        asyncio.ensure_future(self._say_hello())
+
+        log.info(f"Following the sync leader at {self.leader[0]}:{self.leader[1]}")
+
+    def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    async def _say_hello(self):
+        # Registers with the leader and keeps the clock offset fresh
+        while self._transport is not None:
+            self._transport.sendto(encode({"type": "hello", "t0": clock()}))
+            await asyncio.sleep(self.interval)
+
+    @property
+    def offset(self) -> Optional[float]:
+        """
+        :return: leader clock - local clock (from the sample with the shortest round trip)
+        """
+        if not self._samples:
+            return None
+
+        return min(self._samples)[1]
+
+    def _received(self, message: dict, _):
+        message_type = message.get("type")
+
+        if message_type == "clock":
+            t2 = clock()
+            t0, t1 = message["t0"], message["t1"]
+            # The leader's clock was read about halfway through the round trip
+            self._samples.append((t2 - t0, t1 - (t0 + t2) / 2))
+        elif message_type == "state":
+            if message["version"] != self._version and not self._mirroring:
+                self._mirroring = True
+                asyncio.ensure_future(self._mirror(message))
+
+            self._follow(message)
+
+    ###################
+    # QUEUE
+    ###################
+    async def _mirror(self, state: dict):
+        url = f"{state['api']}/music/queue/get"
+        if self._version is not None:
+            url += f"?since={self._version}"
+
+        try:
+            response = await self._player.resolver.run_blocking(fetch_json, url)
+
+            # Mirrored placeholders are filled right away: a command that plays one would otherwise wait
+            # for _apply, which is queued behind it
+            queue = self._player._queue
+            for operation in response.get("operations", ()):
+                if operation["op"] == "update" and queue.contains(operation["song"]["unique_id"]):
+                    update_song(queue.get_song_by_id(operation["song"]["unique_id"]), operation["song"])
+
+            await self._player.commands.submit(self._apply, response, state, force=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.warning(f"Could not mirror the leader's queue: {e}")
+        finally:
+            self._mirroring = False
+
+    async def _apply(self, response: dict, state: dict):
+        """
+        Applies the leader's queue changes, runs as a command.
+        """
+        queue = self._player._queue
+
+        if "operations" in response:
+            try:
+                for operation in response["operations"]:
+                    await self._apply_operation(operation)
+            except (QueueException, KeyError, IndexError) as e:
+                log.warning(f"Mirrored queue diverged from the leader's ({e}), fetching the whole queue")
+                self._version = None
+                return
+        else:
+            self._replace(response["queue"])
+
+        self._version = response["version"]
+        # Also catches changes made on this server
+        if self._version == state["version"] and len(queue.queue) != state["length"]:
+            log.warning("Mirrored queue diverged from the leader's, fetching the whole queue")
+            self._version = None
+
+        self._player.prefetcher.update()
+
+    async def _apply_operation(self, operation: dict):
+        player = self._player
+        queue = player._queue
+        op = operation["op"]
+
+        if op == "add":
+            player.queue_insert(mirror_song(operation["song"]), operation["position"])
+        elif op == "remove":
+            audio = queue.get_song_at(operation["position"])
+            if audio.unique_id != operation["unique_id"]:
+                raise QueueException("removed song is at a different position")
+
+            player.queue_discard(audio)
+        elif op == "move":
+            audio = queue.get_song_at(operation["position"])
+            if audio.unique_id != operation["unique_id"]:
+                raise QueueException("moved song is at a different position")
+
+            # Positional on purpose: the leader's positions are checked above
+            await player.queue_move(operation["position"], operation["new_position"])
+        elif op == "update":
+            audio = queue.get_song_by_id(operation["song"]["unique_id"])
+            update_song(audio, operation["song"])
+            player.queue_song_updated(audio)
+        # The current song follows the leader's playback instead (see _follow)
+
+    def _replace(self, songs: list):
+        """
+        Replaces the whole queue with the leader's.
+        """
+        self._player.queue_replace([mirror_song(song) for song in songs])
+
+        self.full_resyncs += 1
+        log.info(f"Mirrored the leader's queue ({len(songs)} songs)")
+
+    ###################
+    # PLAYBACK
+    ###################
+    def _command(self, func, *args):
+        if self._command_pending:
+            return
+
+        self._command_pending = True
+        self._player.commands.submit(func, *args, force=True).add_done_callback(self._command_done)
+
+    def _command_done(self, future: asyncio.Future):
+        self._command_pending = False
+        if not future.cancelled() and future.exception() is not None:
+            log.warning(f"Sync command failed: {future.exception()}")
+
+    def _expected_position(self, state: dict) -> float:
+        """
+        :return: where playback should be right now (in seconds)
+        """
+        if not state["playing"]:
+            return state["position"]
+
+        return clock() + self.offset - state["started"] + self.output_delay
+
+    def _follow(self, state: dict):
+        player = self._player
+        if self.offset is None:
+            return
+
+        try:
+            current = player._queue.current_audio
+        except QueueException:
+            current = None
+        unique_id = state["unique_id"]
+
+        if unique_id is None:
+            if player.player_is_song_loaded():
+                self._command(player.player_stop)
+            return
+
+        if current is None or current.unique_id != unique_id or not player.player_is_song_loaded():
+            # Waits for the mirror if the song isn't here (or resolved) yet
+            if player._queue.contains(unique_id) and unique_id != self._failed_id \
+                    and player._queue.get_song_by_id(unique_id).state != AudioState.RESOLVING:
+                self._command(self._switch, state)
+            return
+
+        if not state["playing"]:
+            if player.player_is_playing():
+                self._command(player.player_pause)
+            return
+        if not player.player_is_playing():
+            self._command(player.player_resume)
+            return
+
+        self._correct(player.player.get_time() / 1000 - self._expected_position(state), state)
+
+    async def _switch(self, state: dict):
+        """
+        Plays the leader's current song, starting at the leader's position (runs as a command).
+        """
+        player = self._player
+        unique_id = state["unique_id"]
+
+        # Corrected by the next state messages
+        try:
+            await player.play_at(unique_id, self._expected_position(state), play=state["playing"])
+        except (QueueException, PlayerException) as e:
+            log.warning(f"Could not play the leader's song: {e}")
+            self._failed_id = unique_id
+            if player.player_is_playing():
+                await player.player_pause()
+            return
+
+        player.player.set_rate(1)
+
+    def _correct(self, drift: float, state: dict):
+        """
+        :param drift: local position - leader's position (positive if playing ahead)
+        """
+        media_player = self._player.player
+        self.drift = drift
+        rate = media_player.get_rate()
+
+        if abs(drift) >= self.seek_threshold:
+            media_player.set_time(int(self._expected_position(state) * 1000))
+            media_player.set_rate(1)
+            self.seeks += 1
+            log.debug(f"Seeked to the leader's position (drift {round(drift * 1000)} ms)")
+        elif abs(drift) > self.tolerance or (rate != 1 and abs(drift) > self.tolerance / 2):
+            # Slow down when ahead, speed up when behind
+            rate = 1 - clamp(drift / CORRECTION_TIME, -self.max_rate_change, self.max_rate_change)
+            media_player.set_rate(rate)
+            self.nudges += 1
+        elif rate != 1:
+            media_player.set_rate(1)
+
+    @property
+    def stats(self) -> dict:
+        """
+        :return: JSON-friendly sync statistics
+        """
+        return {
+            "mode": "follower",
+            "offset_ms": round(self.offset * 1000, 2) if self.offset is not None else None,
+            "round_trip_ms": round(min(self._samples)[0] * 1000, 2) if self._samples else None,
+            "drift_ms": round(self.drift * 1000, 1) if self.drift is not None else None,
+            "version": self._version,
+            "seeks": self.seeks,
+            "nudges": self.nudges,
+            "full_resyncs": self.full_resyncs
+        }
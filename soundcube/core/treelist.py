@@ -0,0 +1,249 @@
+# coding=utf-8
+#################
+# TreeList
+# A list with O(log n) positional insert, delete and lookup (implicit treap / order-statistic tree)
+#################
+import random
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+
+class Node:
+    """
+    A single item of the TreeList. Acts as a handle: its current position can be found in O(log n).
+    """
+    __slots__ = ("item", "priority", "size", "left", "right", "parent")
+
+    def __init__(self, item: Any):
+        self.item = item
+        self.priority = random.random()
+        self.size = 1
+        self.left: Optional[Node] = None
+        self.right: Optional[Node] = None
+        self.parent: Optional[Node] = None
+
+
+def _size(node: Optional[Node]) -> int:
+    return node.size if node is not None else 0
+
+
+def _update(node: Node):
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+    if node.left is not None:
+        node.left.parent = node
+    if node.right is not None:
+        node.right.parent = node
+
+
+def _split(node: Optional[Node], count: int) -> Tuple[Optional[Node], Optional[Node]]:
+    """
+    Splits the tree into the first `count` items and the rest.
+    """
+    if node is None:
+        return None, None
+
+    if _size(node.left) >= count:
+        left, node.left = _split(node.left, count)
+        _update(node)
+        if left is not None:
+            left.parent = None
+        node.parent = None
+        return left, node
+    else:
+        node.right, right = _split(node.right, count - _size(node.left) - 1)
+        _update(node)
+        if right is not None:
+            right.parent = None
+        node.parent = None
+        return node, right
+
+
+def _merge(left: Optional[Node], right: Optional[Node]) -> Optional[Node]:
+    """
+    Merges two trees (all items of `left` come before the ones in `right`).
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        left.parent = None
+        return left
+    else:
+        right.left = _merge(left, right.left)
+        _update(right)
+        right.parent = None
+        return right
+
+
+def _build(nodes: List[Node]) -> Optional[Node]:
+    """
+    Builds a tree of the nodes (in order) in O(n), without splitting and merging for every item.
+    """
+    # Right spine of the tree built so far
+    stack: List[Node] = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = stack.pop()
+
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+
+    if not stack:
+        return None
+    root = stack[0]
+
+    # Children come before their parents in reversed pre-order
+    order, pending = [], [root]
+    while pending:
+        node = pending.pop()
+        order.append(node)
+        if node.left is not None:
+            pending.append(node.left)
+        if node.right is not None:
+            pending.append(node.right)
+
+    for node in reversed(order):
+        _update(node)
+
+    return root
+
+
+class TreeList:
+    """
+    List-like sequence backed by an implicit treap.
+    Insert, delete, move and indexing are O(log n), iteration is O(n).
+    """
+    __slots__ = ("_root",)
+
+    def __init__(self, items=()):
+        self._root: Optional[Node] = None
+        self.extend(items)
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def __bool__(self) -> bool:
+        return self._root is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        # In-order traversal without recursion
+        stack = []
+        node = self._root
+
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+            node = stack.pop()
+            yield node.item
+            node = node.right
+
+    def __repr__(self) -> str:
+        return f"<TreeList of {len(self)} items>"
+
+    def _normalize(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TreeList index out of range")
+
+        return index
+
+    def node_at(self, index: int) -> Node:
+        """
+        :raise: IndexError: no such index
+        """
+        index = self._normalize(index)
+        node = self._root
+
+        while True:
+            left_size = _size(node.left)
+
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def __getitem__(self, index: int) -> Any:
+        if isinstance(index, slice):
+            return list(self)[index]
+
+        return self.node_at(index).item
+
+    def __delitem__(self, index: int):
+        self.remove_node(self.node_at(index))
+
+    def insert(self, index: int, item: Any) -> Node:
+        """
+        Insert the item before `index` (clamped like list.insert).
+        :return: the Node holding the item
+        """
+        length = len(self)
+        if index < 0:
+            index = max(0, index + length)
+        index = min(index, length)
+
+        node = Node(item)
+        left, right = _split(self._root, index)
+        self._root = _merge(_merge(left, node), right)
+
+        return node
+
+    def append(self, item: Any) -> Node:
+        node = Node(item)
+        self._root = _merge(self._root, node)
+
+        return node
+
+    def extend(self, items: Iterable[Any]) -> List[Node]:
+        """
+        Append all items, O(n + log n).
+        :return: the Nodes holding the items
+        """
+        nodes = [Node(item) for item in items]
+        self._root = _merge(self._root, _build(nodes))
+
+        return nodes
+
+    def index_of_node(self, node: Node) -> int:
+        """
+        :return: the current position of the node, O(log n)
+        """
+        index = _size(node.left)
+
+        while node.parent is not None:
+            if node is node.parent.right:
+                index += _size(node.parent.left) + 1
+            node = node.parent
+
+        return index
+
+    def remove_node(self, node: Node):
+        index = self.index_of_node(node)
+
+        left, right = _split(self._root, index)
+        _, right = _split(right, 1)
+        self._root = _merge(left, right)
+
+        node.left = node.right = node.parent = None
+        node.size = 1
+
+    def move_node(self, node: Node, index: int):
+        """
+        Moves the node so it ends up at `index`.
+        """
+        self.remove_node(node)
+
+        left, right = _split(self._root, index)
+        self._root = _merge(_merge(left, node), right)
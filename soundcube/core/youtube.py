@@ -1,11 +1,15 @@
 # coding=utf-8
 import logging
+import asyncio
+import time
+from typing import Tuple, Optional
+from urllib.parse import urlparse, parse_qs
 
 import pafy
-from pafy.backend_shared import BasePafy, BaseStream
+from pafy.backend_shared import BasePafy, BaseStream, extract_video_id
 
-from ..config import BACKEND_API_KEY
-from .exceptions import NoAudioStream
+from ..config import BACKEND_API_KEY, CACHE_STREAM_TTL
+from .exceptions import NoAudioStream, YoutubeException
 from .utilities import resolve_time, make_random_song_id
 
 log = logging.getLogger(__name__)
@@ -27,52 +31,225 @@ def get_pafy(url: str) -> BasePafy:
     return video
 
 
-class YoutubeAudio:
+def get_video_id(url: str) -> str:
     """
-    Handles parsing YouTube url via pafy, finds audio streams, ...
+    Extract the video id from a YouTube url (or a video id) without touching the network.
+    :param url: YouTube url
+    :return: 11-character video id
 
-    Mostly for use as queue objects.
+    :raise: ValueError: not a valid YouTube url
     """
-    __slots__ = ("unique_id", "pafy", "best_audio",
-                 "title", "length", "videoid", "thumbnail")
+    return extract_video_id(url)
 
-    def __init__(self, url: str):
-        self.unique_id = make_random_song_id(14)
-        self.pafy: BasePafy = get_pafy(url)
 
-        # Make sure streams are available
-        if not self.pafy._have_basic:
-            self.pafy._fetch_basic()
+class VideoInfo:
+    """
+    Read-only record of the video metadata used by the queue and the API.
+    """
+    __slots__ = ("videoid", "title", "length", "thumbnail", "username", "published", "viewcount")
 
-        # Find best audio stream
-        audio: BaseStream = self.pafy.getbestaudio(ftypestrict=False)
+    def __init__(self, videoid: str, title: str, length: int, thumbnail: str,
+                 username: str, published: str, viewcount: int):
+        for attr, value in zip(self.__slots__, (videoid, title, length, thumbnail, username, published, viewcount)):
+            object.__setattr__(self, attr, value)
 
-        if audio is None:
-            raise NoAudioStream(f"no audio streams in {self.pafy.videoid}")
+    def __setattr__(self, key, value):
+        raise AttributeError("VideoInfo is read-only")
 
-        self.best_audio = audio
+    def __reduce__(self):
+        # Needed for pickling (process pool) since __setattr__ is blocked
+        return VideoInfo, tuple(getattr(self, attr) for attr in self.__slots__)
 
-        # Commonly used attributes
-        self.title = self.pafy.title
-        self.length = self.pafy.length
-        self.videoid = self.pafy.videoid
+    @classmethod
+    def placeholder(cls, videoid: str) -> "VideoInfo":
+        """
+        :return: VideoInfo with only the video id known
+        """
+        return cls(videoid, None, 0, None, None, None, None)
 
-        self.thumbnail = None
+    @classmethod
+    def from_pafy(cls, video: BasePafy) -> "VideoInfo":
         # Tries better qualities first, falls back to worse ones
-        if self.pafy.bigthumbhd is not None:
-            self.thumbnail = self.pafy.bigthumbhd
-        elif self.pafy.bigthumb is not None:
-            self.thumbnail = self.pafy.bigthumb
+        if video.bigthumbhd is not None:
+            thumbnail = video.bigthumbhd
+        elif video.bigthumb is not None:
+            thumbnail = video.bigthumb
         else:
-            self.thumbnail = self.pafy.thumb
+            thumbnail = video.thumb
+
+        return cls(video.videoid, video.title, video.length, thumbnail,
+                   video.username, video.published, video.viewcount)
+
+
+def get_stream_expiry(stream_url: str) -> float:
+    """
+    Signed stream urls carry their expiry time (unix time) in the 'expire' query parameter.
+    :param stream_url: stream url
+    :return: the time at which the url expires (CACHE_STREAM_TTL from now if it can't be determined)
+    """
+    try:
+        return float(parse_qs(urlparse(stream_url).query)["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return time.time() + CACHE_STREAM_TTL
+
+
+def fetch_video(url: str) -> Tuple[VideoInfo, str, float]:
+    """
+    Parses the YouTube url via pafy and finds the best audio stream (blocking).
+    Only plain data is returned, the pafy object is discarded.
+    :param url: YouTube url
+    :return: tuple of VideoInfo, stream url and the time at which the stream url expires
 
-        # TODO fetch gdata in the background
+    :raise: NoAudioStream: the video has no audio streams
+    """
+    video = get_pafy(url)
+
+    # Make sure streams are available
+    if not video._have_basic:
+        video._fetch_basic()
+
+    # Find best audio stream
+    audio: BaseStream = video.getbestaudio(ftypestrict=False)
+
+    if audio is None:
+        raise NoAudioStream(f"no audio streams in {video.videoid}")
+
+    # Stream urls are only valid for a few hours
+    return VideoInfo.from_pafy(video), audio.url, get_stream_expiry(audio.url)
+
+
+class AudioState:
+    # Only the video id is known, metadata is being fetched
+    RESOLVING = "resolving"
+    READY = "ready"
+    FAILED = "failed"
+
+
+class YoutubeAudio:
+    """
+    A queued YouTube video: metadata and its audio stream url.
+    Can start out as a placeholder (AudioState.RESOLVING) that is filled in once resolved.
+
+    Mostly for use as queue objects.
+    """
+    __slots__ = ("unique_id", "info", "stream_url", "stream_expires", "state", "_resolution",
+                 # Serialized JSON representation, set by the API on first use
+                 "encoded")
+    # Local files (see library.LocalAudio) are played from disk instead of a stream
+    is_local = False
+
+    def __init__(self, info: VideoInfo, stream_url: Optional[str], stream_expires: float,
+                 state: str = AudioState.READY):
+        """
+        :param info: VideoInfo of the video
+        :param stream_url: audio stream url
+        :param stream_expires: unix time at which the stream url expires
+        :param state: AudioState
+        """
+        self.unique_id = make_random_song_id(14)
+        self.encoded = None
+
+        self.info = info
+        self.stream_url = stream_url
+        self.stream_expires = stream_expires
+
+        self.state = state
+        # Only placeholders wait for their resolution
+        self._resolution: Optional[asyncio.Future] = None
+        if state == AudioState.RESOLVING:
+            self._resolution = asyncio.get_event_loop().create_future()
+
+    @classmethod
+    def placeholder(cls, videoid: str) -> "YoutubeAudio":
+        """
+        :param videoid: YouTube video id
+        :return: YoutubeAudio with only the video id, to be filled in with fill()
+        """
+        return cls(VideoInfo.placeholder(videoid), None, 0, AudioState.RESOLVING)
+
+    def fill(self, info: VideoInfo, stream_url: str, stream_expires: float):
+        """
+        Completes a placeholder with the resolved data.
+        """
+        self.info = info
+        self.stream_url = stream_url
+        self.stream_expires = stream_expires
+        self.encoded = None
+
+        self._set_state(AudioState.READY)
+
+    def fail(self):
+        """
+        Marks a placeholder as impossible to resolve.
+        """
+        self.encoded = None
+        self._set_state(AudioState.FAILED)
+
+    def _set_state(self, state: str):
+        self.state = state
+
+        if self._resolution is not None:
+            if not self._resolution.done():
+                self._resolution.set_result(state)
+            self._resolution = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == AudioState.READY
+
+    async def wait_resolved(self):
+        """
+        Waits until the song is resolved (returns immediately if it already is).
+
+        :raise: YoutubeException: the song could not be resolved
+        """
+        if self._resolution is not None:
+            await asyncio.shield(self._resolution)
+
+        if self.state == AudioState.FAILED:
+            raise YoutubeException("song could not be resolved")
+
+    # Commonly used attributes
+    @property
+    def videoid(self) -> str:
+        return self.info.videoid
+
+    @property
+    def title(self) -> str:
+        return self.info.title
+
+    @property
+    def length(self) -> int:
+        return self.info.length
+
+    @property
+    def thumbnail(self) -> str:
+        return self.info.thumbnail
+
+    @property
+    def username(self) -> str:
+        return self.info.username
+
+    @property
+    def published(self) -> str:
+        return self.info.published
+
+    @property
+    def viewcount(self) -> int:
+        return self.info.viewcount
+
+    def stream_expires_within(self, seconds: float) -> bool:
+        """
+        :param seconds: time from now
+        :return: bool indicating if the stream url will have expired by then
+        """
+        return self.stream_expires - time.time() < seconds
 
     def __repr__(self):
         return f"<YoutubeAudio '{self.videoid}',{resolve_time(self.length)}>"
 
     def __eq__(self, other):
-        if type(other) is YoutubeAudio:
+        if isinstance(other, YoutubeAudio):
             return self.unique_id == other.unique_id
         else:
             return False
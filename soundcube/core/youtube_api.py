@@ -0,0 +1,127 @@
+# coding=utf-8
+#################
+# YouTube Data API (v3)
+# Blocking calls, run them in the resolver's executor
+#################
+import re
+import json
+import logging
+from urllib.error import URLError
+from urllib.parse import urlencode, urlparse, parse_qs
+from urllib.request import urlopen
+from typing import List, Tuple, Optional
+
+from .youtube import VideoInfo
+from .exceptions import YoutubeException
+
+from ..config import BACKEND_API_KEY, YOUTUBE_API_URL
+
+log = logging.getLogger(__name__)
+
+# Maximum amount of items the API returns per request (and ids per videos request)
+MAX_RESULTS = 50
+REQUEST_TIMEOUT = 10
+
+playlist_id_regex = re.compile(r"^[\w-]{12,}$")
+duration_regex = re.compile(r"^P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?$")
+
+
+def get_playlist_id(url: str) -> str:
+    """
+    Extract the playlist id from a YouTube url (or a playlist id).
+    :param url: YouTube playlist url
+    :return: playlist id
+
+    :raise: ValueError: not a valid playlist url
+    """
+    url = url.strip()
+    if playlist_id_regex.match(url):
+        return url
+
+    query = parse_qs(urlparse(url if "://" in url else "//" + url).query)
+    if "list" in query and playlist_id_regex.match(query["list"][0]):
+        return query["list"][0]
+
+    raise ValueError(f"not a playlist: {url}")
+
+
+def parse_duration(duration: str) -> int:
+    """
+    Converts an ISO 8601 duration (as returned by the API, e.g. PT4M13S) to seconds.
+    """
+    match = duration_regex.match(duration or "")
+    if not match:
+        return 0
+
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def _call_api(endpoint: str, **params) -> dict:
+    params["key"] = BACKEND_API_KEY
+    url = f"{YOUTUBE_API_URL}/{endpoint}?{urlencode(params)}"
+
+    try:
+        with urlopen(url, timeout=REQUEST_TIMEOUT) as response:
+            return json.loads(response.read().decode("utf-8"))
+    except (URLError, OSError, ValueError) as e:
+        raise YoutubeException(f"YouTube API request to '{endpoint}' failed: {e}")
+
+
+def fetch_playlist_page(playlist_id: str, page_token: Optional[str] = None) -> Tuple[List[str], Optional[str], int]:
+    """
+    Fetches one page of playlist items.
+    :param playlist_id: YouTube playlist id
+    :param page_token: token of the page to fetch (None for the first one)
+    :return: tuple of video ids, the next page token (None on the last page) and the total amount of items
+    """
+    params = {"part": "contentDetails", "playlistId": playlist_id, "maxResults": MAX_RESULTS}
+    if page_token:
+        params["pageToken"] = page_token
+
+    data = _call_api("playlistItems", **params)
+
+    video_ids = [item["contentDetails"]["videoId"] for item in data.get("items", [])]
+    total = data.get("pageInfo", {}).get("totalResults", len(video_ids))
+
+    return video_ids, data.get("nextPageToken"), total
+
+
+def fetch_videos_info(video_ids: List[str]) -> List[VideoInfo]:
+    """
+    Fetches metadata of up to 50 videos in a single request.
+    Unavailable (private, deleted, ...) videos are not included in the result.
+    :param video_ids: list of video ids
+    :return: list of VideoInfo
+    """
+    if len(video_ids) > MAX_RESULTS:
+        raise ValueError(f"at most {MAX_RESULTS} videos per request")
+
+    data = _call_api("videos", part="snippet,contentDetails,statistics", id=",".join(video_ids))
+
+    infos = []
+    for item in data.get("items", []):
+        snippet = item.get("snippet", {})
+        thumbnails = snippet.get("thumbnails", {})
+
+        # Tries better qualities first, falls back to worse ones
+        thumbnail = None
+        for quality in ("maxres", "high", "medium", "default"):
+            if quality in thumbnails:
+                thumbnail = thumbnails[quality]["url"]
+                break
+
+        # Same format as pafy (2016-08-05 01:07:09)
+        published = snippet.get("publishedAt", "").replace("T", " ").rstrip("Z").split(".")[0]
+
+        infos.append(VideoInfo(
+            item["id"],
+            snippet.get("title"),
+            parse_duration(item.get("contentDetails", {}).get("duration")),
+            thumbnail,
+            snippet.get("channelTitle"),
+            published,
+            int(item.get("statistics", {}).get("viewCount", 0))
+        ))
+
+    return infos
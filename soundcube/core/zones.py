@@ -0,0 +1,102 @@
+# coding=utf-8
+#################
+# Zones
+# Named players driven by one server, sharing everything that isn't tied to a single output
+#################
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Iterator
+
+import vlc
+
+from .player import Player
+from .resolver import Resolver
+from .audiocache import AudioCache
+from .library import Library
+from .sync import SyncLeader, SyncFollower
+from .exceptions import UnknownZone
+from .utilities import Singleton
+
+from ..config import ZONE_NAMES, AUDIO_CACHE_ENABLED, LIBRARY_DIRECTORIES, PERSISTENCE_LOCATION, STREAMING_FIFO, \
+    SYNC_MODE, SYNC_ZONE, SYNC_API_URL, PUBLIC_URL, PORT, API_ROUTE_PREFIX
+
+log = logging.getLogger(__name__)
+
+
+class ZoneRegistry(metaclass=Singleton):
+    """
+    All zones of the server, each one a Player with its own queue, VLC media players, commands and journal.
+
+    One VLC instance, resolver (with its worker pool and metadata cache), audio cache and library are shared,
+    so a song resolved or downloaded for one zone is ready for all of them and an extra zone only costs
+    its media players and queue.
+
+    The first zone is the default one, it keeps the persisted state and stream FIFO locations from the config,
+    the others use per-zone ones.
+    """
+    def __init__(self, names: list = ZONE_NAMES):
+        self.vlc: vlc.Instance = vlc.Instance()
+        self.resolver: Resolver = Resolver()
+        self.audio_cache = AudioCache() if AUDIO_CACHE_ENABLED else None
+        self.library = Library() if LIBRARY_DIRECTORIES else None
+
+        # name: Player, in the configured order
+        self._zones: Dict[str, Player] = OrderedDict()
+        for name in names:
+            self._add(name)
+
+        if SYNC_MODE != "off":
+            self._setup_sync(SYNC_ZONE or self.default.name)
+
+    def _add(self, name: str):
+        if not self._zones:
+            state_location, stream_fifo = PERSISTENCE_LOCATION, STREAMING_FIFO
+        else:
+            state_location = os.path.join(PERSISTENCE_LOCATION, "zones", name)
+            base, extension = os.path.splitext(STREAMING_FIFO)
+            stream_fifo = f"{base}-{name}{extension}"
+
+        self._zones[name] = Player(name, self.vlc, self.resolver, self.audio_cache, self.library,
+                                   state_location, stream_fifo)
+        log.info(f"Created zone '{name}'")
+
+    def _setup_sync(self, name: str):
+        zone = self.get(name)
+
+        if SYNC_MODE == "leader":
+            api_url = SYNC_API_URL
+            if api_url is None:
+                api_url = f"http://{PUBLIC_URL}:{PORT}{API_ROUTE_PREFIX}"
+                if zone is not self.default:
+                    api_url += f"/zones/{name}"
+
+            zone.sync = SyncLeader(zone, api_url.rstrip("/"))
+        else:
+            zone.sync = SyncFollower(zone)
+
+    def __iter__(self) -> Iterator[Player]:
+        return iter(self._zones.values())
+
+    def __len__(self):
+        return len(self._zones)
+
+    @property
+    def names(self) -> list:
+        return list(self._zones.keys())
+
+    @property
+    def default(self) -> Player:
+        return next(iter(self._zones.values()))
+
+    def get(self, name: str) -> Player:
+        """
+        :param name: zone name
+        :return: the zone's Player
+
+        :raise: UnknownZone: there is no zone with this name
+        """
+        try:
+            return self._zones[name]
+        except KeyError:
+            raise UnknownZone(f"unknown zone '{name}'")
@@ -0,0 +1,145 @@
+# coding=utf-8
+import os
+import sys
+import json
+import asyncio
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from support import write_settings
+
+# soundcube reads its settings on import: every test run gets its own settings file and data directory
+os.environ["SOUNDCUBE_SETTINGS"] = write_settings(tempfile.mkdtemp(prefix="soundcube-tests-"))
+
+import vlc
+
+import fakes
+
+
+@pytest.fixture
+def loop():
+    """
+    A fresh event loop, set as the current one (Player and YoutubeAudio use the current loop).
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+
+    # Background tasks (command executor, prefetching, ...)
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+
+@pytest.fixture
+def fake_vlc(monkeypatch):
+    """
+    Replaces VLC with fakes.FakeInstance and YouTube resolutions with fakes.fake_video.
+    """
+    from soundcube.core import resolver
+
+    monkeypatch.setattr(vlc, "Instance", fakes.FakeInstance)
+    monkeypatch.setattr(resolver, "_resolve_video", fakes.fake_video)
+
+
+@pytest.fixture
+def player(loop, fake_vlc, tmp_path):
+    """
+    A Player on fake VLC, with its own (empty) metadata cache.
+    """
+    from soundcube.core.player import Player
+    from soundcube.core.resolver import Resolver
+    from soundcube.core.cache import MetadataCache
+
+    resolver = Resolver()
+    resolver.cache.close()
+    resolver.cache = MetadataCache(str(tmp_path / "cache.sqlite"))
+
+    player = Player("test", fakes.FakeInstance(), resolver, state_location=str(tmp_path / "state"), loop=loop)
+    yield player
+    resolver.shutdown()
+
+
+@pytest.fixture(scope="session")
+def server():
+    """
+    The whole app (server.py) on fake VLC, imported once: its zones are created on import.
+    """
+    from soundcube.core import resolver
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    patch = pytest.MonkeyPatch()
+    patch.setattr(vlc, "Instance", fakes.FakeInstance)
+    patch.setattr(resolver, "_resolve_video", fakes.fake_video)
+
+    import server
+    for player in server.zones:
+        player.loop = loop
+
+    yield server
+
+    patch.undo()
+    pending = asyncio.all_tasks(loop)
+    for task in pending:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+    loop.close()
+
+
+class Client:
+    """
+    Synchronous wrapper of the Quart test client.
+    """
+    def __init__(self, server):
+        self.server = server
+        self.loop = server.zones.default.loop
+        self._client = server.app.test_client()
+
+    def request(self, method: str, path: str, data: dict = None):
+        """
+        :return: tuple of the status code and the body (decoded JSON, if it is JSON)
+        """
+        async def send():
+            response = await self._client.open(path, method=method, json=data)
+            return response, await response.get_data(raw=False)
+
+        response, body = self.loop.run_until_complete(send())
+        if response.mimetype == "application/json":
+            body = json.loads(body)
+        return response.status_code, body
+
+    def get(self, path: str):
+        return self.request("GET", path)
+
+    def post(self, path: str, data: dict = None):
+        return self.request("POST", path, data if data is not None else {})
+
+    def run(self, player, func, *args):
+        """
+        Runs a command on one of the zones.
+        """
+        return self.loop.run_until_complete(player.commands.run(func, *args))
+
+
+@pytest.fixture
+def client(server):
+    """
+    A test client of the app, every zone starts out with an empty queue.
+    """
+    client = Client(server)
+    asyncio.set_event_loop(client.loop)
+
+    async def reset(player):
+        await player.player_stop()
+        player.queue_replace([])
+
+    for player in server.zones:
+        client.run(player, reset, player)
+
+    return client
@@ -0,0 +1,181 @@
+# coding=utf-8
+#################
+# Test doubles
+# A VLC instance that "plays" on the monotonic clock (no audio output or libvlc needed)
+# and a YouTube resolution that doesn't touch the network
+#################
+import time
+
+import vlc
+
+from soundcube.core.youtube import VideoInfo
+
+# Length of every fake video, in seconds
+VIDEO_LENGTH = 300
+STREAM_EXPIRES = 4102444800
+
+
+class FakeEvent:
+    def __init__(self, event_type: vlc.EventType):
+        self.type = event_type
+
+
+class FakeEventManager:
+    def __init__(self):
+        self._callbacks = {}
+
+    def event_attach(self, event_type: vlc.EventType, callback, *args):
+        self._callbacks[event_type] = (callback, args)
+
+    def fire(self, event_type: vlc.EventType):
+        if event_type in self._callbacks:
+            callback, args = self._callbacks[event_type]
+            callback(FakeEvent(event_type), *args)
+
+
+class FakeMedia:
+    def __init__(self, mrl: str, *options):
+        self.mrl = mrl
+        self.options = list(options)
+
+    def add_option(self, option: str):
+        self.options.append(option)
+
+    def parse(self):
+        pass
+
+    def parse_with_options(self, *_):
+        pass
+
+    def get_duration(self) -> int:
+        return VIDEO_LENGTH * 1000
+
+    def get_meta(self, _):
+        return None
+
+    def release(self):
+        pass
+
+
+class FakeMediaPlayer:
+    """
+    Plays media on the monotonic clock: the position advances at the playback rate,
+    multiplied by `skew` (e.g. 1.02 for a sound card running 2 % fast).
+    """
+    def __init__(self, skew: float = 1):
+        self.skew = skew
+        self.volume = 0
+
+        self._media = None
+        self._playing = False
+        self._rate = 1.0
+        # Position (in seconds) at the monotonic time _since
+        self._position = 0.0
+        self._since = time.monotonic()
+        self._events = FakeEventManager()
+
+    def _fold(self):
+        now = time.monotonic()
+        if self._playing:
+            self._position += (now - self._since) * self._rate * self.skew
+        self._since = now
+
+    def event_manager(self) -> FakeEventManager:
+        return self._events
+
+    def set_media(self, media):
+        self._fold()
+        self._media = media
+        self._playing = False
+        self._position = 0.0
+
+    def get_media(self):
+        return self._media
+
+    def play(self) -> int:
+        if self._media is None:
+            return -1
+
+        self._fold()
+        self._playing = True
+        self._events.fire(vlc.EventType.MediaPlayerPlaying)
+        return 0
+
+    def pause(self):
+        self._fold()
+        self._playing = not self._playing
+        self._events.fire(vlc.EventType.MediaPlayerPlaying if self._playing else vlc.EventType.MediaPlayerPaused)
+
+    def set_pause(self, pause: int):
+        self._fold()
+        self._playing = not pause
+
+    def stop(self):
+        self._fold()
+        self._playing = False
+        self._position = 0.0
+        self._events.fire(vlc.EventType.MediaPlayerStopped)
+
+    def is_playing(self) -> int:
+        return int(self._playing)
+
+    def get_state(self) -> vlc.State:
+        return vlc.State.Playing if self._playing else vlc.State.Stopped
+
+    def get_time(self) -> int:
+        if self._media is None:
+            return -1
+
+        self._fold()
+        return int(self._position * 1000)
+
+    def set_time(self, time_ms: int):
+        self._fold()
+        self._position = time_ms / 1000
+
+    def get_rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        self._fold()
+        self._rate = rate
+
+    def audio_get_volume(self) -> int:
+        return self.volume
+
+    def audio_set_volume(self, volume: int):
+        self.volume = volume
+
+    def audio_set_mute(self, _):
+        pass
+
+
+class FakeInstance:
+    """
+    Drop-in for vlc.Instance, all created media players use the same skew.
+    """
+    skew = 1
+
+    def __init__(self, *_):
+        pass
+
+    def media_player_new(self) -> FakeMediaPlayer:
+        return FakeMediaPlayer(self.skew)
+
+    def media_new(self, mrl: str, *options) -> FakeMedia:
+        return FakeMedia(mrl, *options)
+
+    def media_new_path(self, path: str) -> FakeMedia:
+        return FakeMedia(path)
+
+    def release(self):
+        pass
+
+
+def fake_video(url: str):
+    """
+    Drop-in for resolver._resolve_video: any 11 character id resolves to a song with a stream that doesn't expire.
+    """
+    videoid = url[-11:]
+    return (VideoInfo(videoid, f"Song {videoid}", VIDEO_LENGTH, None, "Channel", "2019-01-01 00:00:00", 1),
+            f"http://127.0.0.1/stream/{videoid}?expire={STREAM_EXPIRES}", STREAM_EXPIRES)
@@ -0,0 +1,59 @@
+# coding=utf-8
+#################
+# Test helpers that don't import soundcube (they run before the config is read)
+#################
+import os
+import socket
+
+# Everything the tests need: no frontend, persistence, library, streaming or sync unless a test enables it
+SETTINGS = {
+    "Server": {"host": "127.0.0.1", "port": "8080"},
+    "Routes": {"build_location": "{data}/build"},
+    "APIs": {"googleApiKey": "test", "frontend_googleApiKey": "test",
+             "youtube_api_url": "http://127.0.0.1:9/youtube/v3"},
+    "Cache": {"location": "{data}/cache.sqlite"},
+    "Prefetch": {"prebuffer": "false"},
+    "AudioCache": {"enabled": "false", "location": "{data}/audio"},
+    "Library": {"directories": "", "location": "{data}/library.sqlite"},
+    "Persistence": {"enabled": "false", "location": "{data}/state"},
+    "Streaming": {"enabled": "false"},
+    "Zones": {"names": "default, kitchen"},
+    "Sync": {"mode": "off"},
+    "Commands": {"debounce_window": "0"},
+}
+
+
+def write_settings(directory: str, **overrides: dict) -> str:
+    """
+    Writes a settings file (and its data directory) for a test server.
+    :param directory: data directory, '{data}' in the values is replaced with it
+    :param overrides: sections to update, e.g. Sync={"mode": "leader"}
+    :return: path of the settings file
+    """
+    os.makedirs(os.path.join(directory, "build"), exist_ok=True)
+    with open(os.path.join(directory, "build", "index.html"), "w", encoding="utf-8") as index:
+        index.write("<!DOCTYPE html><title>Soundcube</title>")
+
+    sections = {name: dict(values) for name, values in SETTINGS.items()}
+    for name, values in overrides.items():
+        sections.setdefault(name, {}).update(values)
+
+    path = os.path.join(directory, "settings.ini")
+    with open(path, "w", encoding="utf-8") as settings:
+        for name, values in sections.items():
+            settings.write(f"[{name}]\n")
+            for key, value in values.items():
+                settings.write(f"{key} = {value.format(data=directory)}\n")
+            settings.write("\n")
+
+    return path
+
+
+def free_port(kind: int = socket.SOCK_STREAM) -> int:
+    """
+    :param kind: socket.SOCK_STREAM (TCP) or socket.SOCK_DGRAM (UDP)
+    :return: a port that is currently free on the loopback interface
+    """
+    with socket.socket(socket.AF_INET, kind) as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
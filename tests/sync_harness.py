@@ -0,0 +1,39 @@
+# coding=utf-8
+"""
+Runs a whole Soundcube server on fake VLC and fake YouTube resolutions (see fakes.py),
+for tests that need more than one server (e.g. a sync leader and its followers on the loopback interface).
+
+    python tests/sync_harness.py <settings file> [--skew 1.02]
+"""
+import os
+import sys
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("settings", help="settings file of the server")
+    parser.add_argument("--skew", type=float, default=1, help="speed of the fake playback clock")
+    args = parser.parse_args()
+
+    os.environ["SOUNDCUBE_SETTINGS"] = args.settings
+    tests = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(tests))
+    sys.path.insert(0, tests)
+
+    import vlc
+    import fakes
+    from soundcube.core import resolver
+
+    fakes.FakeInstance.skew = args.skew
+    vlc.Instance = fakes.FakeInstance
+    resolver._resolve_video = fakes.fake_video
+
+    from soundcube.config import HOST, PORT
+    import server
+
+    server.app.run(HOST, PORT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# coding=utf-8
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from soundcube.core.audiocache import AudioCache, download, PARTIAL_SUFFIX, SIZE_SUFFIX
+
+
+class AudioHandler(BaseHTTPRequestHandler):
+    # Set by the tests
+    content = b""
+    # Connection is closed after this many bytes of the body (None: never)
+    cut_after = None
+    # Sent instead of a valid response (None: a valid response is sent)
+    garbage = None
+
+    def log_message(self, *_):
+        pass
+
+    def do_GET(self):
+        if self.garbage is not None:
+            self.wfile.write(self.garbage)
+            return
+
+        start = 0
+        match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            if start >= len(self.content):
+                self.send_response(416)
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(self.content) - 1}/{len(self.content)}")
+        else:
+            self.send_response(200)
+
+        body = self.content[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        self.wfile.write(body if self.cut_after is None else body[:self.cut_after])
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(("127.0.0.1", 0), AudioHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    AudioHandler.content, AudioHandler.cut_after, AudioHandler.garbage = bytes(range(256)) * 40, None, None
+    yield f"http://127.0.0.1:{server.server_address[1]}/audio"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / ("song" + PARTIAL_SUFFIX)), str(tmp_path / "song.audio")
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def test_complete_download(server, paths):
+    partial, complete = paths
+
+    assert download(server, partial, complete) == 0
+    assert read(complete) == AudioHandler.content
+    assert not os.path.exists(partial) and not os.path.exists(partial + SIZE_SUFFIX)
+
+
+def test_cut_download_is_kept_and_resumed(server, paths):
+    partial, complete = paths
+
+    AudioHandler.cut_after = 4000
+    with pytest.raises(OSError):
+        download(server, partial, complete)
+    assert not os.path.exists(complete)
+    assert os.path.getsize(partial) == 4000
+
+    AudioHandler.cut_after = None
+    assert download(server, partial, complete) == 4000
+    assert read(complete) == AudioHandler.content
+
+
+def test_partial_file_of_another_file_is_restarted(server, paths):
+    partial, complete = paths
+
+    AudioHandler.cut_after = 4000
+    with pytest.raises(OSError):
+        download(server, partial, complete)
+
+    # e.g. a different format after the stream url was refreshed
+    AudioHandler.content, AudioHandler.cut_after = bytes(reversed(range(256))) * 60, None
+    assert download(server, partial, complete) == 0
+    assert read(complete) == AudioHandler.content
+
+
+def test_malformed_response_counts_as_a_failed_download(server, tmp_path, loop):
+    # http.client raises BadStatusLine, which isn't an OSError
+    AudioHandler.garbage = b"NOT HTTP AT ALL\r\n\r\n"
+    cache = AudioCache(str(tmp_path / "audio"), workers=1)
+
+    cache.request("aaaaaaaaaa1", server)
+    loop.run_until_complete(cache._downloads["aaaaaaaaaa1"])
+
+    assert cache.failed == 1 and cache.downloaded == 0
+    assert not cache.contains("aaaaaaaaaa1")
@@ -0,0 +1,105 @@
+# coding=utf-8
+import pytest
+
+BATCH = "/api/v1/music/batch"
+
+
+def ids(player) -> list:
+    return [audio.unique_id for audio in player._queue.queue]
+
+
+def playing(player) -> str:
+    media = player.player.get_media()
+    return media.mrl.split("/")[-1].split("?")[0] if media is not None else ""
+
+
+def prepared(client):
+    """
+    The default zone with two songs queued, the first one playing at 0:42.
+    """
+    player = client.server.zones.default
+    for videoid in ("aaaaaaaaaa1", "aaaaaaaaaa2"):
+        client.run(player, player.player_queue, videoid)
+    client.run(player, player.queue_set_current, ids(player)[0])
+    player.player.set_time(42000)
+    player.set_volume(50)
+    return player
+
+
+def test_batch_is_applied_with_a_single_version(client):
+    player = prepared(client)
+    first, second = ids(player)
+
+    status, body = client.post(BATCH, {"operations": [
+        {"op": "add", "song": "aaaaaaaaaa3", "position": 0},
+        {"op": "move", "unique_id": first, "new_index": 2},
+        {"op": "play", "unique_id": second},
+        {"op": "pause"},
+        {"op": "volume", "volume": 20}
+    ]})
+
+    assert status == 200
+    assert [result["status"] for result in body["results"]] == ["ok"] * 5
+    assert [song["video_id"] for song in body["new_queue"]] == ["aaaaaaaaaa3", "aaaaaaaaaa2", "aaaaaaaaaa1"]
+    assert body["version"] == player._queue.tag
+    assert body["current_song"] == 1
+
+    assert playing(player) == "aaaaaaaaaa2" and not player.player_is_playing()
+    assert player._current_volume == 20
+
+
+def test_failed_batch_is_rolled_back(client):
+    player = prepared(client)
+    before = ids(player)
+
+    status, body = client.post(BATCH, {"operations": [
+        {"op": "add", "song": "aaaaaaaaaa3", "position": 0},
+        {"op": "move", "unique_id": before[0], "new_index": 2},
+        {"op": "play", "unique_id": before[1]},
+        {"op": "volume", "volume": 20},
+        {"op": "remove", "unique_id": 123456789}
+    ]})
+
+    assert status == 441
+    assert body["failed"] == 4
+    assert [result["status"] for result in body["results"]] == ["ok"] * 4 + ["error"]
+
+    # Everything as before the batch
+    assert ids(player) == before
+    assert [song["unique_id"] for song in body["new_queue"]] == before
+    assert body["current_song"] == 0 and body["version"] == player._queue.tag
+    assert player._queue.current_index == 0
+    assert playing(player) == "aaaaaaaaaa1" and player.player_is_playing()
+    # Reloaded at the position it was at
+    assert player.player.get_time() == pytest.approx(42000, abs=500)
+    assert player._current_volume == 50
+
+
+def test_failed_batch_restores_the_position_of_the_same_song(client):
+    player = prepared(client)
+    loaded = player.player.get_media()
+
+    status, _ = client.post(BATCH, {"operations": [
+        {"op": "seek", "time": 100},
+        {"op": "pause"},
+        {"op": "seek", "time": 100000}
+    ]})
+
+    assert status == 441
+    # Not reloaded, only sought back and resumed
+    assert player.player.get_media() is loaded
+    assert player.player.get_time() == pytest.approx(42000, abs=500)
+    assert player.player_is_playing()
+
+
+def test_malformed_batch_applies_nothing(client):
+    player = prepared(client)
+    before = ids(player)
+
+    status, body = client.post(BATCH, {"operations": [
+        {"op": "remove", "unique_id": before[0]},
+        {"op": "volume", "volume": 200}
+    ]})
+
+    assert status == 400 and body["status"] == "bad_request"
+    assert ids(player) == before and player._current_volume == 50
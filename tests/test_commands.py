@@ -0,0 +1,215 @@
+# coding=utf-8
+import asyncio
+
+import pytest
+
+from soundcube.core.commands import CommandExecutor, Debouncer
+from soundcube.core.exceptions import CommandQueueFull
+
+
+async def hold(executor: CommandExecutor) -> asyncio.Event:
+    """
+    Keeps the executor busy until the returned event is set, so the next submissions wait.
+    """
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def blocking():
+        started.set()
+        await release.wait()
+
+    executor.submit(blocking, force=True)
+    await started.wait()
+    return release
+
+
+def test_commands_run_in_submission_order(loop):
+    executor = CommandExecutor()
+    order = []
+
+    async def slow(number: int):
+        # Awaiting doesn't let later commands overtake
+        await asyncio.sleep(0.001 * (number % 3))
+        order.append(number)
+        return number
+
+    async def submit_all():
+        release = await hold(executor)
+        futures = [executor.submit(slow if number % 2 else order.append, number) for number in range(20)]
+        release.set()
+        return await asyncio.gather(*futures)
+
+    results = loop.run_until_complete(submit_all())
+    assert order == list(range(20))
+    assert results[1::2] == list(range(1, 20, 2))
+    assert executor.stats == {"pending": 0, "executed": 21, "coalesced": 0, "rejected": 0}
+
+
+def test_latest_of_consecutive_keyed_commands_wins(loop):
+    executor = CommandExecutor()
+    applied = []
+
+    def set_volume(volume: int) -> int:
+        applied.append(volume)
+        return volume
+
+    async def submit_all():
+        release = await hold(executor)
+        futures = [executor.submit(set_volume, volume, key="volume") for volume in (10, 20, 30)]
+        # Another command in between: the next ones can't replace the waiting volume command anymore
+        futures.append(executor.submit(applied.append, "play"))
+        futures += [executor.submit(set_volume, volume, key="volume") for volume in (40, 50)]
+        release.set()
+        return await asyncio.gather(*futures)
+
+    results = loop.run_until_complete(submit_all())
+    assert applied == [30, "play", 50]
+    # Every submitter gets the result of the command that was executed in its place
+    assert results == [30, 30, 30, None, 50, 50]
+    assert executor.coalesced == 3
+
+
+def test_submissions_over_the_limit_are_rejected(loop):
+    executor = CommandExecutor(max_pending=2)
+    applied = []
+
+    async def submit_all():
+        release = await hold(executor)
+        executor.submit(applied.append, 1)
+        executor.submit(applied.append, 2, key="volume")
+
+        with pytest.raises(CommandQueueFull):
+            executor.submit(applied.append, 3)
+        # Replacing the waiting command doesn't need a new slot, internal commands are always accepted
+        executor.submit(applied.append, 4, key="volume")
+        last = executor.submit(applied.append, 5, force=True)
+
+        release.set()
+        await last
+
+    loop.run_until_complete(submit_all())
+    assert applied == [1, 4, 5]
+    assert executor.stats == {"pending": 0, "executed": 4, "coalesced": 1, "rejected": 1}
+
+
+def test_full_command_queue_is_busy(client):
+    player = client.server.zones.default
+    commands = player.commands
+    max_pending = commands.max_pending
+
+    release = client.loop.run_until_complete(hold(commands))
+    commands.max_pending = 1
+    try:
+        commands.submit(lambda: None)
+
+        status, body = client.post("/api/v1/music/queue/add", {"song": "aaaaaaaaaa1", "position": 0})
+        assert status == 429 and body["status"] == "busy"
+    finally:
+        commands.max_pending = max_pending
+        release.set()
+
+    client.run(player, lambda: None)
+    assert len(player._queue.queue) == 0
+    assert commands.rejected >= 1
+
+
+def test_debouncer_applies_the_latest_value_of_a_window(loop):
+    executor = CommandExecutor()
+    applied = []
+    debouncer = Debouncer(executor, applied.append, "volume", window=0.05)
+
+    async def burst():
+        # The first value is applied right away, the next ones wait for the window to end
+        for volume in (10, 20, 30, 40):
+            debouncer.push(volume)
+        await executor.run(lambda: None)
+        assert applied == [10]
+        assert debouncer.stats == {"received": 4, "applied": 1, "dropped": 2}
+
+        await asyncio.sleep(0.1)
+        await executor.run(lambda: None)
+        assert applied == [10, 40]
+
+        # After a quiet window, applied right away again
+        await asyncio.sleep(0.1)
+        debouncer.push(50)
+        await executor.run(lambda: None)
+
+    loop.run_until_complete(burst())
+    assert applied == [10, 40, 50]
+    assert debouncer.stats == {"received": 5, "applied": 3, "dropped": 2}
+
+
+class Debounced:
+    """
+    The default zone with a debounce window (the tests' settings disable it), records its events.
+    """
+    def __init__(self, player):
+        self.player = player
+        self.events = []
+
+    def listener(self, event: str, data: dict):
+        self.events.append((event, data))
+
+    def values(self, event: str, field: str) -> list:
+        return [data[field] for name, data in self.events if name == event]
+
+
+@pytest.fixture
+def debounced(client):
+    player = client.server.zones.default
+    debouncers = (player.volume_debouncer, player.seek_debouncer)
+    for debouncer in debouncers:
+        debouncer.window = 0.05
+
+    zone = Debounced(player)
+    player.add_listener(zone.listener)
+    yield zone
+
+    # Lets the last window end
+    client.loop.run_until_complete(asyncio.sleep(0.1))
+    player.remove_listener(zone.listener)
+    for debouncer in debouncers:
+        debouncer.window = 0
+
+
+def settle(client, player):
+    client.loop.run_until_complete(asyncio.sleep(0.1))
+    client.run(player, lambda: None)
+
+
+def test_volume_requests_are_debounced(client, debounced):
+    player = debounced.player
+    before = dict(player.volume_debouncer.stats)
+
+    # Every request is acknowledged, even the ones that are dropped
+    for volume in (10, 20, 30, 40, 50):
+        status, body = client.post("/api/v1/music/player/audioVolume", {"volume": volume})
+        assert status == 200 and body["status"] == "ok"
+
+    settle(client, player)
+    assert debounced.values("volume", "volume") == [10, 50]
+    assert player.get_volume() == 50
+
+    _, body = client.get("/api/v1/stats")
+    stats = body["debounce"]["volume"]
+    assert stats["received"] - before["received"] == 5
+    assert stats["applied"] - before["applied"] == 2
+    assert stats["dropped"] - before["dropped"] == 3
+
+
+def test_seek_requests_are_debounced(client, debounced):
+    player = debounced.player
+    client.run(player, player.player_queue, "aaaaaaaaaa1")
+    client.run(player, player.queue_set_current, player._queue.queue[0].unique_id)
+    before = dict(player.seek_debouncer.stats)
+
+    for time_ in (10, 20, 30, 40):
+        status, _ = client.request("PATCH", "/api/v1/music/player/audioTime", {"time": time_})
+        assert status == 200
+
+    settle(client, player)
+    assert debounced.values("seek", "time") == [10, 40]
+    assert player.player.get_time() == pytest.approx(40000, abs=500)
+
+    _, body = client.get("/api/v1/stats")
+    assert body["debounce"]["seek"]["dropped"] - before["dropped"] == 2
@@ -0,0 +1,160 @@
+# coding=utf-8
+import json
+import shutil
+
+import pytest
+
+from soundcube.core import player as player_module, journal as journal_module
+from soundcube.core.journal import QueueJournal, QueueState, JOURNAL_NAME, SNAPSHOT_NAME, encode_song
+from soundcube.core.queue import PlayerQueue
+from soundcube.core.youtube import YoutubeAudio
+
+import fakes
+
+
+def song(number: int) -> YoutubeAudio:
+    return YoutubeAudio(*fakes.fake_video(f"aaaaaa{number:05d}"))
+
+
+class Journaled:
+    """
+    A PlayerQueue (and volume) persisted through a QueueJournal, like Player does it.
+    """
+    def __init__(self, location: str, snapshot_interval: int = 1000):
+        self.queue = PlayerQueue()
+        self.volume = 50
+        self.journal = QueueJournal(location, snapshot_interval, fsync=False)
+        self.journal.state_source = lambda: QueueState([encode_song(audio) for audio in self.queue.queue],
+                                                       self.queue.current_index, self.volume, None)
+        self.queue.on_operation = self.journal.record_queue_operation
+
+    def set_volume(self, volume: int):
+        self.volume = volume
+        self.journal.write({"op": "volume", "volume": volume})
+
+
+def ids(state: QueueState) -> list:
+    return [song["unique_id"] for song in state.songs]
+
+
+def edit(journaled: Journaled, first: int, last: int):
+    for number in range(first, last):
+        journaled.queue.append_to_queue(song(number))
+    journaled.queue.move_in_queue(0, len(journaled.queue.queue) - 1)
+    journaled.queue.current_index = 1
+
+
+def test_snapshot_plus_replay(loop, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(journal_module, "_fsync_directory", synced.append)
+
+    journaled = Journaled(str(tmp_path))
+    edit(journaled, 0, 5)
+    journaled.journal.snapshot()
+    # The rename of the snapshot is made durable
+    assert synced == [str(tmp_path)]
+    edit(journaled, 5, 8)
+    journaled.set_volume(30)
+    journaled.journal.close()
+
+    state = QueueJournal(str(tmp_path)).load()
+    assert ids(state) == [audio.unique_id for audio in journaled.queue.queue]
+    assert (state.current_index, state.volume) == (1, 30)
+
+
+def test_crash_between_snapshot_and_truncation(loop, tmp_path):
+    journaled = Journaled(str(tmp_path))
+    edit(journaled, 0, 5)
+    journal_path = str(tmp_path / JOURNAL_NAME)
+    shutil.copy(journal_path, journal_path + ".old")
+
+    # The snapshot was replaced, the journal wasn't truncated yet
+    journaled.journal.snapshot()
+    shutil.copy(journal_path + ".old", journal_path)
+    expected = [audio.unique_id for audio in journaled.queue.queue]
+
+    state = QueueJournal(str(tmp_path)).load()
+    assert ids(state) == expected
+    assert state.current_index == 1
+
+    # New lines continue after the snapshot's sequence numbers
+    recovered = Journaled(str(tmp_path))
+    recovered.journal.load()
+    recovered.set_volume(10)
+    state = QueueJournal(str(tmp_path)).load()
+    assert ids(state) == expected and state.volume == 10
+
+
+def test_torn_last_line(loop, tmp_path):
+    journaled = Journaled(str(tmp_path))
+    edit(journaled, 0, 3)
+    journaled.journal.close()
+    edit(journaled, 3, 4)
+    journaled.journal.close()
+    expected = [audio.unique_id for audio in journaled.queue.queue]
+
+    journal_path = str(tmp_path / JOURNAL_NAME)
+    with open(journal_path, "a", encoding="utf-8") as file:
+        file.write('{"op":"add","position":0,"song":{"uni')
+
+    state = QueueJournal(str(tmp_path)).load()
+    assert ids(state) == expected
+
+    # Cut off, so lines written after it are replayed on the next start
+    with open(journal_path, encoding="utf-8") as file:
+        assert all(json.loads(line) for line in file)
+
+    journal = QueueJournal(str(tmp_path), fsync=False)
+    journal.load()
+    journal.write({"op": "volume", "volume": 70})
+    assert QueueJournal(str(tmp_path)).load().volume == 70
+
+
+def test_lines_without_sequence_numbers_are_replayed(loop, tmp_path):
+    # Journals written before sequence numbers existed
+    with open(tmp_path / JOURNAL_NAME, "w", encoding="utf-8") as file:
+        file.write(json.dumps({"op": "volume", "volume": 20}) + "\n")
+    with open(tmp_path / SNAPSHOT_NAME, "w", encoding="utf-8") as file:
+        json.dump({"format": 1, "songs": [], "current_index": None, "volume": 90, "position": None}, file)
+
+    assert QueueJournal(str(tmp_path)).load().volume == 20
+
+
+@pytest.fixture
+def persistent(monkeypatch, loop, fake_vlc, tmp_path):
+    """
+    Creates Players that persist their state into the same location.
+    """
+    from soundcube.core.player import Player
+
+    monkeypatch.setattr(player_module, "PERSISTENCE_ENABLED", True)
+    players = []
+
+    def create():
+        player = Player("test", fakes.FakeInstance(), state_location=str(tmp_path / "state"), loop=loop)
+        players.append(player)
+        return player
+
+    yield create
+
+    for player in players:
+        player.resolver.shutdown()
+
+
+def test_player_restores_queue_position_and_volume(persistent, loop):
+    player = persistent()
+    for number in range(3):
+        player.queue_insert(song(number), number)
+    unique_ids = [audio.unique_id for audio in player._queue.queue]
+
+    loop.run_until_complete(player.commands.run(player.queue_set_current, unique_ids[1]))
+    player.set_volume(35)
+    # Saved by the final snapshot
+    player.player.set_time(42500)
+    player.journal.close()
+
+    restored = persistent()
+    assert [audio.unique_id for audio in restored._queue.queue] == unique_ids
+    assert restored._queue.current_index == 1
+    assert restored._current_volume == 35
+    assert restored._resume_position == [unique_ids[1], pytest.approx(42.5, abs=0.5)]
@@ -0,0 +1,152 @@
+# coding=utf-8
+import os
+
+import pytest
+
+from soundcube.core import library as library_module
+from soundcube.core.exceptions import LibraryException
+from soundcube.core.library import Library, LocalAudio
+
+# file: (title, artist, album, length)
+TAGS = {
+    "daft_punk/get_lucky.mp3": ("Get Lucky", "Daft Punk", "Random Access Memories", 369),
+    "daft_punk/contact.flac": ("Contact", "Daft Punk", "Random Access Memories", 381),
+    "kavinsky/nightcall.mp3": ("Nightcall", "Kavinsky", "OutRun", 258),
+    "untagged 100%.mp3": None,
+}
+
+
+@pytest.fixture
+def music(tmp_path, monkeypatch):
+    """
+    A music directory with TAGS (read by a stand-in for mutagen), counts how often tags are read.
+    """
+    directory = tmp_path / "music"
+    for name in list(TAGS) + ["cover.jpg"]:
+        path = directory / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"audio")
+
+    reads = []
+
+    def read_tags(path: str):
+        reads.append(os.path.relpath(path, str(directory)).replace(os.sep, "/"))
+        tags = TAGS.get(reads[-1])
+        if tags is None:
+            raise ValueError("unsupported format")
+        return tags
+
+    monkeypatch.setattr(library_module, "mutagen", object())
+    monkeypatch.setattr(library_module, "_read_tags_mutagen", read_tags)
+    return directory, reads
+
+
+@pytest.fixture
+def library(music, tmp_path):
+    library = Library([str(music[0])], str(tmp_path / "library.sqlite"), ["mp3", "flac"])
+    yield library
+    library.close()
+
+
+def scan(loop, library: Library) -> dict:
+    assert library.scan()
+    assert not library.scan()
+    loop.run_until_complete(library._scan)
+    return library.last_scan
+
+
+def titles(result) -> list:
+    return [track["title"] for track in result[1]]
+
+
+def test_scan_indexes_tags_and_file_names(loop, library, music):
+    stats = scan(loop, library)
+    assert (stats["added"], stats["unreadable"]) == (4, 1)
+    assert library.stats["tracks"] == 4
+
+    # Sorted by artist, album and title, every word has to match
+    assert titles(library.search("random memories")) == ["Contact", "Get Lucky"]
+    assert titles(library.search("PUNK lucky")) == ["Get Lucky"]
+    assert titles(library.search("outrun")) == ["Nightcall"]
+    assert titles(library.search("contact.flac")) == ["Contact"]
+    assert titles(library.search("jpg")) == []
+
+    # Untagged files are named after the file, LIKE wildcards are matched literally
+    total, tracks = library.search("100%")
+    assert total == 1 and tracks[0]["title"] == "untagged 100%" and tracks[0]["length"] == 0
+    assert titles(library.search("d_ft")) == []
+
+    total, page = library.search("", offset=1, limit=2)
+    assert total == 4 and len(page) == 2
+
+
+def test_rescan_only_reads_changed_files(loop, library, music):
+    directory, reads = music
+    scan(loop, library)
+    reads.clear()
+    nightcall = library.search("nightcall")[1][0]
+
+    (directory / "kavinsky" / "nightcall.mp3").write_bytes(b"longer audio")
+    (directory / "daft_punk" / "contact.flac").unlink()
+    (directory / "kavinsky" / "odd_look.mp3").write_bytes(b"audio")
+
+    stats = scan(loop, library)
+    assert {key: stats[key] for key in ("added", "updated", "unchanged", "removed")} == \
+        {"added": 1, "updated": 1, "unchanged": 2, "removed": 1}
+    assert sorted(reads) == ["kavinsky/nightcall.mp3", "kavinsky/odd_look.mp3"]
+    assert titles(library.search("daft")) == ["Get Lucky"]
+    assert titles(library.search("odd_look")) == ["odd_look"]
+    # Updated in place, the id stays the same
+    assert library.search("nightcall")[1][0]["id"] == nightcall["id"]
+
+
+def test_get_audio(loop, library, music):
+    scan(loop, library)
+    track = library.search("nightcall")[1][0]
+
+    audio = library.get_audio(track["id"])
+    assert isinstance(audio, LocalAudio) and audio.is_local
+    assert (audio.title, audio.username, audio.length) == ("Nightcall", "Kavinsky", 258)
+    assert audio.path == str(music[0] / "kavinsky" / "nightcall.mp3")
+    assert not audio.stream_expires_within(10 ** 9)
+
+    with pytest.raises(LibraryException):
+        library.get_audio(12345)
+
+    (music[0] / "kavinsky" / "nightcall.mp3").unlink()
+    with pytest.raises(LibraryException):
+        library.get_audio(track["id"])
+
+
+@pytest.fixture
+def with_library(client, library):
+    """
+    The default zone of the app with the test library (it is disabled in the tests' settings).
+    """
+    player = client.server.zones.default
+    player.library = library
+    scan(client.loop, library)
+    yield player
+    player.library = None
+
+
+def test_library_routes(client, with_library):
+    status, body = client.get("/api/v1/music/library/search?q=daft&per_page=1&page=1")
+    assert status == 200
+    assert (body["total"], [track["title"] for track in body["tracks"]]) == (2, ["Get Lucky"])
+    track_id = body["tracks"][0]["id"]
+
+    status, body = client.post("/api/v1/music/library/queue", {"track_id": track_id})
+    assert status == 200
+    assert [song["title"] for song in body["new_queue"]] == ["Get Lucky"]
+
+    status, body = client.post("/api/v1/music/library/queue", {"track_id": 12345})
+    assert status == 441 and body["status"] == "error"
+
+    status, _ = client.get("/api/v1/music/library/search?q=daft&per_page=0")
+    assert status == 400
+
+
+def test_library_routes_when_disabled(client):
+    status, body = client.get("/api/v1/music/library/search?q=daft")
+    assert status == 441 and "disabled" in body["message"]
@@ -0,0 +1,53 @@
+# coding=utf-8
+#################
+# Memory used per queue entry, measured with tracemalloc
+#################
+import gc
+import tracemalloc
+
+from soundcube.core.youtube import YoutubeAudio, VideoInfo
+
+import fakes
+
+ENTRIES = 10000
+# A YoutubeAudio (with its unique_id), measured at about 145 bytes on CPython 3.7
+ENTRY_BUDGET = 256
+
+
+def traced_bytes(func) -> int:
+    """
+    :return: how many bytes allocated by func are still alive once it returns (its result is kept)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = func()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    del result
+    return after - before
+
+
+def test_entries_share_their_metadata(loop):
+    info, stream_url, stream_expires = fakes.fake_video("aaaaaaaaaaa")
+
+    per_entry = traced_bytes(lambda: [YoutubeAudio(info, stream_url, stream_expires)
+                                      for _ in range(ENTRIES)]) / ENTRIES
+    print(f"\n{per_entry:.0f} bytes per entry")
+    assert per_entry < ENTRY_BUDGET
+
+
+def test_metadata_record_is_compact(loop):
+    def make_infos():
+        return [fakes.fake_video(f"a{number:010d}")[0] for number in range(ENTRIES)]
+
+    # Including the strings of every video, which make up most of it
+    per_info = traced_bytes(make_infos) / ENTRIES
+    print(f"\n{per_info:.0f} bytes per VideoInfo")
+    assert per_info < 4 * ENTRY_BUDGET
+    # No per-instance dict
+    assert not hasattr(VideoInfo.placeholder("aaaaaaaaaaa"), "__dict__")
+    assert not hasattr(YoutubeAudio(*fakes.fake_video("aaaaaaaaaaa")), "__dict__")
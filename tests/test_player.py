@@ -0,0 +1,91 @@
+# coding=utf-8
+import pytest
+
+VIDEOS = ["aaaaaaaaaa1", "aaaaaaaaaa2", "aaaaaaaaaa3"]
+
+
+@pytest.fixture
+def queued(player, loop):
+    """
+    The player with VIDEOS queued (and resolved), nothing loaded yet.
+    """
+    for videoid in VIDEOS:
+        audio = loop.run_until_complete(player.resolver.resolve(videoid))
+        player.queue_insert(audio, len(player._queue.queue))
+
+    return player
+
+
+def run(loop, player, func, *args):
+    return loop.run_until_complete(player.commands.run(func, *args))
+
+
+def playing(player) -> str:
+    """
+    :return: video id of the loaded song ('' if nothing is loaded)
+    """
+    media = player.player.get_media()
+    return media.mrl.split("/")[-1].split("?")[0] if media is not None else ""
+
+
+def ids(player) -> list:
+    return [audio.unique_id for audio in player._queue.queue]
+
+
+def test_removing_the_playing_song_plays_the_next_one(queued, loop):
+    player = queued
+    run(loop, player, player.queue_set_current, ids(player)[1])
+
+    run(loop, player, player.queue_remove_by_id, ids(player)[1])
+
+    assert [audio.videoid for audio in player._queue.queue] == ["aaaaaaaaaa1", "aaaaaaaaaa3"]
+    assert player._queue.current_index == 1
+    assert playing(player) == "aaaaaaaaaa3"
+    assert player.player_is_playing()
+
+
+def test_removing_the_last_playing_song_plays_the_previous_one(queued, loop):
+    player = queued
+    run(loop, player, player.queue_set_current, ids(player)[2])
+
+    run(loop, player, player.queue_remove, 2)
+
+    assert player._queue.current_index == 1
+    assert playing(player) == "aaaaaaaaaa2"
+    assert player.player_is_playing()
+
+
+def test_removing_the_paused_song_only_loads_the_next_one(queued, loop):
+    player = queued
+    run(loop, player, player.queue_set_current, ids(player)[0], False)
+
+    run(loop, player, player.queue_remove_by_id, ids(player)[0])
+
+    assert player._queue.current_index == 0
+    assert playing(player) == "aaaaaaaaaa2"
+    assert not player.player_is_playing()
+
+
+def test_removing_another_song_keeps_playing(queued, loop):
+    player = queued
+    run(loop, player, player.queue_set_current, ids(player)[2])
+
+    run(loop, player, player.queue_remove_by_id, ids(player)[0])
+
+    # Same song, one position earlier
+    assert player._queue.current_index == 1
+    assert player._queue.current_audio.videoid == "aaaaaaaaaa3"
+    assert playing(player) == "aaaaaaaaaa3"
+    assert player.player_is_playing()
+
+
+def test_removing_the_only_song_stops(player, loop):
+    audio = loop.run_until_complete(player.resolver.resolve("aaaaaaaaaa1"))
+    player.queue_insert(audio, 0)
+    run(loop, player, player.queue_set_current, audio.unique_id)
+
+    run(loop, player, player.queue_remove_by_id, audio.unique_id)
+
+    assert len(player._queue.queue) == 0
+    assert player._queue.current_index is None
+    assert playing(player) == ""
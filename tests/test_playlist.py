@@ -0,0 +1,263 @@
+# coding=utf-8
+#################
+# Playlist imports against a local stand-in for the YouTube Data API
+#################
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from soundcube.core import youtube_api
+from soundcube.core.youtube import AudioState
+
+PLAYLIST_ID = "PLaaaaaaaaaaaaaaaa"
+
+
+def video_id(number: int, prefix: str = "v") -> str:
+    return f"{prefix}{number:010d}"
+
+
+class FakeYoutubeApi(ThreadingHTTPServer):
+    """
+    Serves playlistItems and videos like the YouTube Data API, records every request.
+    """
+    daemon_threads = True
+
+    def __init__(self, videos: int, unavailable: tuple = (), prefix: str = "v"):
+        super().__init__(("127.0.0.1", 0), FakeYoutubeApiHandler)
+        self.videos = [video_id(number, prefix) for number in range(videos)]
+        self.unavailable = set(video_id(number, prefix) for number in unavailable)
+
+        # (endpoint, query)
+        self.requests = []
+        # videos requests fail with this status code (None: they don't)
+        self.videos_status = None
+        # videos requests wait for this to be set
+        self.videos_gate = threading.Event()
+        self.videos_gate.set()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/youtube/v3"
+
+    def count(self, endpoint: str) -> int:
+        return sum(1 for name, _ in self.requests if name == endpoint)
+
+
+class FakeYoutubeApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.rsplit("/", 1)[-1]
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append((endpoint, query))
+
+        if endpoint == "playlistItems":
+            self.respond(200, self.playlist_page(query))
+        elif endpoint == "videos":
+            self.server.videos_gate.wait(10)
+            if self.server.videos_status is not None:
+                self.respond(self.server.videos_status, {"error": {"message": "backend error"}})
+            else:
+                self.respond(200, self.videos(query["id"].split(",")))
+        else:
+            self.respond(404, {"error": {"message": "not found"}})
+
+    def playlist_page(self, query: dict) -> dict:
+        videos = self.server.videos
+        start = int(query.get("pageToken", 0))
+        end = start + int(query["maxResults"])
+
+        page = {
+            "items": [{"contentDetails": {"videoId": videoid}} for videoid in videos[start:end]],
+            "pageInfo": {"totalResults": len(videos)}
+        }
+        if end < len(videos):
+            page["nextPageToken"] = str(end)
+
+        return page
+
+    def videos(self, video_ids: list) -> dict:
+        return {"items": [{
+            "id": videoid,
+            "snippet": {"title": f"Video {videoid}", "channelTitle": "Channel",
+                        "publishedAt": "2019-01-01T12:00:00.000Z",
+                        "thumbnails": {"high": {"url": f"http://127.0.0.1/{videoid}.jpg"}}},
+            "contentDetails": {"duration": "PT4M13S"},
+            "statistics": {"viewCount": "42"}
+        } for videoid in video_ids if videoid not in self.server.unavailable]}
+
+    def respond(self, status: int, data: dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def youtube_api_server(monkeypatch):
+    servers = []
+
+    def start(videos: int, unavailable: tuple = (), prefix: str = "v") -> FakeYoutubeApi:
+        server = FakeYoutubeApi(videos, unavailable, prefix)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        monkeypatch.setattr(youtube_api, "YOUTUBE_API_URL", server.url)
+
+        servers.append(server)
+        return server
+
+    yield start
+
+    for server in servers:
+        server.videos_gate.set()
+        server.shutdown()
+        server.server_close()
+
+
+def settle(loop, player):
+    """
+    Waits for background resolutions and the commands they queue.
+    """
+    for _ in range(100):
+        loop.run_until_complete(player.commands.run(lambda: None))
+        if all(audio.state != AudioState.RESOLVING for audio in player._queue.queue):
+            return
+        loop.run_until_complete(asyncio.sleep(0.01))
+
+    raise AssertionError("placeholders were not resolved")
+
+
+def test_import_fetches_metadata_in_batches(player, loop, youtube_api_server):
+    api = youtube_api_server(120, unavailable=(7, 64))
+    steps = []
+
+    loop.run_until_complete(player.queue_playlist(PLAYLIST_ID, progress=steps.append))
+    settle(loop, player)
+
+    queue = list(player._queue.queue)
+    assert [audio.videoid for audio in queue] == [video_id(number) for number in range(120) if number not in (7, 64)]
+    assert all(audio.is_ready for audio in queue)
+    # The first song was resolved on its own (with a stream url), the rest only have the API's metadata
+    assert queue[0].title == f"Song {video_id(0)}"
+    assert queue[1].title == f"Video {video_id(1)}" and queue[1].length == 253
+    assert player._queue.current_index == 0
+
+    # One request per page for the items and one for their metadata
+    assert api.count("playlistItems") == 3
+    assert api.count("videos") == 3
+    assert all(len(query["id"].split(",")) <= youtube_api.MAX_RESULTS for name, query in api.requests
+               if name == "videos")
+
+    assert steps[-1] == {"stage": "resolved", "resolved": 118, "failed": 2, "total": 120}
+
+
+def test_import_at_a_position(player, loop, youtube_api_server):
+    youtube_api_server(60)
+    for videoid in ("aaaaaaaaaa1", "aaaaaaaaaa2"):
+        loop.run_until_complete(player.commands.run(player.player_queue, videoid))
+
+    loop.run_until_complete(player.queue_playlist(PLAYLIST_ID, position=1))
+    settle(loop, player)
+
+    videoids = [audio.videoid for audio in player._queue.queue]
+    assert videoids == ["aaaaaaaaaa1"] + [video_id(number) for number in range(60)] + ["aaaaaaaaaa2"]
+
+
+def test_failed_batch_falls_back_to_single_resolutions(player, loop, youtube_api_server):
+    api = youtube_api_server(10)
+    api.videos_status = 500
+
+    loop.run_until_complete(player.queue_playlist(PLAYLIST_ID))
+    settle(loop, player)
+
+    assert len(player._queue.queue) == 10
+    assert all(audio.title == f"Song {audio.videoid}" for audio in player._queue.queue)
+
+
+def test_playing_a_placeholder_during_the_import(player, loop, youtube_api_server):
+    api = youtube_api_server(10)
+    # Keeps the batch from filling the placeholders
+    api.videos_gate.clear()
+
+    async def play_while_importing():
+        importing = asyncio.ensure_future(player.queue_playlist(PLAYLIST_ID))
+        while len(player._queue.queue) < 10:
+            await asyncio.sleep(0.01)
+
+        placeholder = player._queue.get_song_at(5)
+        assert placeholder.state == AudioState.RESOLVING
+
+        # The command waits for its own resolution, not for the batch (or commands queued behind it)
+        audio = await asyncio.wait_for(player.commands.run(player.queue_set_current, placeholder.unique_id), 5)
+        assert audio is placeholder and audio.stream_url is not None
+
+        api.videos_gate.set()
+        await asyncio.wait_for(importing, 5)
+
+    loop.run_until_complete(play_while_importing())
+    settle(loop, player)
+
+    assert player._queue.current_index == 5
+    assert player._queue.current_audio.title == f"Song {video_id(5)}"
+    assert all(audio.is_ready for audio in player._queue.queue)
+
+
+
+def queue_songs(client, *videoids):
+    player = client.server.zones.default
+    for videoid in videoids:
+        client.run(player, player.player_queue, videoid)
+
+
+def import_steps(body: str) -> list:
+    return [json.loads(line) for line in body.splitlines()]
+
+
+@pytest.mark.parametrize("position", [-1, 3, 100])
+def test_import_route_rejects_positions_outside_of_the_queue(client, youtube_api_server, position):
+    api = youtube_api_server(10)
+    queue_songs(client, "aaaaaaaaaa1", "aaaaaaaaaa2")
+
+    status, body = client.post("/api/v1/music/queue/importPlaylist", {"playlist": PLAYLIST_ID, "position": position})
+    assert status == 400 and body["status"] == "bad_request"
+    assert api.requests == []
+
+
+def test_import_route_streams_progress(client, youtube_api_server):
+    youtube_api_server(60)
+    queue_songs(client, "aaaaaaaaaa1")
+
+    # The end of the queue is a valid position
+    status, body = client.post("/api/v1/music/queue/importPlaylist", {"playlist": PLAYLIST_ID, "position": 1})
+    assert status == 200
+
+    steps = import_steps(body)
+    assert [step["stage"] for step in steps] == ["queued", "resolved", "queued", "resolved", "done"]
+    assert steps[-1]["status"] == "ok"
+    assert len(client.server.zones.default._queue.queue) == 61
+
+
+def test_import_route_reports_a_cancelled_import(client, youtube_api_server):
+    # Videos that aren't in the app's metadata cache yet (it is shared by all tests)
+    api = youtube_api_server(10, prefix="c")
+    # The import waits for the batch request until it is cancelled
+    api.videos_gate.clear()
+
+    def cancel_import():
+        for task in asyncio.all_tasks(client.loop):
+            if "queue_playlist" in repr(task):
+                task.cancel()
+        api.videos_gate.set()
+
+    client.loop.call_later(0.3, cancel_import)
+    status, body = client.post("/api/v1/music/queue/importPlaylist", {"playlist": PLAYLIST_ID})
+
+    assert status == 200
+    assert import_steps(body)[-1] == {"stage": "error", "message": "the import was cancelled", "status": "error"}
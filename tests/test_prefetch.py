@@ -0,0 +1,47 @@
+# coding=utf-8
+import asyncio
+
+from soundcube.core.youtube import YoutubeAudio
+
+VIDEOS = ["aaaaaaaaaa1", "aaaaaaaaaa2", "aaaaaaaaaa3"]
+
+
+def test_queue_changes_dont_abort_a_stream_refresh(player, loop, monkeypatch):
+    songs = [loop.run_until_complete(player.resolver.resolve(videoid)) for videoid in VIDEOS]
+    for position, audio in enumerate(songs):
+        player.queue_insert(audio, position)
+
+    # Every stream url is about to expire, refreshes wait for the gate
+    monkeypatch.setattr(YoutubeAudio, "stream_expires_within", lambda audio, seconds: True)
+    gate = asyncio.Event()
+    started, refreshed = [], []
+
+    async def refresh_stream(audio: YoutubeAudio):
+        started.append(audio)
+        await gate.wait()
+        refreshed.append(audio)
+
+    monkeypatch.setattr(player.resolver, "refresh_stream", refresh_stream)
+    prefetcher = player.prefetcher
+    prefetcher.ahead = 1
+
+    async def change_queue_while_refreshing():
+        player._queue.current_index = 0
+        prefetcher.update()
+        while not started:
+            await asyncio.sleep(0.01)
+
+        # The third song is next now
+        player._queue.move_in_queue(2, 1)
+        prefetcher.update()
+        await asyncio.sleep(0.05)
+        assert not prefetcher._task.done()
+
+        gate.set()
+        await asyncio.wait_for(prefetcher._task, 5)
+
+    loop.run_until_complete(change_queue_while_refreshing())
+
+    # The refresh that was in progress completed, then the new next song was prepared
+    assert refreshed == [songs[1], songs[2]]
+    assert list(prefetcher._media) == [songs[2].unique_id]
@@ -0,0 +1,88 @@
+# coding=utf-8
+import time
+import random
+
+import pytest
+
+from soundcube.core.queue import PlayerQueue
+from soundcube.core.youtube import YoutubeAudio
+
+import fakes
+
+
+def song(number: int) -> YoutubeAudio:
+    return YoutubeAudio(*fakes.fake_video(f"aaaaaa{number:05d}"))
+
+
+def test_operations_since_tag():
+    queue = PlayerQueue()
+    queue.append_to_queue(song(1))
+    tag = queue.tag
+
+    queue.append_to_queue(song(2))
+    queue.current_index = 0
+
+    operations = queue.operations_since(tag)
+    assert [operation["op"] for operation in operations] == ["add", "current"]
+    assert operations[-1]["version"] == queue.tag
+    assert queue.operations_since(queue.tag) == []
+
+
+def test_versions_of_another_epoch_get_the_whole_queue():
+    # Same amount of changes, as after a restart
+    before, after = PlayerQueue(), PlayerQueue()
+    for queue in (before, after):
+        queue.append_to_queue(song(1))
+        queue.append_to_queue(song(2))
+
+    assert before.version == after.version
+    assert before.tag != after.tag
+    assert after.operations_since(before.tag) is None
+    # Plain numbers (versions without an epoch) as well
+    assert after.operations_since(str(after.version - 1)) is None
+
+
+def test_restore_starts_a_new_epoch():
+    queue = PlayerQueue()
+    tag = queue.tag
+
+    queue.restore([song(1), song(2)], 1)
+    assert queue.epoch != tag.split(".")[0]
+    assert queue.operations_since(tag) is None
+
+
+@pytest.mark.parametrize("tag", ["", "abc.", "abc.x"])
+def test_malformed_tags(tag):
+    with pytest.raises(ValueError):
+        PlayerQueue().operations_since(tag)
+
+
+def edit_time(size: int, edits: int = 2000) -> float:
+    """
+    :return: average time (in seconds) of a random insert, move, lookup by id and removal in a queue of `size` songs
+    """
+    info, stream_url, stream_expires = fakes.fake_video("aaaaaaaaaaa")
+    queue = PlayerQueue()
+    queue.restore([YoutubeAudio(info, stream_url, stream_expires) for _ in range(size)], 0)
+    rnd = random.Random(size)
+
+    start = time.perf_counter()
+    for _ in range(edits):
+        queue.insert_into_queue(YoutubeAudio(info, stream_url, stream_expires), rnd.randrange(len(queue.queue) + 1))
+        queue.move_in_queue(rnd.randrange(len(queue.queue)), rnd.randrange(len(queue.queue)))
+
+        audio = queue.get_song_at(rnd.randrange(len(queue.queue)))
+        queue.position_of(audio.unique_id)
+        queue.remove_audio(audio)
+
+    assert len(queue.queue) == size
+    return (time.perf_counter() - start) / edits
+
+
+def test_edits_scale_logarithmically(loop):
+    small, large = edit_time(1000), edit_time(100000)
+
+    print(f"\n{small * 1000:.3f} ms per edit with 1k songs, {large * 1000:.3f} ms with 100k")
+    # O(log n): 1.5-3x here (cache misses included), linear edits would be 100x
+    assert large < 10 * small
+    assert large < 0.005
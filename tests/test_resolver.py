@@ -0,0 +1,90 @@
+# coding=utf-8
+import time
+import asyncio
+
+import pytest
+
+from soundcube.core import resolver
+from soundcube.core.exceptions import YoutubeException, NoAudioStream, PlayerException
+from soundcube.core.youtube import YoutubeAudio, AudioState
+
+import fakes
+
+
+def unavailable(_):
+    # What youtube-dl raises for removed videos is not a SoundcubeException
+    raise RuntimeError("This video is unavailable")
+
+
+def no_audio(url):
+    raise NoAudioStream(f"no audio streams in {url}")
+
+
+@pytest.mark.parametrize("failure", [unavailable, no_audio])
+def test_resolution_errors_become_youtube_exceptions(player, loop, monkeypatch, failure):
+    monkeypatch.setattr(resolver, "_resolve_video", failure)
+
+    with pytest.raises(YoutubeException):
+        loop.run_until_complete(player.resolver.resolve("aaaaaaaaaa1"))
+
+
+def test_playing_an_unresolvable_placeholder_raises_player_exception(player, loop, monkeypatch):
+    monkeypatch.setattr(resolver, "_resolve_video", unavailable)
+
+    audio = YoutubeAudio.placeholder("aaaaaaaaaa1")
+    player._queue.append_to_queue(audio)
+    player._queue.set_current_song(0)
+
+    with pytest.raises(PlayerException):
+        loop.run_until_complete(player.commands.run(player.player_play))
+    # Removed by a follow-up command
+    loop.run_until_complete(player.commands.run(lambda: None))
+    assert len(player._queue.queue) == 0
+
+
+def test_cancelled_resolutions_stay_cancelled(player, loop, monkeypatch):
+    def slow(url):
+        time.sleep(0.5)
+        raise RuntimeError(f"{url} should have been cancelled")
+
+    monkeypatch.setattr(resolver, "_resolve_video", slow)
+
+    async def resolve_and_cancel():
+        task = asyncio.ensure_future(player.resolver.resolve("aaaaaaaaaa1"))
+        await asyncio.sleep(0.05)
+        flight = player.resolver._in_flight["aaaaaaaaaa1"].task
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The resolution itself is cancelled as well, not turned into a YoutubeException
+        # (CancelledError is an Exception before Python 3.8)
+        await asyncio.wait([flight])
+        assert flight.cancelled()
+
+    loop.run_until_complete(resolve_and_cancel())
+
+
+def test_cancelled_placeholder_can_be_resolved_again(player, loop, monkeypatch):
+    def slow(url):
+        time.sleep(0.2)
+        return fakes.fake_video(url)
+
+    monkeypatch.setattr(resolver, "_resolve_video", slow)
+    audio = YoutubeAudio.placeholder("aaaaaaaaaa1")
+
+    async def cancel_then_resolve():
+        task = asyncio.ensure_future(player.resolver.resolve_into(audio, "aaaaaaaaaa1"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        # Not failed, e.g. an import was cancelled while resolving its songs
+        assert audio.state == AudioState.RESOLVING
+
+        await asyncio.wait_for(player.resolver.resolve_into(audio, "aaaaaaaaaa1"), 5)
+        await audio.wait_resolved()
+
+    loop.run_until_complete(cancel_then_resolve())
+    assert audio.is_ready and audio.title == "Song aaaaaaaaaa1"
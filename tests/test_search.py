@@ -0,0 +1,156 @@
+# coding=utf-8
+import time
+import random
+
+import pytest
+
+from soundcube.core.queue import PlayerQueue
+from soundcube.core.search import SearchIndex, tokenize
+from soundcube.core.youtube import YoutubeAudio, VideoInfo
+
+WORDS = ["love", "lonely", "night", "nightcall", "summer", "river", "rain", "fire", "gold", "golden", "blue",
+         "heart", "dance", "dream", "wild", "stars", "ocean", "city", "light", "shadow"]
+
+
+def song(videoid: str, title: str, username: str = "Channel") -> YoutubeAudio:
+    return YoutubeAudio(VideoInfo(videoid, title, 200, None, username, "2019-01-01 00:00:00", 1), None, 0)
+
+
+def titles(results) -> list:
+    return [audio.title for audio, _ in results[1]]
+
+
+def test_tokenize():
+    assert tokenize("Daft Punk - Get Lucky (Official Audio)") == {"daft", "punk", "get", "lucky", "official", "audio"}
+    assert tokenize(None) == set()
+
+
+def test_every_word_is_a_prefix():
+    index = SearchIndex()
+    for number, title in enumerate(["Golden Hour", "Gold Rush", "Silver Night", "Nightcall"]):
+        index.add(song(f"aaaaaaaaaa{number}", title, "Kavinsky" if title == "Nightcall" else "Channel"))
+
+    # Most recently queued first
+    assert titles(index.search("gol")) == ["Gold Rush", "Golden Hour"]
+    assert titles(index.search("night")) == ["Nightcall", "Silver Night"]
+    assert titles(index.search("NIGHT kav")) == ["Nightcall"]
+    assert titles(index.search("gold night")) == []
+    assert index.search("") == (0, [])
+
+
+def test_pagination():
+    index = SearchIndex()
+    for number in range(25):
+        index.add(song(f"a{number:010d}", f"Song {number}"))
+
+    total, page = index.search("song", offset=10, limit=10)
+    assert total == 25
+    assert [audio.title for audio, _ in page] == [f"Song {number}" for number in range(14, 4, -1)]
+    assert titles(index.search("song", offset=20, limit=10)) == [f"Song {number}" for number in range(4, -1, -1)]
+    assert index.search("song", offset=30, limit=10) == (25, [])
+
+
+def test_played_songs_stay_as_history():
+    index = SearchIndex(history_size=2)
+    first, second, third, skipped = (song(f"aaaaaaaaaa{number}", f"River {number}") for number in range(4))
+    for audio in (first, second, third, skipped):
+        index.add(audio)
+        if audio is not skipped:
+            index.played(audio)
+        index.remove(audio)
+
+    # Never played songs are dropped, the history keeps the latest ones
+    assert titles(index.search("river")) == ["River 2", "River 1"]
+    assert index.search("river", in_queue=True) == (0, [])
+    assert all(not in_queue for _, in_queue in index.search("river")[1])
+
+    # Only the latest play of every video
+    again = song("aaaaaaaaaa2", "River 2")
+    index.add(again)
+    index.played(again)
+    index.remove(again)
+    assert [audio for audio, _ in index.search("river 2")[1]] == [again]
+
+
+def test_update_reindexes():
+    index = SearchIndex()
+    audio = YoutubeAudio.placeholder("aaaaaaaaaa1")
+    index.add(audio)
+    assert index.search("rain") == (0, [])
+
+    audio.fill(VideoInfo("aaaaaaaaaa1", "Purple Rain", 200, None, "Prince", "", 1), None, 0)
+    index.update(audio)
+    assert titles(index.search("prince rain")) == ["Purple Rain"]
+    assert index.stats["words"] == 3
+
+
+def test_requeued_unique_ids_replace_their_entry():
+    # A sync follower replaces its queue with the leader's songs, keeping their unique_ids
+    queue = PlayerQueue()
+    songs = [song(f"aaaaaaaaaa{number}", f"Song {number}") for number in range(3)]
+    for audio in songs:
+        queue.append_to_queue(audio)
+    queue.current_index = 1
+
+    queue.current_index = None
+    for position in reversed(range(3)):
+        queue.remove_from_queue(position)
+    for audio in songs:
+        queue.append_to_queue(audio)
+
+    assert queue.search.stats == {"songs": 3, "history": 0, "words": 5}
+    assert [in_queue for _, in_queue in queue.search.search("song")[1]] == [True, True, True]
+
+    version = queue.version
+    queue.remove_from_queue(1)
+    queue.remove_from_queue(0)
+    assert [audio.title for audio in queue.queue] == ["Song 2"]
+    assert queue.version == version + 2
+    assert titles(queue.search.search("song")) == ["Song 2"]
+
+
+def test_search_latency_with_100k_songs():
+    rnd = random.Random(100000)
+    index = SearchIndex()
+    for number in range(100000):
+        index.add(song(f"a{number:010d}", " ".join(rnd.sample(WORDS, 3)) + f" {number}", rnd.choice(WORDS)))
+
+    queries = ["lo", "night", "gold heart", "dream city light", "sh", "ocean 99"]
+    start = time.perf_counter()
+    for query in queries:
+        total, page = index.search(query, offset=0, limit=50)
+        assert total and len(page) == min(total, 50)
+    latency = (time.perf_counter() - start) / len(queries)
+
+    print(f"\n{latency * 1000:.1f} ms per search with 100k songs")
+    assert latency < 0.05
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("q=gold", ["Gold Rush", "Golden Hour"]),
+    ("q=gold&scope=queue", ["Gold Rush"]),
+    ("q=gold&scope=history", ["Golden Hour"]),
+    ("q=gold&per_page=1&page=1", ["Golden Hour"]),
+])
+def test_search_route(client, query, expected):
+    player = client.server.zones.default
+    golden, rush = song("aaaaaaaaaa1", "Golden Hour"), song("aaaaaaaaaa2", "Gold Rush")
+    for audio in (golden, rush):
+        player.queue_insert(audio, len(player._queue.queue))
+    # Played and removed: history
+    player._queue.current_index = 0
+    client.run(player, player.queue_discard, golden)
+
+    status, body = client.get(f"/api/v1/music/queue/search?{query}")
+    assert status == 200
+    assert body["total"] == (1 if "scope" in query else 2)
+    assert [result["song"]["title"] for result in body["results"]] == expected
+    for result in body["results"]:
+        assert result["position"] == (0 if result["in_queue"] else None)
+
+
+@pytest.mark.parametrize("query", ["q=a&page=-1", "q=a&per_page=0", "q=a&per_page=1000", "q=a&page=x",
+                                   "q=a&scope=everything"])
+def test_search_route_rejects_invalid_parameters(client, query):
+    status, body = client.get(f"/api/v1/music/queue/search?{query}")
+    assert status == 400 and body["status"] == "bad_request"
@@ -0,0 +1,57 @@
+# coding=utf-8
+#################
+# Micro-benchmark of queue serialization: joining the fragments cached on the songs (encode_queue)
+# against building and serializing a dict per song on every request
+#################
+import timeit
+
+import pytest
+
+from soundcube.core.youtube import YoutubeAudio
+from soundcube.api.web_utilities import encode_queue, dictify_YoutubeAudio, dumps, loads
+
+import fakes
+
+
+def make_queue(size: int) -> list:
+    return [YoutubeAudio(*fakes.fake_video(f"a{number:010d}")) for number in range(size)]
+
+
+def per_request(queue: list) -> str:
+    return dumps([dictify_YoutubeAudio(audio) for audio in queue])
+
+
+def best_of(func, queue: list, runs: int) -> float:
+    """
+    :return: best time of one call, in seconds
+    """
+    return min(timeit.repeat(lambda: func(queue), number=runs, repeat=3)) / runs
+
+
+@pytest.mark.parametrize("size", [10, 1000, 100000])
+def test_cached_fragments_are_faster(loop, size):
+    queue = make_queue(size)
+    assert loads(encode_queue(queue)) == loads(per_request(queue))
+
+    # About the same amount of songs serialized for every size
+    runs = max(1, 100000 // size)
+    cached = best_of(encode_queue, queue, runs)
+    uncached = best_of(per_request, queue, runs)
+
+    print(f"\n{size} songs: {cached * 1000:.3f} ms cached, {uncached * 1000:.3f} ms per request "
+          f"({uncached / cached:.1f}x)")
+    # Usually 5-15x, leave room for noisy machines
+    assert cached * 2 < uncached
+
+
+def test_fragments_follow_resolution(loop):
+    audio = YoutubeAudio.placeholder("aaaaaaaaaaa")
+    placeholder = encode_queue([audio])
+    # Not cached while the song is still being resolved
+    assert audio.encoded is None
+
+    audio.fill(*fakes.fake_video("aaaaaaaaaaa"))
+    resolved = encode_queue([audio])
+    assert resolved != placeholder
+    assert audio.encoded is not None
+    assert loads(resolved)[0]["title"] == "Song aaaaaaaaaaa"
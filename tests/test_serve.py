@@ -0,0 +1,133 @@
+# coding=utf-8
+import os
+import gzip
+
+import pytest
+
+from soundcube.api import bp_serve
+from soundcube.api.bp_serve import accepted_encodings, JS_FOLDER, CACHE_IMMUTABLE, CACHE_REVALIDATE
+
+SCRIPT = ("function soundcube() { return 'Soundcube'; }\n" * 200).encode("utf-8")
+
+
+class Fetcher:
+    """
+    Requests with headers, keeping the raw body.
+    """
+    def __init__(self, client):
+        self.loop = client.loop
+        self._client = client.server.app.test_client()
+
+    def get(self, path: str, **headers):
+        """
+        :return: tuple of the response and its raw body
+        """
+        async def send():
+            response = await self._client.open(path, headers=headers)
+            return response, await response.get_data(raw=True)
+
+        return self.loop.run_until_complete(send())
+
+
+@pytest.fixture
+def fetch(client):
+    return Fetcher(client).get
+
+
+@pytest.fixture
+def script():
+    """
+    Writes a file into the frontend's static/js folder.
+    """
+    written = []
+
+    def write(name: str, data: bytes = SCRIPT) -> str:
+        os.makedirs(JS_FOLDER, exist_ok=True)
+        path = os.path.join(JS_FOLDER, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        written.append(path)
+        return f"/static/js/{name}"
+
+    yield write
+
+    for path in written:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", {"gzip", "deflate", "br"}),
+    ("br;q=0, GZIP;q=0.5", {"gzip"}),
+    ("gzip;q=x", set()),
+])
+def test_accepted_encodings(header, expected):
+    assert accepted_encodings(header) == expected
+
+
+def test_index_is_revalidated_with_its_etag(fetch):
+    response, body = fetch("/")
+    assert response.status_code == 200 and response.mimetype == "text/html"
+    assert b"<title>Soundcube</title>" in body
+    assert response.headers["Cache-Control"] == CACHE_REVALIDATE
+
+    response, body = fetch("/", **{"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304 and body == b""
+
+
+def test_hashed_files_are_compressed_and_immutable(fetch, script):
+    path = script("main.1a2b3c4d.chunk.js")
+
+    response, body = fetch(path, **{"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Cache-Control"] == CACHE_IMMUTABLE
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == SCRIPT and len(body) < len(SCRIPT)
+    gzip_etag = response.headers["ETag"]
+
+    # Every variant has its own ETag
+    response, body = fetch(path, **{"Accept-Encoding": "gzip;q=0"})
+    assert "Content-Encoding" not in response.headers and body == SCRIPT
+    assert response.headers["ETag"] != gzip_etag
+
+    response, body = fetch(path, **{"Accept-Encoding": "gzip", "If-None-Match": gzip_etag})
+    assert response.status_code == 304 and body == b""
+    response, _ = fetch(path, **{"If-None-Match": gzip_etag})
+    assert response.status_code == 200
+
+
+def test_brotli_is_preferred(fetch, script):
+    if bp_serve.brotli is None:
+        pytest.skip("'brotli' is not installed")
+    path = script("vendor.5e6f7a8b.chunk.js")
+
+    response, body = fetch(path, **{"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert bp_serve.brotli.decompress(body) == SCRIPT
+
+
+def test_unhashed_files_are_reloaded_when_they_change(fetch, script):
+    path = script("settings.js")
+    response, body = fetch(path)
+    assert response.headers["Cache-Control"] == CACHE_REVALIDATE and body == SCRIPT
+    etag = response.headers["ETag"]
+
+    full_path = os.path.join(JS_FOLDER, "settings.js")
+    script("settings.js", b"var changed = true;")
+    os.utime(full_path, (0, os.stat(full_path).st_mtime + 10))
+
+    response, body = fetch(path, **{"If-None-Match": etag})
+    assert response.status_code == 200 and body == b"var changed = true;"
+
+    os.remove(full_path)
+    response, _ = fetch(path)
+    assert response.status_code == 404
+
+
+def test_incompressible_files_are_sent_as_they_are(fetch, script):
+    path = script("logo.png", b"\x89PNG" + bytes(range(256)) * 8)
+
+    response, body = fetch(path, **{"Accept-Encoding": "gzip, br"})
+    assert response.status_code == 200 and response.mimetype == "image/png"
+    assert "Content-Encoding" not in response.headers and body.startswith(b"\x89PNG")
@@ -0,0 +1,140 @@
+# coding=utf-8
+import asyncio
+
+import pytest
+
+from soundcube.core.streaming import StreamBuffer, StreamOutput, ListenerBehind
+
+
+def stream(start: int, end: int) -> bytes:
+    """
+    :return: bytes start..end of a stream in which every byte differs from its neighbours
+    """
+    return bytes(offset % 251 for offset in range(start, end))
+
+
+def test_writes_wrap_around():
+    buffer = StreamBuffer(capacity=100)
+    for start in range(0, 250, 30):
+        buffer.write(stream(start, start + 30))
+
+    assert (buffer.start, buffer.end) == (170, 270)
+    # Across the end of the underlying bytearray
+    assert buffer.read(180, 50) == (stream(180, 230), 230)
+    assert buffer.read(250) == (stream(250, 270), 270)
+    assert buffer.read(270) == (b"", 270)
+
+
+def test_overflowing_chunk_keeps_its_end():
+    buffer = StreamBuffer(capacity=100)
+    buffer.write(stream(0, 40))
+    buffer.write(stream(40, 290))
+
+    assert (buffer.start, buffer.end) == (190, 290)
+    assert buffer.read(190, 1000) == (stream(190, 290), 290)
+
+
+def test_overwritten_data_cant_be_read():
+    buffer = StreamBuffer(capacity=100)
+    buffer.write(stream(0, 150))
+
+    with pytest.raises(ListenerBehind):
+        buffer.read(49)
+    assert buffer.read(50, 10) == (stream(50, 60), 60)
+
+
+def test_waiting_listeners_wake_up_on_write(loop):
+    buffer = StreamBuffer(capacity=100)
+
+    async def wait_for_data():
+        waiters = [asyncio.ensure_future(buffer.wait(0)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert not any(waiter.done() for waiter in waiters)
+
+        buffer.write(b"abc")
+        await asyncio.wait_for(asyncio.gather(*waiters), 1)
+
+    loop.run_until_complete(wait_for_data())
+
+
+@pytest.fixture
+def output(tmp_path):
+    """
+    Creates a StreamOutput with a small buffer, without VLC or a reader thread (the test writes the audio).
+    """
+    def create(slow_listeners: str) -> StreamOutput:
+        output = StreamOutput(str(tmp_path / "stream.fifo"), burst_size=20, slow_listeners=slow_listeners)
+        output.buffer = StreamBuffer(capacity=100)
+        return output
+
+    return create
+
+
+def test_new_listeners_start_with_a_burst(output, loop):
+    stream_output = output("skip")
+    stream_output.buffer.write(stream(0, 70))
+
+    async def first_chunk():
+        listener = stream_output.listen()
+        data = await listener.__anext__()
+        assert stream_output.listeners == 1
+        await listener.aclose()
+        return data
+
+    assert loop.run_until_complete(first_chunk()) == stream(50, 70)
+    assert stream_output.listeners == 0
+
+
+async def next_chunk(listener, write) -> bytes:
+    """
+    Starts waiting for the listener's next chunk, then writes.
+    """
+    reading = asyncio.ensure_future(listener.__anext__())
+    await asyncio.sleep(0.01)
+    write()
+    return await asyncio.wait_for(reading, 1)
+
+
+def test_slow_listener_skips_to_the_live_position(output, loop):
+    stream_output = output("skip")
+    buffer = stream_output.buffer
+
+    async def fall_behind():
+        listener = stream_output.listen()
+        assert await next_chunk(listener, lambda: buffer.write(stream(0, 30))) == stream(0, 30)
+
+        # More than the whole buffer is written before the listener reads again
+        buffer.write(stream(30, 100))
+        buffer.write(stream(100, 180))
+        reading = asyncio.ensure_future(listener.__anext__())
+        await asyncio.sleep(0.01)
+        # Waits at the live position instead of getting a gap in the middle of its data
+        assert not reading.done()
+
+        buffer.write(stream(180, 200))
+        assert await asyncio.wait_for(reading, 1) == stream(180, 200)
+        await listener.aclose()
+
+    loop.run_until_complete(fall_behind())
+    assert stream_output.stats == {"listeners": 0, "bytes": 200, "skipped": 1, "dropped": 0}
+
+
+def test_slow_listener_is_dropped(output, loop):
+    stream_output = output("drop")
+    buffer = stream_output.buffer
+
+    async def fall_behind():
+        listener = stream_output.listen()
+        await next_chunk(listener, lambda: buffer.write(stream(0, 30)))
+
+        buffer.write(stream(30, 180))
+        with pytest.raises(StopAsyncIteration):
+            await listener.__anext__()
+
+        # New listeners still start with a burst
+        other = stream_output.listen()
+        assert await other.__anext__() == stream(160, 180)
+        await other.aclose()
+
+    loop.run_until_complete(fall_behind())
+    assert stream_output.stats == {"listeners": 0, "bytes": 180, "skipped": 0, "dropped": 1}
@@ -0,0 +1,121 @@
+# coding=utf-8
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+from urllib.error import URLError, HTTPError
+from urllib.request import urlopen, Request
+
+import pytest
+
+from support import write_settings, free_port
+
+HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sync_harness.py")
+REPOSITORY = os.path.dirname(os.path.dirname(HARNESS))
+
+# The follower's fake sound card runs 3 % fast, only rate corrections keep it in sync
+FOLLOWER_SKEW = 1.03
+
+
+class Server:
+    def __init__(self, directory: str, skew: float = 1, **settings):
+        self.port = free_port()
+        path = write_settings(directory, Server={"host": "127.0.0.1", "port": str(self.port)}, **settings)
+
+        self.log = open(os.path.join(directory, "server.log"), "wb")
+        self.process = subprocess.Popen([sys.executable, HARNESS, path, "--skew", str(skew)], cwd=directory,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+
+    def call(self, route: str, body: dict = None) -> dict:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = Request(f"http://127.0.0.1:{self.port}/api/v1{route}", data,
+                          {"Content-Type": "application/json"})
+
+        with urlopen(request, timeout=5) as response:
+            return json.loads(response.read().decode("utf-8"))
+
+    def queue(self) -> list:
+        return [song["unique_id"] for song in self.call("/music/queue/get")["queue"]]
+
+    def current(self):
+        try:
+            return self.call("/music/player/getCurrentSong")["current_song"]["unique_id"]
+        except HTTPError:
+            # Nothing loaded
+            return None
+
+    def sync_stats(self) -> dict:
+        return self.call("/stats")["sync"]
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+def wait_for(condition, timeout: float = 10, message: str = "condition"):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return
+        except (URLError, OSError, KeyError):
+            pass
+        time.sleep(0.1)
+
+    pytest.fail(f"timed out waiting for {message}")
+
+
+@pytest.fixture
+def servers(tmp_path):
+    sync_port = free_port(socket.SOCK_DGRAM)
+    sync = {"interval": "0.2", "port": str(sync_port)}
+
+    leader = Server(str(tmp_path / "leader"), Sync={**sync, "mode": "leader"})
+    follower = Server(str(tmp_path / "follower"), FOLLOWER_SKEW,
+                      Sync={**sync, "mode": "follower", "leader": f"127.0.0.1:{sync_port}"})
+
+    try:
+        for server in (leader, follower):
+            wait_for(lambda: server.call("/ping"), 20, "the servers to start")
+        yield leader, follower
+    finally:
+        leader.stop()
+        follower.stop()
+
+
+def test_follower_mirrors_queue_and_playback(servers):
+    leader, follower = servers
+
+    for position, videoid in enumerate(("aaaaaaaaaa1", "aaaaaaaaaa2", "aaaaaaaaaa3", "aaaaaaaaaa4")):
+        leader.call("/music/queue/add", {"song": videoid, "position": position})
+    wait_for(lambda: leader.current() is not None, message="the first song to be loaded")
+    leader.call("/music/player/play", {})
+
+    wait_for(lambda: follower.queue() == leader.queue(), message="the queue to be mirrored")
+    wait_for(lambda: follower.current() == leader.current(), message="the follower to play the same song")
+
+    # Let the drift of the fast sound card build up and get corrected
+    time.sleep(4)
+    stats = follower.sync_stats()
+    assert stats["drift_ms"] is not None
+    assert abs(stats["drift_ms"]) < 100
+    assert stats["nudges"] > 0
+    assert stats["round_trip_ms"] < 50
+
+    # Edits and song changes on the leader are followed
+    queue = leader.queue()
+    leader.call("/music/queue/moveById", {"unique_id": queue[3], "new_index": 1})
+    leader.call("/music/player/next", {})
+
+    wait_for(lambda: follower.queue() == leader.queue(), message="the move to be mirrored")
+    wait_for(lambda: follower.current() == leader.current() == queue[3], message="the follower to switch songs")
+    assert follower.sync_stats()["full_resyncs"] == 1
+
+    time.sleep(2)
+    assert abs(follower.sync_stats()["drift_ms"]) < 100
@@ -0,0 +1,111 @@
+# coding=utf-8
+import random
+
+import pytest
+
+from soundcube.core.treelist import TreeList, Node, _size
+
+
+def check_tree(tree: TreeList):
+    """
+    Subtree sizes, parent pointers and the heap order of priorities.
+    """
+    pending = [(tree._root, None)]
+    while pending:
+        node, parent = pending.pop()
+        if node is None:
+            continue
+
+        assert node.parent is parent
+        assert node.size == 1 + _size(node.left) + _size(node.right)
+        for child in (node.left, node.right):
+            if child is not None:
+                assert child.priority <= node.priority
+                pending.append((child, node))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_operations_match_a_list(seed):
+    rnd = random.Random(seed)
+    tree, expected = TreeList(), []
+    # item: Node, for the node-based operations
+    nodes = {}
+    counter = 0
+
+    def new_item():
+        nonlocal counter
+        counter += 1
+        return counter
+
+    for step in range(3000):
+        operation = rnd.random()
+
+        if operation < 0.3 or not expected:
+            # Out of range and negative indexes are clamped like list.insert
+            index = rnd.randint(-len(expected) - 2, len(expected) + 2)
+            item = new_item()
+            nodes[item] = tree.insert(index, item)
+            expected.insert(index, item)
+        elif operation < 0.35:
+            item = new_item()
+            nodes[item] = tree.append(item)
+            expected.append(item)
+        elif operation < 0.4:
+            items = [new_item() for _ in range(rnd.randint(0, 20))]
+            nodes.update(zip(items, tree.extend(items)))
+            expected.extend(items)
+        elif operation < 0.55:
+            index = rnd.randrange(-len(expected), len(expected))
+            del nodes[expected[index]]
+            del tree[index]
+            del expected[index]
+        elif operation < 0.7:
+            item = rnd.choice(expected)
+            tree.remove_node(nodes.pop(item))
+            expected.remove(item)
+        elif operation < 0.85:
+            item = rnd.choice(expected)
+            new_index = rnd.randrange(len(expected))
+            tree.move_node(nodes[item], new_index)
+            expected.remove(item)
+            expected.insert(new_index, item)
+        else:
+            item = rnd.choice(expected)
+            assert tree.index_of_node(nodes[item]) == expected.index(item)
+            index = rnd.randrange(-len(expected), len(expected))
+            assert tree[index] == expected[index]
+            assert tree.node_at(index) is nodes[expected[index]]
+
+        assert len(tree) == len(expected)
+        assert bool(tree) == bool(expected)
+        if step % 100 == 0:
+            assert list(tree) == expected
+            check_tree(tree)
+
+    assert list(tree) == expected
+    assert tree[1:10:2] == expected[1:10:2]
+    check_tree(tree)
+
+
+def test_index_errors():
+    tree = TreeList(range(3))
+
+    for index in (3, -4):
+        with pytest.raises(IndexError):
+            tree[index]
+        with pytest.raises(IndexError):
+            del tree[index]
+
+    with pytest.raises(IndexError):
+        TreeList()[0]
+
+
+def test_removed_nodes_are_detached():
+    tree = TreeList(range(10))
+    node = tree.node_at(4)
+    tree.remove_node(node)
+
+    assert isinstance(node, Node)
+    assert (node.left, node.right, node.parent, node.size) == (None, None, None, 1)
+    assert list(tree) == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+    check_tree(tree)
@@ -0,0 +1,77 @@
+# coding=utf-8
+import pytest
+
+API = "/api/v1"
+
+
+@pytest.mark.parametrize("prefix, zone", [
+    (API, "default"),
+    (f"{API}/zones/default", "default"),
+    (f"{API}/zones/kitchen", "kitchen")
+])
+def test_routes_use_the_zone_of_their_prefix(client, prefix, zone):
+    status, body = client.get(f"{prefix}/stats")
+    assert status == 200
+    assert body["zone"] == zone
+
+    status, body = client.post(f"{prefix}/music/queue/add", {"song": "aaaaaaaaaa1", "position": 0})
+    assert status == 200
+    assert [song["video_id"] for song in body["new_queue"]] == ["aaaaaaaaaa1"]
+
+    # Only that zone's queue changed
+    for player in client.server.zones:
+        assert len(player._queue.queue) == (1 if player.name == zone else 0)
+
+    _, body = client.get(f"{API}/zones")
+    assert {entry["name"]: entry["queue_length"] for entry in body["zones"]} == \
+        {"default": int(zone == "default"), "kitchen": int(zone == "kitchen")}
+
+
+def test_zones_keep_their_own_playback(client):
+    for prefix in (API, f"{API}/zones/kitchen"):
+        client.post(f"{prefix}/music/queue/add", {"song": "aaaaaaaaaa1", "position": 0})
+    client.post(f"{API}/zones/kitchen/music/queue/add", {"song": "aaaaaaaaaa2", "position": 1})
+
+    status, _ = client.post(f"{API}/zones/kitchen/music/player/next")
+    assert status == 200
+
+    zones = client.server.zones
+    assert zones.get("kitchen")._queue.current_audio.videoid == "aaaaaaaaaa2"
+    assert zones.default._queue.current_audio.videoid == "aaaaaaaaaa1"
+    assert not zones.default.player_is_playing()
+
+
+@pytest.mark.parametrize("method, route", [
+    ("GET", "/stats"),
+    ("GET", "/music/queue/get"),
+    ("POST", "/music/queue/add"),
+    ("POST", "/music/player/play")
+])
+def test_unknown_zones_are_not_found(client, method, route):
+    data = {"song": "aaaaaaaaaa1", "position": 0} if method == "POST" else None
+
+    status, body = client.request(method, f"{API}/zones/attic{route}", data)
+    assert status == 404
+    assert body["status"] == "error" and "attic" in body["message"]
+
+    assert all(len(player._queue.queue) == 0 for player in client.server.zones)
+
+
+class OnlyDefault:
+    """
+    A registry in front of the app's one that only lists the default zone.
+    """
+    def __init__(self, zones):
+        self.default = zones.default
+        self.get = zones.get
+
+    def __iter__(self):
+        return iter([self.default])
+
+
+def test_zone_list_comes_from_the_app(client, monkeypatch):
+    monkeypatch.setattr(client.server, "zones", OnlyDefault(client.server.zones))
+
+    status, body = client.get(f"{API}/zones")
+    assert status == 200
+    assert [entry["name"] for entry in body["zones"]] == ["default"]